@@ -1,46 +1,41 @@
 import { type NextRequest, NextResponse } from "next/server"
+import { fetchAnalyzer } from "@/lib/network-analyzer"
+
+interface FlowRecord {
+  sourceIPv4Address?: string
+  sourceIPv6Address?: string
+  sourceTransportPort: number
+  destinationTransportPort: number
+  protocolIdentifier: number
+  packetDeltaCount: number
+  octetDeltaCount: number
+  reversePacketDeltaCount: number
+  reverseOctetDeltaCount: number
+  threatPacketCount: number
+}
+
+const TRAFFIC_FILTERS: Record<string, (flow: FlowRecord) => boolean> = {
+  http: (flow) => flow.protocolIdentifier === 6 && [80, 443, 8080].includes(flow.destinationTransportPort),
+  dns: (flow) => flow.destinationTransportPort === 53 || flow.sourceTransportPort === 53,
+  tcp: (flow) => flow.protocolIdentifier === 6,
+  all: () => true,
+}
 
 export async function POST(request: NextRequest) {
   try {
     const { action, interface: networkInterface, duration, traffic_type } = await request.json()
 
     if (action === "capture") {
-      // Mock packet capture
-      const mockPackets = Array.from({ length: 50 }, (_, i) => ({
-        id: `packet_${i + 1}`,
-        timestamp: new Date(Date.now() - i * 1000).toISOString(),
-        source: `192.168.1.${Math.floor(Math.random() * 255)}`,
-        destination: `${Math.floor(Math.random() * 255)}.${Math.floor(Math.random() * 255)}.${Math.floor(Math.random() * 255)}.${Math.floor(Math.random() * 255)}`,
-        protocol: ["HTTP", "HTTPS", "DNS", "TCP", "UDP", "FTP"][Math.floor(Math.random() * 6)],
-        size: Math.floor(Math.random() * 4096) + 64,
-        threats:
-          Math.random() > 0.8
-            ? [
-                {
-                  type: "suspicious_activity",
-                  description: "Unusual traffic pattern detected",
-                  severity: ["Low", "Medium", "High"][Math.floor(Math.random() * 3)],
-                },
-              ]
-            : [],
-        threat_level: Math.random() > 0.8 ? ["Low", "Medium", "High"][Math.floor(Math.random() * 3)] : "None",
-        source_port: Math.floor(Math.random() * 65535),
-        dest_port: Math.floor(Math.random() * 65535),
-      }))
-
-      const statistics = {
-        total_packets: mockPackets.length,
-        total_bytes: mockPackets.reduce((sum, p) => sum + p.size, 0),
-        threats_detected: mockPackets.filter((p) => p.threats.length > 0).length,
-        active_connections: Math.floor(Math.random() * 50) + 10,
-        bandwidth_bps: Math.floor(Math.random() * 1000000) + 100000,
-        monitoring: true,
-      }
+      // The analyzer captures continuously; return what it has seen most recently
+      const [{ packets }, { data: statistics }] = await Promise.all([
+        fetchAnalyzer("/packets?count=50"),
+        fetchAnalyzer("/stats"),
+      ])
 
       return NextResponse.json({
         success: true,
         result: {
-          packets: mockPackets,
+          packets: packets.reverse(),
           capture_info: {
             interface: networkInterface,
             duration: duration,
@@ -50,17 +45,28 @@ export async function POST(request: NextRequest) {
         },
       })
     } else if (action === "analyze") {
-      // Mock traffic analysis
+      const [{ flows }, { data: statistics }] = await Promise.all([
+        fetchAnalyzer("/flows?count=1000"),
+        fetchAnalyzer("/stats"),
+      ])
+      const matching = (flows as FlowRecord[]).filter(TRAFFIC_FILTERS[traffic_type] || TRAFFIC_FILTERS.all)
+
+      const talkers = new Map<string, { ip: string; bytes: number; packets: number }>()
+      for (const flow of matching) {
+        const ip = flow.sourceIPv4Address || flow.sourceIPv6Address || "unknown"
+        const talker = talkers.get(ip) || { ip, bytes: 0, packets: 0 }
+        talker.bytes += flow.octetDeltaCount + flow.reverseOctetDeltaCount
+        talker.packets += flow.packetDeltaCount + flow.reversePacketDeltaCount
+        talkers.set(ip, talker)
+      }
+
       const analysis = {
         traffic_type: traffic_type,
         analysis_results: {
-          total_flows: Math.floor(Math.random() * 1000) + 100,
-          suspicious_flows: Math.floor(Math.random() * 50),
-          protocols_detected: ["HTTP", "HTTPS", "DNS", "TCP", "UDP"],
-          top_talkers: [
-            { ip: "192.168.1.100", bytes: 1024000, packets: 500 },
-            { ip: "192.168.1.101", bytes: 512000, packets: 250 },
-          ],
+          total_flows: statistics.flows?.created ?? matching.length,
+          suspicious_flows: matching.filter((flow) => flow.threatPacketCount > 0).length,
+          protocols_detected: Object.keys(statistics.top_protocols || {}),
+          top_talkers: [...talkers.values()].sort((a, b) => b.bytes - a.bytes).slice(0, 10),
         },
       }
 
@@ -72,6 +78,6 @@ export async function POST(request: NextRequest) {
 
     return NextResponse.json({ success: false, error: "Invalid action" }, { status: 400 })
   } catch (error) {
-    return NextResponse.json({ success: false, error: "Capture failed" }, { status: 500 })
+    return NextResponse.json({ success: false, error: "Network analyzer is not reachable" }, { status: 503 })
   }
 }
@@ -0,0 +1,11 @@
+// Live statistics server of scripts/network_analyzer.py
+// (started by `monitor`, or by `capture --listen`)
+const ANALYZER_URL = process.env.NETWORK_ANALYZER_URL || "http://127.0.0.1:8765"
+
+export async function fetchAnalyzer(path: string) {
+  const response = await fetch(`${ANALYZER_URL}${path}`, { cache: "no-store" })
+  if (!response.ok) {
+    throw new Error(`Network analyzer returned ${response.status}`)
+  }
+  return response.json()
+}
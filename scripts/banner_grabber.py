@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Banner Grabber - Concurrent service banner collection
+Bounded in-flight probes that close as soon as the banner is complete
+
+Each grab connects, sends the port's probe from the service database
+(nothing for server-first protocols) and reads until the banner is
+complete: a full line for line-based protocols, the end of the headers
+for HTTP, a fingerprint match for binary greetings, or ``max_bytes``.
+Only a silent service waits out the timeout. A semaphore bounds the
+number of grabs in flight, so grabs can be started the moment a port is
+found open without overwhelming the target or the descriptor table.
+"""
+
+import asyncio
+
+from service_db import default_database
+
+DEFAULT_TIMEOUT = 3.0
+DEFAULT_IN_FLIGHT = 100
+MAX_BANNER_BYTES = 1024
+
+
+def banner_complete(data):
+    """Whether enough of the banner has arrived to stop reading"""
+    if data.startswith(b'HTTP/'):
+        return b'\r\n\r\n' in data
+    return b'\n' in data
+
+
+class BannerGrabber:
+    """Service banner reads with a bound on grabs in flight"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_in_flight=DEFAULT_IN_FLIGHT, max_bytes=MAX_BANNER_BYTES,
+                 database=None):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.database = database or default_database()
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.counters = {
+            'grabbed': 0,
+            'complete': 0,
+            'timeouts': 0,
+            'failed': 0
+        }
+
+    async def grab(self, host, port):
+        """Banner bytes of ``host:port``; empty if silent, None if the connection failed"""
+        async with self.slots:
+            return await self._grab(host, port)
+
+    async def _grab(self, host, port):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            self.counters['failed'] += 1
+            return None
+
+        data = b''
+        try:
+            probe = self.database.probe_for(port)
+            if probe:
+                writer.write(probe)
+            while len(data) < self.max_bytes:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    break
+                try:
+                    chunk = await asyncio.wait_for(reader.read(self.max_bytes - len(data)), remaining)
+                except asyncio.TimeoutError:
+                    self.counters['timeouts'] += 1
+                    break
+                if not chunk:
+                    break
+                data += chunk
+                if banner_complete(data) or \
+                        self.database.identify(data.decode('utf-8', errors='ignore'), port) is not None:
+                    self.counters['complete'] += 1
+                    break
+        except OSError:
+            pass
+        finally:
+            writer.close()
+        self.counters['grabbed'] += 1
+        return data
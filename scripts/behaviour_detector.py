@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Behaviour Detector - Port-scan, host-scan and flood detection
+Sliding-window traffic behaviour tracked with bounded-memory sketches
+
+Scans are detected per source: a windowed count-min sketch of connection
+attempts (TCP SYNs and UDP packets that open a flow) admits only sources
+that are actually busy into a bounded LRU table, where HyperLogLog
+sketches estimate the distinct destination ports and hosts contacted over
+the current and previous window. Floods are detected per destination
+from SYN, ICMP and UDP rates kept in another windowed count-min sketch.
+Memory is fixed by the sketch sizes and the tracked-source cap,
+independent of how many sources are on the wire.
+"""
+
+import math
+from array import array
+from collections import OrderedDict
+
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
+HLL_PRECISION = 7
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_ALPHA = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+HLL_POWERS = [2.0 ** -rank for rank in range(65)]
+
+TCP_SYN = 2
+TCP_ACK = 16
+
+# Flood sketch key tags
+FLOOD_SYN = 0
+FLOOD_ICMP = 1
+FLOOD_UDP = 2
+FLOOD_TYPES = {
+    FLOOD_SYN: ('syn_flood', 'SYN'),
+    FLOOD_ICMP: ('icmp_flood', 'ICMP'),
+    FLOOD_UDP: ('udp_flood', 'UDP')
+}
+
+DEFAULT_THRESHOLDS = {
+    'scan_window': 60,           # seconds
+    'port_scan_ports': 100,      # distinct destination ports per source
+    'host_scan_hosts': 50,       # distinct destination hosts per source
+    'flood_window': 1,           # seconds
+    'syn_flood_rate': 1000,      # SYNs per second per destination
+    'icmp_flood_rate': 500,      # ICMP packets per second per destination
+    'udp_flood_rate': 10000,     # UDP packets per second per destination
+    'admit_attempts': 8,         # attempts before a source is tracked
+    'max_sources': 65536
+}
+
+
+def mix64(value):
+    """SplitMix64 finalizer: spread an integer key over 64 bits"""
+    while value > MASK64:
+        # Fold wider keys (IPv6 addresses) so no bits are ignored
+        value = (value & MASK64) ^ (value >> 64)
+    value = (value + 0x9E3779B97F4A7C15) & MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+    return value ^ (value >> 31)
+
+
+class WindowedCountMin:
+    """Count-min sketch over a sliding window of two fixed intervals
+
+    The estimate weights the previous interval by how much of it still
+    overlaps the sliding window ending now.
+    """
+
+    def __init__(self, window, width=16384, depth=4):
+        self.window = window
+        self.width = width
+        self.depth = depth
+        self.epoch = None
+        self.current = array('I', [0]) * (width * depth)
+        self.previous = array('I', [0]) * (width * depth)
+
+    def _rotate(self, now):
+        epoch = int(now // self.window)
+        if epoch == self.epoch:
+            return
+        if self.epoch is not None and epoch == self.epoch + 1:
+            self.previous = self.current
+        else:
+            self.previous = array('I', [0]) * (self.width * self.depth)
+        self.current = array('I', [0]) * (self.width * self.depth)
+        self.epoch = epoch
+
+    def add(self, key, now):
+        """Count ``key`` once and return its sliding-window estimate"""
+        if self.epoch is None or now >= (self.epoch + 1) * self.window:
+            self._rotate(now)
+
+        hashed = mix64(key)
+        h1 = hashed & 0xFFFFFFFF
+        h2 = (hashed >> 32) | 1
+        width = self.width
+        current = self.current
+        previous = self.previous
+        current_min = previous_min = 0xFFFFFFFF
+
+        for row in range(self.depth):
+            index = row * width + (h1 + row * h2) % width
+            count = current[index] + 1
+            current[index] = count
+            if count < current_min:
+                current_min = count
+            if previous[index] < previous_min:
+                previous_min = previous[index]
+
+        overlap = 1.0 - (now - self.epoch * self.window) / self.window
+        overlap = min(max(overlap, 0.0), 1.0)
+        return current_min + previous_min * overlap
+
+
+class SourceActivity:
+    """Distinct destination ports and hosts for one tracked source"""
+
+    __slots__ = ('epoch', 'ports', 'hosts', 'previous_ports', 'previous_hosts',
+                 'port_estimate', 'host_estimate')
+
+    def __init__(self, epoch):
+        self.epoch = epoch
+        self.ports = bytearray(HLL_REGISTERS)
+        self.hosts = bytearray(HLL_REGISTERS)
+        self.previous_ports = None
+        self.previous_hosts = None
+        self.port_estimate = 0
+        self.host_estimate = 0
+
+    def rotate(self, epoch):
+        """Move to a new scan window, keeping one window of history"""
+        if epoch == self.epoch + 1:
+            self.previous_ports = self.ports
+            self.previous_hosts = self.hosts
+        else:
+            self.previous_ports = None
+            self.previous_hosts = None
+        self.ports = bytearray(HLL_REGISTERS)
+        self.hosts = bytearray(HLL_REGISTERS)
+        self.epoch = epoch
+
+
+def hll_add(registers, value):
+    """Add a value to HLL registers; returns True if a register grew"""
+    hashed = mix64(value)
+    index = hashed >> (64 - HLL_PRECISION)
+    remainder = hashed & ((1 << (64 - HLL_PRECISION)) - 1)
+    rank = (64 - HLL_PRECISION) - remainder.bit_length() + 1
+    if rank > registers[index]:
+        registers[index] = rank
+        return True
+    return False
+
+
+def hll_estimate(registers, previous=None):
+    """Cardinality estimate of the union of one or two register sets"""
+    if previous is not None:
+        registers = bytes(map(max, registers, previous))
+    estimate = HLL_ALPHA * HLL_REGISTERS * HLL_REGISTERS / sum(map(HLL_POWERS.__getitem__, registers))
+    if estimate <= 2.5 * HLL_REGISTERS:
+        zeros = registers.count(0)
+        if zeros:
+            estimate = HLL_REGISTERS * math.log(HLL_REGISTERS / zeros)
+    return estimate
+
+
+class BehaviourDetector:
+    """Sliding-window scan and flood detection for the packet stream"""
+
+    def __init__(self, thresholds=None):
+        self.thresholds = dict(DEFAULT_THRESHOLDS)
+        if thresholds:
+            self.thresholds.update(thresholds)
+        t = self.thresholds
+
+        self.scan_window = t['scan_window']
+        self.attempts = WindowedCountMin(t['scan_window'])
+        self.floods = WindowedCountMin(t['flood_window'])
+        self.flood_limits = {
+            FLOOD_SYN: t['syn_flood_rate'] * t['flood_window'],
+            FLOOD_ICMP: t['icmp_flood_rate'] * t['flood_window'],
+            FLOOD_UDP: t['udp_flood_rate'] * t['flood_window']
+        }
+        self.sources = OrderedDict()
+        self.alerted = OrderedDict()
+        self.alerts = 0
+
+    def observe(self, packet, starts_flow=True):
+        """Update behaviour state with one packet and return new threats
+
+        ``starts_flow`` tells whether a UDP packet opens a new flow. Only
+        those count as scan attempts, so a DNS or QUIC server answering
+        many clients is not taken for a scanner. Every UDP packet still
+        counts towards flood rates.
+        """
+        ip_proto = packet.ip_proto
+
+        if ip_proto == 6:
+            if not packet.tcp_flags & TCP_SYN or packet.tcp_flags & TCP_ACK:
+                return []  # Only connection attempts matter here
+            flood_type = FLOOD_SYN
+        elif ip_proto == 17:
+            flood_type = FLOOD_UDP
+        elif ip_proto in (1, 58):
+            flood_type = FLOOD_ICMP
+        else:
+            return []
+
+        now = packet.timestamp
+        threats = []
+
+        # Per-destination flood rates
+        rate = self.floods.add((packet.dst_addr << 2) | flood_type, now)
+        if rate >= self.flood_limits[flood_type]:
+            threat_type, label = FLOOD_TYPES[flood_type]
+            threat = self._alert(threat_type, packet.dst_addr, now, 'High',
+                                 f'{label} flood towards host: ~{rate / self.thresholds["flood_window"]:.0f} packets/s')
+            if threat:
+                threats.append(threat)
+
+        # Per-source distinct ports and hosts
+        if not starts_flow:
+            return threats
+        attempts = self.attempts.add(packet.src_addr, now)
+        if attempts < self.thresholds['admit_attempts']:
+            return threats
+
+        epoch = int(now // self.scan_window)
+        source = self.sources.get(packet.src_addr)
+        if source is None:
+            if len(self.sources) >= self.thresholds['max_sources']:
+                self.sources.popitem(last=False)
+            source = SourceActivity(epoch)
+            self.sources[packet.src_addr] = source
+        else:
+            self.sources.move_to_end(packet.src_addr)
+            if source.epoch != epoch:
+                source.rotate(epoch)
+
+        if packet.has_ports and hll_add(source.ports, packet.dst_port):
+            source.port_estimate = hll_estimate(source.ports, source.previous_ports)
+        if hll_add(source.hosts, packet.dst_addr):
+            source.host_estimate = hll_estimate(source.hosts, source.previous_hosts)
+
+        if source.port_estimate >= self.thresholds['port_scan_ports']:
+            threat = self._alert('port_scan', packet.src_addr, now, 'High',
+                                 f'Source probed ~{source.port_estimate:.0f} distinct ports '
+                                 f'in {self.scan_window}s')
+            if threat:
+                threats.append(threat)
+
+        if source.host_estimate >= self.thresholds['host_scan_hosts']:
+            threat = self._alert('host_scan', packet.src_addr, now, 'High',
+                                 f'Source probed ~{source.host_estimate:.0f} distinct hosts '
+                                 f'in {self.scan_window}s')
+            if threat:
+                threats.append(threat)
+
+        return threats
+
+    def _alert(self, threat_type, subject, now, severity, description):
+        """Raise a threat unless the same one fired within the scan window"""
+        key = (threat_type, subject)
+        until = self.alerted.get(key)
+        if until is not None and now < until:
+            return None
+
+        if len(self.alerted) >= self.thresholds['max_sources']:
+            self.alerted.popitem(last=False)
+        self.alerted[key] = now + self.scan_window
+        self.alerted.move_to_end(key)
+        self.alerts += 1
+
+        return {
+            'type': threat_type,
+            'description': description,
+            'severity': severity
+        }
+
+    def snapshot(self):
+        """Mergeable detector counters"""
+        return {
+            'tracked_sources': len(self.sources),
+            'alerts': self.alerts
+        }
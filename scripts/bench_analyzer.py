@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Analyzer Benchmark - Packet-processing throughput of PacketAnalyzer
+Synthetic traffic generator, per-stage timings and baseline regression checks
+
+Traffic is generated offline and deterministically from a seed: a fixed
+number of flows (TCP/UDP/ICMP over IPv4, TCP over IPv6) with a configurable
+protocol mix, payload size distribution and share of payloads that match a
+threat signature. TCP sequence numbers advance per direction, so stream
+reassembly sees the traffic a real capture would produce.
+
+Every stage is timed over the same frames with a fresh analyzer, best of
+``--repeat`` runs:
+
+    decode      decode_packet (link, IP and transport headers)
+    classify    detect_protocol
+    threats     analyze_threat (signatures, stream reassembly, behaviour)
+    stats       update_stats (counters, flow table, rate rings)
+    store       PacketStore.append
+    total       process_packet end to end
+
+Allocation figures come from a separate, smaller tracemalloc run (tracing
+slows everything down, so it never overlaps the timed runs); peak RSS is
+the process high-water mark. Results can be written as JSON and compared
+against a stored baseline, exiting non-zero when a stage regresses by more
+than the tolerance.
+"""
+
+import argparse
+import gc
+import json
+import random
+import resource
+import socket
+import struct
+import sys
+import time
+import tracemalloc
+
+from network_analyzer import PacketAnalyzer
+from packet_view import decode_packet
+from pcap_file import PcapngWriter
+
+DEFAULT_PACKETS = 50000
+DEFAULT_FLOWS = 2000
+DEFAULT_MIX = 'tcp=60,udp=30,icmp=5,ipv6=5'
+DEFAULT_PAYLOAD_SIZES = '0,0,64,200,512,1400'
+DEFAULT_THREAT_RATIO = 0.05
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.10
+ALLOCATION_PACKETS = 5000
+PACKET_INTERVAL = 0.00001
+
+STAGES = ('decode', 'classify', 'threats', 'stats', 'store', 'total')
+
+MAC_HEADER = b'\x00\x16\x3e\x00\x00\x01\x00\x16\x3e\x00\x00\x02'
+TCP_PORTS = (80, 443, 22, 21, 25, 8080, 3306)
+UDP_PORTS = (53, 123, 161, 5353, 9999)
+BACKDOOR_PORTS = (4444, 31337)
+TCP_PSH_ACK = 0x18
+TCP_ACK = 0x10
+
+
+def threat_payload(rng):
+    """A payload that one of the built-in signatures matches"""
+    kind = rng.randrange(3)
+    if kind == 0:
+        return b'FTP USER admin\r\n'
+    if kind == 1:
+        digest = '%032x' % rng.getrandbits(128)
+        return f'GET /{digest} HTTP/1.1\r\nHost: example.com\r\n\r\n'.encode()
+    return f'DNS response 10.{rng.randrange(256)}.{rng.randrange(256)}.1'.encode()
+
+
+def benign_payload(rng, size):
+    # Printable filler that never contains a signature anchor
+    return bytes(rng.choice(b'abcdeghijklmnoqrstvwxyz0123456789 ') for _ in range(size))
+
+
+def parse_mix(text):
+    """``'tcp=60,udp=30'`` -> {'tcp': 60.0, 'udp': 30.0}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ('tcp', 'udp', 'icmp', 'ipv6'):
+            raise ValueError(f"Unknown traffic type '{name}'")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def build_flows(rng, count, mix):
+    """Random endpoints for ``count`` flows, typed according to ``mix``"""
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    flows = []
+    for _ in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == 'ipv6':
+            src = socket.inet_pton(socket.AF_INET6, f'2001:db8::{rng.randrange(1, 0xffff):x}')
+            dst = socket.inet_pton(socket.AF_INET6, f'2001:db8:1::{rng.randrange(1, 0xffff):x}')
+        else:
+            src = struct.pack('!I', 0x0A000000 | rng.randrange(1, 1 << 16))
+            dst = struct.pack('!I', rng.choice((0xC0A80000, 0xAC100000, 0x08080000)) | rng.randrange(1, 1 << 16))
+        if kind == 'udp':
+            dport = rng.choice(UDP_PORTS)
+        elif rng.random() < 0.01:
+            dport = rng.choice(BACKDOOR_PORTS)
+        else:
+            dport = rng.choice(TCP_PORTS)
+        flows.append({
+            'kind': kind,
+            'src': src,
+            'dst': dst,
+            'sport': rng.randrange(1024, 65536),
+            'dport': dport,
+            'seq': [rng.getrandbits(32), rng.getrandbits(32)]
+        })
+    return flows
+
+
+def build_frame(flow, forward, payload, ident):
+    """Ethernet frame for one packet of ``flow``"""
+    src, dst = (flow['src'], flow['dst']) if forward else (flow['dst'], flow['src'])
+    sport, dport = (flow['sport'], flow['dport']) if forward else (flow['dport'], flow['sport'])
+    kind = flow['kind']
+
+    if kind == 'udp':
+        transport = struct.pack('!HHHH', sport, dport, 8 + len(payload), 0) + payload
+        proto = 17
+    elif kind == 'icmp':
+        transport = struct.pack('!BBHHH', 8 if forward else 0, 0, 0, ident & 0xFFFF, 1) + payload
+        proto = 1
+    else:
+        direction = 0 if forward else 1
+        seq = flow['seq'][direction]
+        flow['seq'][direction] = (seq + len(payload)) & 0xFFFFFFFF
+        flags = TCP_PSH_ACK if payload else TCP_ACK
+        transport = struct.pack('!HHIIBBHHH', sport, dport, seq, 0, 5 << 4, flags, 65535, 0, 0) + payload
+        proto = 6
+
+    if kind == 'ipv6':
+        ip = struct.pack('!IHBB16s16s', 6 << 28, len(transport), proto, 64, src, dst)
+        return MAC_HEADER + b'\x86\xdd' + ip + transport
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(transport), ident & 0xFFFF, 0, 64, proto, 0, src, dst)
+    return MAC_HEADER + b'\x08\x00' + ip + transport
+
+
+def generate_traffic(packets=DEFAULT_PACKETS, flows=DEFAULT_FLOWS, mix=DEFAULT_MIX,
+                     payload_sizes=DEFAULT_PAYLOAD_SIZES, threat_ratio=DEFAULT_THREAT_RATIO, seed=1):
+    """Deterministic synthetic traffic as a list of ``(frame, timestamp, wire_len)``"""
+    rng = random.Random(seed)
+    sizes = [int(size) for size in payload_sizes.split(',')]
+    flow_list = build_flows(rng, flows, parse_mix(mix))
+    # Distinct filler per size, so payloads are realistic without per-packet generation cost
+    fillers = {size: benign_payload(rng, size) for size in set(sizes)}
+
+    traffic = []
+    timestamp = 1700000000.0
+    for ident in range(packets):
+        flow = rng.choice(flow_list)
+        forward = rng.random() < 0.6
+        size = rng.choice(sizes)
+        if flow['kind'] == 'icmp':
+            payload = fillers[min(sizes, key=lambda s: abs(s - 56))]
+        elif size and rng.random() < threat_ratio:
+            payload = threat_payload(rng)
+        else:
+            payload = fillers[size]
+        frame = build_frame(flow, forward, payload, ident)
+        traffic.append((frame, timestamp, len(frame)))
+        timestamp += PACKET_INTERVAL
+    return traffic
+
+
+def new_analyzer(store_packets):
+    analyzer = PacketAnalyzer(store_packets=store_packets)
+    analyzer.signature_engine.match(b'')  # Everything compiled before timing starts
+    return analyzer
+
+
+def timed(function, items):
+    """Seconds taken to call ``function`` on every item"""
+    gc.collect()
+    start = time.perf_counter()
+    for item in items:
+        function(*item)
+    return time.perf_counter() - start
+
+
+def run_stages(traffic, store_packets):
+    """Time every stage once; returns seconds per stage"""
+    timings = {}
+
+    timings['decode'] = timed(decode_packet, [(f, ts, size, i) for i, (f, ts, size) in enumerate(traffic)])
+    views = [decode_packet(f, ts, size, i) for i, (f, ts, size) in enumerate(traffic)]
+    views = [view for view in views if view is not None]
+
+    analyzer = new_analyzer(store_packets)
+    timings['classify'] = timed(analyzer.detect_protocol, [(view,) for view in views])
+    for view in views:
+        view.protocol = analyzer.detect_protocol(view)
+
+    analyzer = new_analyzer(store_packets)
+    analyze_threat = analyzer.analyze_threat
+    start = time.perf_counter()
+    for view in views:
+        view.threats = analyze_threat(view, view.payload)
+    timings['threats'] = time.perf_counter() - start
+
+    analyzer = new_analyzer(store_packets)
+    timings['stats'] = timed(analyzer.update_stats, [(view,) for view in views])
+    timings['store'] = timed(analyzer.packets.append, [(view,) for view in views])
+
+    analyzer = new_analyzer(store_packets)
+    timings['total'] = timed(analyzer.process_packet, traffic)
+    timings['threats_detected'] = analyzer.stats['threats_detected']
+    return timings
+
+
+def measure_allocations(traffic, store_packets):
+    """tracemalloc peak and retained blocks per packet for ``process_packet``"""
+    analyzer = new_analyzer(store_packets)
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    for frame, timestamp, size in traffic:
+        analyzer.process_packet(frame, timestamp, size)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    return {
+        'traced_peak_bytes': peak,
+        'retained_blocks_per_packet': (sys.getallocatedblocks() - blocks_before) / len(traffic)
+    }
+
+
+def run_benchmark(args):
+    print(f"[+] Generating {args.packets} packets over {args.flows} flows (seed {args.seed})")
+    traffic = generate_traffic(args.packets, args.flows, args.mix, args.payload_sizes,
+                               args.threat_ratio, args.seed)
+    if args.save_pcapng:
+        with open(args.save_pcapng, 'wb') as f:
+            writer = PcapngWriter(f)
+            for frame, timestamp, size in traffic:
+                writer.write(frame, timestamp, size)
+        print(f"[+] Wrote generated traffic to {args.save_pcapng}")
+
+    best = {}
+    for run in range(args.repeat):
+        timings = run_stages(traffic, args.store_packets)
+        for stage in STAGES:
+            best[stage] = min(best.get(stage, timings[stage]), timings[stage])
+        print(f"[+] Run {run + 1}/{args.repeat}: {len(traffic) / timings['total']:,.0f} packets/s")
+
+    packets = len(traffic)
+    result = {
+        'config': {
+            'packets': packets,
+            'flows': args.flows,
+            'mix': args.mix,
+            'payload_sizes': args.payload_sizes,
+            'threat_ratio': args.threat_ratio,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'python': sys.version.split()[0]
+        },
+        'packets_per_second': packets / best['total'],
+        'ns_per_packet': {stage: best[stage] / packets * 1e9 for stage in STAGES},
+        'threats_detected': timings['threats_detected']
+    }
+    if not args.skip_allocations:
+        result['allocations'] = measure_allocations(traffic[:ALLOCATION_PACKETS], args.store_packets)
+    # ru_maxrss is in kilobytes on Linux
+    result['peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return result
+
+
+def compare(result, baseline, tolerance):
+    """Print stage-by-stage changes; returns the names of regressed stages"""
+    regressions = []
+    print(f"\n{'Stage':10} {'Baseline':>12} {'Current':>12} {'Change':>9}")
+    for stage in STAGES:
+        before = baseline['ns_per_packet'].get(stage)
+        after = result['ns_per_packet'][stage]
+        if not before:
+            continue
+        change = after / before - 1
+        marker = ''
+        if change > tolerance:
+            regressions.append(stage)
+            marker = '  REGRESSION'
+        print(f"{stage:10} {before:10.0f}ns {after:10.0f}ns {change:+8.1%}{marker}")
+
+    before = baseline['packets_per_second']
+    after = result['packets_per_second']
+    print(f"{'pps':10} {before:12,.0f} {after:12,.0f} {after / before - 1:+8.1%}")
+    if baseline.get('config', {}).get('packets') != result['config']['packets']:
+        print("[-] Baseline was recorded with a different configuration")
+    return regressions
+
+
+def print_result(result):
+    print("\n" + "="*50)
+    print("BENCHMARK RESULTS")
+    print("="*50)
+    print(f"Packets/s: {result['packets_per_second']:,.0f}")
+    for stage in STAGES:
+        print(f"  {stage:10} {result['ns_per_packet'][stage]:10.0f} ns/packet")
+    print(f"Threats Detected: {result['threats_detected']}")
+    allocations = result.get('allocations')
+    if allocations:
+        print(f"Traced Peak: {allocations['traced_peak_bytes'] / 1e6:.1f} MB over {ALLOCATION_PACKETS} packets")
+        print(f"Retained Blocks/Packet: {allocations['retained_blocks_per_packet']:.1f}")
+    print(f"Peak RSS: {result['peak_rss_bytes'] / 1e6:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PacketAnalyzer benchmark')
+    parser.add_argument('--packets', type=int, default=DEFAULT_PACKETS, help='Packets to generate')
+    parser.add_argument('--flows', type=int, default=DEFAULT_FLOWS, help='Distinct flows')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='Flow type weights: tcp, udp, icmp and ipv6 (TCP over IPv6)')
+    parser.add_argument('--payload-sizes', default=DEFAULT_PAYLOAD_SIZES,
+                        help='Comma-separated payload sizes, picked uniformly')
+    parser.add_argument('--threat-ratio', type=float, default=DEFAULT_THREAT_RATIO,
+                        help='Share of payloads matching a threat signature')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the generator')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Runs; the best is reported')
+    parser.add_argument('--store-packets', type=int, default=1000000,
+                        help='Packet store capacity of each analyzer')
+    parser.add_argument('--skip-allocations', action='store_true', help='Skip the tracemalloc run')
+    parser.add_argument('--save-pcapng', metavar='FILE', help='Also write the generated traffic')
+    parser.add_argument('--output', metavar='FILE', help='Write results as JSON')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare against earlier results')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed slowdown per stage before failing (0.10 = 10%%)')
+    args = parser.parse_args()
+
+    try:
+        result = run_benchmark(args)
+    except ValueError as e:
+        print(f"[-] {e}")
+        sys.exit(2)
+    print_result(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"[+] Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print(f"[-] Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("[+] No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
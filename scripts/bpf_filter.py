@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+BPF Filter - tcpdump-style capture filters compiled to classic BPF
+Filters run in the kernel, so unwanted frames never reach Python
+
+Supported expressions (Ethernet link type)::
+
+    ip | ip6 | arp | tcp | udp | icmp
+    [src|dst] host A.B.C.D
+    [src|dst] net A.B.C.D/LEN
+    [tcp|udp] [src|dst] port N
+    [tcp|udp] [src|dst] portrange N-M
+    less N | greater N
+    not/!  and/&&  or/||  ( ... )
+
+Anything outside this grammar is handed to ``tcpdump -ddd`` when tcpdump
+is installed. ``run_filter`` interprets the whole classic BPF instruction
+set in Python (scratch memory included), so the same filter, compiled
+here or by tcpdump, can be applied to frames read from capture files.
+Only Linux ancillary loads (``SKF_AD_*``), which read socket metadata a
+file does not have, are refused.
+"""
+
+import ctypes
+import ipaddress
+import re
+import shutil
+import socket
+import struct
+import subprocess
+
+SO_ATTACH_FILTER = 26
+SO_DETACH_FILTER = 27
+SNAPLEN = 262144
+
+# Instruction classes, sizes, modes and operations (<linux/filter.h>)
+BPF_LD = 0x00
+BPF_LDX = 0x01
+BPF_ST = 0x02
+BPF_STX = 0x03
+BPF_ALU = 0x04
+BPF_JMP = 0x05
+BPF_RET = 0x06
+BPF_MISC = 0x07
+BPF_W = 0x00
+BPF_H = 0x08
+BPF_B = 0x10
+BPF_IMM = 0x00
+BPF_ABS = 0x20
+BPF_IND = 0x40
+BPF_MEM = 0x60
+BPF_LEN = 0x80
+BPF_MSH = 0xa0
+BPF_ADD = 0x00
+BPF_SUB = 0x10
+BPF_MUL = 0x20
+BPF_DIV = 0x30
+BPF_OR = 0x40
+BPF_AND = 0x50
+BPF_LSH = 0x60
+BPF_RSH = 0x70
+BPF_NEG = 0x80
+BPF_MOD = 0x90
+BPF_XOR = 0xa0
+BPF_JA = 0x00
+BPF_JEQ = 0x10
+BPF_JGT = 0x20
+BPF_JGE = 0x30
+BPF_JSET = 0x40
+BPF_K = 0x00
+BPF_X = 0x08
+BPF_A = 0x10  # Return source of BPF_RET
+BPF_TAX = 0x00
+BPF_TXA = 0x80
+BPF_MEMWORDS = 16
+SKF_AD_OFF = 0xfffff000  # Linux ancillary data loads, -4096 as unsigned
+MASK32 = 0xFFFFFFFF
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86dd
+ETH_P_ARP = 0x0806
+
+IP_PROTOCOLS = {'tcp': 6, 'udp': 17, 'icmp': 1}
+SOCK_FILTER = struct.Struct('HBBI')
+
+TOKEN_PATTERN = re.compile(r'\s*(\(|\)|&&|\|\||!|[^\s()!]+)')
+
+
+def load(size, offset):
+    return (BPF_LD | size | BPF_ABS, offset)
+
+
+def load_indirect(size, offset):
+    return (BPF_LD | size | BPF_IND, offset)
+
+
+LOAD_ETHERTYPE = load(BPF_H, 12)
+LOAD_IPV4_PROTO = load(BPF_B, 23)
+LOAD_IPV6_NEXT = load(BPF_B, 20)
+LOAD_IPV4_FRAGMENT = load(BPF_H, 20)
+LOAD_IPV4_HEADER_LEN = (BPF_LDX | BPF_B | BPF_MSH, 14)
+LOAD_LENGTH = (BPF_LD | BPF_W | BPF_LEN, 0)
+
+
+# Expression tree nodes: ('test', loads, jump_op, k), ('and', a, b),
+# ('or', a, b), ('not', a), ('true',)
+
+def test(loads, k, op=BPF_JEQ):
+    return ('test', loads, op, k)
+
+
+def all_of(*nodes):
+    result = nodes[0]
+    for node in nodes[1:]:
+        result = ('and', result, node)
+    return result
+
+
+def any_of(*nodes):
+    result = nodes[0]
+    for node in nodes[1:]:
+        result = ('or', result, node)
+    return result
+
+
+def ethertype(value):
+    return test([LOAD_ETHERTYPE], value)
+
+
+def ip_protocol(protocol):
+    """IPv4 or IPv6 (without extension headers) carrying ``protocol``"""
+    return any_of(
+        all_of(ethertype(ETH_P_IP), test([LOAD_IPV4_PROTO], protocol)),
+        all_of(ethertype(ETH_P_IPV6), test([LOAD_IPV6_NEXT], protocol))
+    )
+
+
+def port_test(port_offset, compare):
+    """Compare a transport port on IPv4 (first fragments only) or IPv6"""
+    ipv4 = all_of(
+        ethertype(ETH_P_IP),
+        ('not', test([LOAD_IPV4_FRAGMENT], 0x1fff, BPF_JSET)),
+        compare([LOAD_IPV4_HEADER_LEN, load_indirect(BPF_H, 14 + port_offset)])
+    )
+    ipv6 = all_of(
+        ethertype(ETH_P_IPV6),
+        compare([load(BPF_H, 54 + port_offset)])
+    )
+    return any_of(ipv4, ipv6)
+
+
+class FilterParser:
+    """Recursive-descent parser for the supported tcpdump subset"""
+
+    def __init__(self, expression):
+        self.tokens = TOKEN_PATTERN.findall(expression)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError("Unexpected end of filter expression")
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            return ('true',)
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise ValueError(f"Unexpected token '{self.peek()}' in filter")
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek() in ('or', '||'):
+            self.take()
+            node = ('or', node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.peek() in ('and', '&&'):
+            self.take()
+            node = ('and', node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.peek() in ('not', '!'):
+            self.take()
+            return ('not', self.parse_not())
+        if self.peek() == '(':
+            self.take()
+            node = self.parse_or()
+            if self.take() != ')':
+                raise ValueError("Missing ')' in filter")
+            return node
+        return self.parse_primitive()
+
+    def parse_primitive(self):
+        token = self.take()
+
+        if token == 'ip':
+            return ethertype(ETH_P_IP)
+        if token == 'ip6':
+            return ethertype(ETH_P_IPV6)
+        if token == 'arp':
+            return ethertype(ETH_P_ARP)
+        if token in ('less', 'greater'):
+            length = int(self.take())
+            if token == 'less':
+                return ('not', test([LOAD_LENGTH], length, BPF_JGT))
+            return test([LOAD_LENGTH], length, BPF_JGE)
+
+        protocol = None
+        if token in IP_PROTOCOLS:
+            if self.peek() not in ('src', 'dst', 'port', 'portrange'):
+                return ip_protocol(IP_PROTOCOLS[token])
+            protocol = token
+            token = self.take()
+
+        direction = None
+        if token in ('src', 'dst'):
+            direction = token
+            token = self.take()
+
+        if token == 'host':
+            return self.address_test(direction, ipaddress.IPv4Network(self.take() + '/32'))
+        if token == 'net':
+            return self.address_test(direction, ipaddress.IPv4Network(self.take(), strict=False))
+        if token == 'port':
+            port = self.port_number(self.take())
+            return self.port_primitive(protocol, direction, lambda loads: test(loads, port))
+        if token == 'portrange':
+            low, _, high = self.take().partition('-')
+            low, high = self.port_number(low), self.port_number(high)
+            return self.port_primitive(
+                protocol, direction,
+                lambda loads: all_of(test(loads, low, BPF_JGE), ('not', test(loads, high, BPF_JGT)))
+            )
+
+        raise ValueError(f"Unsupported filter primitive '{token}'")
+
+    def port_number(self, token):
+        if token.isdigit():
+            return int(token)
+        return socket.getservbyname(token)
+
+    def address_test(self, direction, network):
+        mask = int(network.netmask)
+        address = int(network.network_address)
+
+        def field(offset):
+            loads = [load(BPF_W, offset)]
+            if mask != 0xFFFFFFFF:
+                loads.append((BPF_ALU | BPF_AND | BPF_K, mask))
+            return test(loads, address)
+
+        if direction == 'src':
+            match = field(26)
+        elif direction == 'dst':
+            match = field(30)
+        else:
+            match = any_of(field(26), field(30))
+        return all_of(ethertype(ETH_P_IP), match)
+
+    def port_primitive(self, protocol, direction, compare):
+        if direction == 'src':
+            ports = port_test(0, compare)
+        elif direction == 'dst':
+            ports = port_test(2, compare)
+        else:
+            ports = any_of(port_test(0, compare), port_test(2, compare))
+
+        if protocol:
+            transports = ip_protocol(IP_PROTOCOLS[protocol])
+        else:
+            transports = any_of(ip_protocol(6), ip_protocol(17))
+        return all_of(transports, ports)
+
+
+def generate(node):
+    """Generate code for a tree node
+
+    Returns a list of ``[code, jt, jf, k]`` where jump targets are absolute
+    indexes within the fragment or the symbols 'T'/'F' (node true/false).
+    """
+    kind = node[0]
+
+    if kind == 'true':
+        # Unconditional "ja" to the accept target
+        return [[BPF_JMP, 'T', 'T', 0]]
+
+    if kind == 'test':
+        _, loads, op, k = node
+        code = [[load_code, 0, 0, load_k] for load_code, load_k in loads]
+        code.append([BPF_JMP | op | BPF_K, 'T', 'F', k])
+        return code
+
+    if kind == 'not':
+        code = generate(node[1])
+        swap = {'T': 'F', 'F': 'T'}
+        for instruction in code:
+            if instruction[0] & 0x07 == BPF_JMP:
+                instruction[1] = swap.get(instruction[1], instruction[1])
+                instruction[2] = swap.get(instruction[2], instruction[2])
+        return code
+
+    left = generate(node[1])
+    right = generate(node[2])
+    start = len(left)
+    # AND continues to the right side on true, OR on false
+    link = 'T' if kind == 'and' else 'F'
+
+    for instruction in left:
+        if instruction[0] & 0x07 == BPF_JMP:
+            for slot in (1, 2):
+                if instruction[slot] == link:
+                    instruction[slot] = start
+    for instruction in right:
+        if instruction[0] & 0x07 == BPF_JMP:
+            for slot in (1, 2):
+                if isinstance(instruction[slot], int):
+                    instruction[slot] += start
+
+    return left + right
+
+
+def assemble(code, snaplen=SNAPLEN):
+    """Resolve jump targets and append the accept/reject returns"""
+    accept = len(code)
+    reject = accept + 1
+    program = []
+
+    for index, (op, jt, jf, k) in enumerate(code):
+        if op & 0x07 == BPF_JMP:
+            targets = []
+            for target in (jt, jf):
+                absolute = accept if target == 'T' else reject if target == 'F' else target
+                offset = absolute - index - 1
+                if not 0 <= offset <= 255:
+                    raise ValueError("Filter expression too large for classic BPF jumps")
+                targets.append(offset)
+            if op == BPF_JMP:
+                # BPF_JA uses k for the offset
+                program.append((op, 0, 0, targets[0]))
+            else:
+                program.append((op, targets[0], targets[1], k))
+        else:
+            program.append((op, 0, 0, k))
+
+    program.append((BPF_RET | BPF_K, 0, 0, snaplen))
+    program.append((BPF_RET | BPF_K, 0, 0, 0))
+    return program
+
+
+def compile_with_tcpdump(expression):
+    """Compile an expression with ``tcpdump -ddd`` (decimal instructions)"""
+    tcpdump = shutil.which('tcpdump')
+    if tcpdump is None:
+        return None
+
+    result = subprocess.run([tcpdump, '-ddd', '-y', 'EN10MB', expression],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ValueError(f"tcpdump rejected filter: {result.stderr.strip()}")
+
+    lines = result.stdout.split('\n')
+    count = int(lines[0])
+    return [tuple(int(field) for field in line.split()) for line in lines[1:count + 1]]
+
+
+def compile_filter(expression):
+    """Compile a tcpdump-style expression to a list of BPF instructions"""
+    try:
+        return assemble(generate(FilterParser(expression).parse()))
+    except ValueError:
+        program = compile_with_tcpdump(expression)
+        if program is None:
+            raise
+        return program
+
+
+def attach_filter(sock, program):
+    """Attach a compiled program to a socket with SO_ATTACH_FILTER"""
+    blob = b''.join(SOCK_FILTER.pack(*instruction) for instruction in program)
+    instructions = ctypes.create_string_buffer(blob, len(blob))
+    # struct sock_fprog { unsigned short len; struct sock_filter *filter; }
+    fprog = struct.pack('HL', len(program), ctypes.addressof(instructions))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+
+def alu(op, a, operand):
+    """Apply an ALU operation to the accumulator; None on division by zero"""
+    operation = op & 0xf0
+    if operation == BPF_ADD:
+        return (a + operand) & MASK32
+    if operation == BPF_SUB:
+        return (a - operand) & MASK32
+    if operation == BPF_MUL:
+        return (a * operand) & MASK32
+    if operation == BPF_DIV:
+        return a // operand if operand else None
+    if operation == BPF_MOD:
+        return a % operand if operand else None
+    if operation == BPF_OR:
+        return a | operand
+    if operation == BPF_AND:
+        return a & operand
+    if operation == BPF_XOR:
+        return a ^ operand
+    if operation == BPF_LSH:
+        return (a << operand) & MASK32 if operand < 32 else 0
+    if operation == BPF_RSH:
+        return a >> operand if operand < 32 else 0
+    if operation == BPF_NEG:
+        return -a & MASK32
+    raise ValueError(f"Unsupported BPF instruction {op:#x}")
+
+
+def load_packet(frame, size, offset):
+    if offset >= SKF_AD_OFF:
+        raise ValueError("BPF ancillary loads cannot run on capture files")
+    if size == BPF_W:
+        return struct.unpack_from('!I', frame, offset)[0]
+    if size == BPF_H:
+        return struct.unpack_from('!H', frame, offset)[0]
+    if size == BPF_B:
+        return frame[offset]
+    raise ValueError(f"Unsupported BPF load size {size:#x}")
+
+
+def run_filter(program, frame):
+    """Interpret a program against one frame; returns bytes to keep (0 = drop)
+
+    Raises ValueError for instructions that cannot run outside the kernel.
+    """
+    a = 0
+    x = 0
+    memory = [0] * BPF_MEMWORDS
+    pc = 0
+    length = len(frame)
+
+    try:
+        while True:
+            op, jt, jf, k = program[pc]
+            pc += 1
+            op_class = op & 0x07
+
+            if op_class == BPF_LD:
+                mode = op & 0xe0
+                if mode == BPF_ABS:
+                    a = load_packet(frame, op & 0x18, k)
+                elif mode == BPF_IND:
+                    a = load_packet(frame, op & 0x18, (x + k) & MASK32)
+                elif mode == BPF_LEN:
+                    a = length
+                elif mode == BPF_IMM:
+                    a = k
+                elif mode == BPF_MEM:
+                    a = memory[k]
+                else:
+                    raise ValueError(f"Unsupported BPF instruction {op:#x}")
+            elif op_class == BPF_LDX:
+                mode = op & 0xe0
+                if mode == BPF_MSH:
+                    if k >= SKF_AD_OFF:
+                        raise ValueError("BPF ancillary loads cannot run on capture files")
+                    x = (frame[k] & 0x0f) * 4
+                elif mode == BPF_IMM:
+                    x = k
+                elif mode == BPF_LEN:
+                    x = length
+                elif mode == BPF_MEM:
+                    x = memory[k]
+                else:
+                    raise ValueError(f"Unsupported BPF instruction {op:#x}")
+            elif op_class == BPF_ST:
+                memory[k] = a
+            elif op_class == BPF_STX:
+                memory[k] = x
+            elif op_class == BPF_ALU:
+                a = alu(op, a, x if op & BPF_X else k)
+                if a is None:
+                    return 0  # Division by zero rejects the packet, as in the kernel
+            elif op_class == BPF_JMP:
+                jump = op & 0xf0
+                if jump == BPF_JA:
+                    pc += k
+                    continue
+                operand = x if op & BPF_X else k
+                if jump == BPF_JEQ:
+                    pc += jt if a == operand else jf
+                elif jump == BPF_JGT:
+                    pc += jt if a > operand else jf
+                elif jump == BPF_JGE:
+                    pc += jt if a >= operand else jf
+                elif jump == BPF_JSET:
+                    pc += jt if a & operand else jf
+                else:
+                    raise ValueError(f"Unsupported BPF instruction {op:#x}")
+            elif op_class == BPF_RET:
+                source = op & 0x18
+                return a if source == BPF_A else x if source == BPF_X else k
+            elif op & 0xf8 == BPF_TAX:
+                x = a
+            elif op & 0xf8 == BPF_TXA:
+                a = x
+            else:
+                raise ValueError(f"Unsupported BPF instruction {op:#x}")
+    except (IndexError, struct.error):
+        # Out-of-bounds loads reject the packet, as in the kernel
+        return 0
+
+
+def format_program(program):
+    """Render a program like ``tcpdump -dd`` output"""
+    return '\n'.join('{ 0x%02x, %d, %d, 0x%08x },' % instruction for instruction in program)
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Capture Pipeline - Multi-core packet processing with flow-hash sharding
+Fans raw frames out to worker processes through shared-memory rings
+
+The capture loop only computes a symmetric 5-tuple hash and copies the frame
+into the owning worker's single-producer/single-consumer ring. Each worker
+runs its own ``PacketAnalyzer.process_packet`` on its shard and periodically
+publishes a statistics snapshot, which the parent merges into one view.
+Both directions of a flow hash to the same shard, so per-flow state stays
+local to one worker.
+"""
+
+import multiprocessing
+import queue
+import signal
+import struct
+import time
+from multiprocessing import shared_memory
+
+from rate_metrics import align_rates
+
+# Ring layout: producer and consumer positions on separate cache lines,
+# followed by the data area. Positions are monotonically increasing byte
+# counters; 8-byte aligned stores keep them tear-free on x86-64/aarch64.
+RING_WRITE_OFFSET = 0
+RING_READ_OFFSET = 64
+RING_DATA_OFFSET = 128
+RING_SIZE = 32 * 1024 * 1024
+
+# Per-record header: captured length, wire length, timestamp
+RECORD_HEADER = struct.Struct('<IId')
+WRAP_MARKER = 0xFFFFFFFF
+
+POSITION = struct.Struct('<Q')
+IPV4_ADDRS = struct.Struct('!II')
+IPV6_ADDRS = struct.Struct('!QQQQ')
+FRAGMENT_FIELD = struct.Struct('!H')
+VLAN_ETHERTYPES = (0x8100, 0x88A8, 0x9100)
+PORTS = struct.Struct('!HH')
+
+SNAPSHOT_INTERVAL = 0.5
+SNAPSHOT_PACKETS = 50
+SNAPSHOT_FLOWS = 10
+BACKPRESSURE_SLEEP = 0.0005  # Wait between retries while a ring is full
+
+
+class FrameRing:
+    """Single-producer/single-consumer frame queue in shared memory"""
+
+    def __init__(self, capacity=RING_SIZE):
+        self.capacity = capacity & ~7
+        self.shm = shared_memory.SharedMemory(create=True, size=self.capacity + RING_DATA_OFFSET)
+        self.buf = self.shm.buf
+        POSITION.pack_into(self.buf, RING_WRITE_OFFSET, 0)
+        POSITION.pack_into(self.buf, RING_READ_OFFSET, 0)
+        self.dropped = 0
+
+    def push(self, frame, timestamp, wire_len):
+        """Copy one frame into the ring; returns False if the ring is full
+
+        A full ring is not counted here; the caller decides whether the
+        frame is dropped or retried.
+        """
+        buf = self.buf
+        capacity = self.capacity
+        size = len(frame)
+        record = (RECORD_HEADER.size + size + 7) & ~7
+
+        write = POSITION.unpack_from(buf, RING_WRITE_OFFSET)[0]
+        read = POSITION.unpack_from(buf, RING_READ_OFFSET)[0]
+        offset = write % capacity
+        tail_room = capacity - offset
+        needed = record if record <= tail_room else tail_room + record
+
+        if write + needed - read > capacity:
+            return False
+
+        if record > tail_room:
+            # Not enough contiguous space: mark the tail as padding and wrap
+            struct.pack_into('<I', buf, RING_DATA_OFFSET + offset, WRAP_MARKER)
+            write += tail_room
+            offset = 0
+
+        start = RING_DATA_OFFSET + offset
+        RECORD_HEADER.pack_into(buf, start, size, wire_len, timestamp)
+        start += RECORD_HEADER.size
+        buf[start:start + size] = frame
+        POSITION.pack_into(buf, RING_WRITE_OFFSET, write + record)
+        return True
+
+    def drain(self, handler, limit=1024):
+        """Pass up to ``limit`` queued frames to ``handler`` in place"""
+        buf = self.buf
+        capacity = self.capacity
+        write = POSITION.unpack_from(buf, RING_WRITE_OFFSET)[0]
+        read = POSITION.unpack_from(buf, RING_READ_OFFSET)[0]
+        count = 0
+
+        while read < write and count < limit:
+            offset = read % capacity
+            size, wire_len, timestamp = RECORD_HEADER.unpack_from(buf, RING_DATA_OFFSET + offset)
+            if size == WRAP_MARKER:
+                read += capacity - offset
+                continue
+            start = RING_DATA_OFFSET + offset + RECORD_HEADER.size
+            handler(buf[start:start + size], timestamp, wire_len)
+            read += (RECORD_HEADER.size + size + 7) & ~7
+            count += 1
+
+        POSITION.pack_into(buf, RING_READ_OFFSET, read)
+        return count
+
+    def depth(self):
+        """Bytes currently queued"""
+        write = POSITION.unpack_from(self.buf, RING_WRITE_OFFSET)[0]
+        read = POSITION.unpack_from(self.buf, RING_READ_OFFSET)[0]
+        return write - read
+
+    def fill(self):
+        """Fraction of the ring currently in use"""
+        return self.depth() / self.capacity
+
+    def close(self, unlink=False):
+        """Detach from the shared memory segment"""
+        self.buf = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A worker-side view is still alive; the segment is freed with it
+            pass
+        if unlink:
+            self.shm.unlink()
+
+
+def flow_shard(frame, shards):
+    """Map a raw Ethernet frame to a shard by symmetric 5-tuple hash
+
+    XOR-combining the endpoints makes A->B and B->A land on the same shard.
+    VLAN tags are skipped; tunnels hash on their outer header. Fragments
+    hash on addresses only, so every fragment of a datagram reaches the
+    same shard's reassembler. Frames that are not IP all go to shard 0.
+    """
+    offset = 12
+    ethertype = (frame[12] << 8) | frame[13] if len(frame) >= 14 else 0
+    while ethertype in VLAN_ETHERTYPES and len(frame) >= offset + 6:
+        offset += 4
+        ethertype = (frame[offset] << 8) | frame[offset + 1]
+    offset += 2
+
+    if ethertype == 0x0800 and len(frame) >= offset + 20:
+        protocol = frame[offset + 9]
+        src, dst = IPV4_ADDRS.unpack_from(frame, offset + 12)
+        fragmented = FRAGMENT_FIELD.unpack_from(frame, offset + 6)[0] & 0x3FFF
+        ports_offset = offset + (frame[offset] & 0x0F) * 4
+    elif ethertype == 0x86DD and len(frame) >= offset + 40:
+        protocol = frame[offset + 6]
+        src_high, src_low, dst_high, dst_low = IPV6_ADDRS.unpack_from(frame, offset + 8)
+        src = src_high ^ src_low
+        dst = dst_high ^ dst_low
+        # Extension headers (including fragments) are hashed without ports
+        fragmented = False
+        ports_offset = offset + 40
+    else:
+        return 0
+
+    key = src ^ dst ^ protocol
+    if protocol in (6, 17) and not fragmented and len(frame) >= ports_offset + 4:
+        sport, dport = PORTS.unpack_from(frame, ports_offset)
+        key ^= (sport ^ dport) << 16
+
+    # Fibonacci hashing spreads nearby addresses across shards
+    return ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) % shards
+
+
+def merge_snapshots(snapshots):
+    """Merge per-shard statistics
+
+    Numbers add up, dicts merge key by key and equal-length series of
+    per-interval counters add element-wise.
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.items():
+            if isinstance(value, dict):
+                merged[key] = merge_snapshots([merged.get(key, {}), value])
+            elif isinstance(value, list):
+                current = merged.get(key)
+                if current is None:
+                    merged[key] = list(value)
+                else:
+                    merged[key] = [x + y for x, y in zip(current, value)]
+            elif isinstance(value, bool):
+                merged[key] = merged.get(key, False) or value
+            elif isinstance(value, (int, float)):
+                merged[key] = merged.get(key, 0) + value
+            else:
+                merged.setdefault(key, value)
+    return merged
+
+
+def run_worker(shard, ring, analyzer_factory, results, stop_event, snapshot_interval):
+    """Worker process: drain one ring through a private PacketAnalyzer"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    analyzer = analyzer_factory(shard)
+    analyzer.input_backlog = ring.fill
+    handler = analyzer.process_packet
+    processed = 0
+    next_snapshot = time.time() + snapshot_interval
+
+    def publish(packet_count):
+        results.put({
+            'shard': shard,
+            'processed': processed,
+            'stats': analyzer.stats_snapshot(),
+            'packets': analyzer.get_recent_packets(packet_count),
+            'flows': analyzer.get_top_flows(SNAPSHOT_FLOWS)
+        })
+
+    while True:
+        count = ring.drain(handler)
+        processed += count
+
+        if count == 0:
+            if stop_event.is_set() and ring.depth() == 0:
+                break
+            time.sleep(0.001)
+
+        if time.time() >= next_snapshot:
+            publish(SNAPSHOT_PACKETS)
+            next_snapshot = time.time() + snapshot_interval
+
+    # Final snapshot carries every retained packet for export and the
+    # writer counters after the streamed output has been flushed
+    analyzer.close_stream_writers()
+    publish(analyzer.export_packet_count)
+    analyzer.close()
+    ring.close()
+    results.close()
+    results.join_thread()
+
+
+class CapturePipeline:
+    """Flow-sharded fan-out of raw frames to N analyzer worker processes"""
+
+    def __init__(self, analyzer_factory, workers, ring_size=RING_SIZE,
+                 snapshot_interval=SNAPSHOT_INTERVAL):
+        self.workers = workers
+        self.running = False
+        self.dispatched = [0] * workers
+        self.snapshots = [None] * workers
+
+        ctx = multiprocessing.get_context('fork')
+        self.rings = [FrameRing(ring_size) for _ in range(workers)]
+        self.results = ctx.Queue()
+        self.stop_event = ctx.Event()
+        self.processes = [
+            ctx.Process(
+                target=run_worker,
+                args=(shard, self.rings[shard], analyzer_factory, self.results,
+                      self.stop_event, snapshot_interval),
+                daemon=True
+            )
+            for shard in range(workers)
+        ]
+
+    def start(self):
+        """Start the worker processes"""
+        for process in self.processes:
+            process.start()
+        self.running = True
+        print(f"[+] Started capture pipeline with {self.workers} worker processes")
+
+    def dispatch(self, frame, timestamp=None, packet_size=None):
+        """Queue a frame on its flow's shard, dropping it if the ring is full
+
+        Used for live capture, where stalling the capture thread would only
+        move the loss into the kernel.
+        """
+        shard = flow_shard(frame, self.workers)
+        if timestamp is None:
+            timestamp = time.time()
+        if packet_size is None:
+            packet_size = len(frame)
+        ring = self.rings[shard]
+        if ring.push(frame, timestamp, packet_size):
+            self.dispatched[shard] += 1
+        else:
+            ring.dropped += 1
+    
+    def dispatch_wait(self, frame, timestamp, packet_size):
+        """Queue a frame on its flow's shard, waiting for ring space
+
+        Used for capture files, which can be read at whatever pace the
+        workers keep up with, so no frame is ever dropped.
+        """
+        shard = flow_shard(frame, self.workers)
+        ring = self.rings[shard]
+        while not ring.push(frame, timestamp, packet_size):
+            if not self.processes[shard].is_alive():
+                raise RuntimeError(f"Pipeline worker {shard} exited with a full ring")
+            time.sleep(BACKPRESSURE_SLEEP)
+        self.dispatched[shard] += 1
+
+    def collect(self, timeout=0):
+        """Pull pending worker snapshots off the results queue"""
+        while True:
+            try:
+                result = self.results.get(timeout=timeout) if timeout else self.results.get_nowait()
+            except queue.Empty:
+                return
+            self.snapshots[result['shard']] = result
+            timeout = 0
+
+    def stop(self):
+        """Let workers drain their rings, then gather final snapshots"""
+        if not self.running:
+            return
+        self.stop_event.set()
+
+        while any(process.is_alive() for process in self.processes):
+            self.collect(timeout=0.1)
+            for process in self.processes:
+                process.join(timeout=0)
+        self.collect()
+
+        for ring in self.rings:
+            ring.close(unlink=True)
+        self.running = False
+
+    def merged_snapshot(self, now=None):
+        """Global statistics merged from the latest per-shard snapshots
+
+        Each shard's rate series end at its own last packet or snapshot
+        time; they are aligned to ``now`` (default: the newest shard)
+        before they are added up.
+        """
+        self.collect()
+        return merge_snapshots(align_rates([s['stats'] for s in self.snapshots if s], now))
+
+    def recent_packets(self, count):
+        """Most recent packets across all shards, ordered by capture time"""
+        self.collect()
+        packets = []
+        for snapshot in self.snapshots:
+            if snapshot:
+                packets.extend(snapshot['packets'])
+        packets.sort(key=lambda p: p['timestamp'])
+        return packets[-count:]
+
+    def top_flows(self, count):
+        """Busiest flows across all shards"""
+        self.collect()
+        flows = []
+        for snapshot in self.snapshots:
+            if snapshot:
+                flows.extend(snapshot['flows'])
+        flows.sort(key=lambda f: f['octetDeltaCount'] + f['reverseOctetDeltaCount'], reverse=True)
+        return flows[:count]
+    
+    def status(self):
+        """Per-shard dispatch, drop and processing counters"""
+        shards = []
+        for shard in range(self.workers):
+            snapshot = self.snapshots[shard]
+            shards.append({
+                'dispatched': self.dispatched[shard],
+                'dropped': self.rings[shard].dropped,
+                'ring_bytes': self.rings[shard].depth() if self.running else 0,
+                'processed': snapshot['processed'] if snapshot else 0
+            })
+        return {'workers': self.workers, 'shards': shards}
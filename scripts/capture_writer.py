@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Capture Writer - Background streaming export with file rotation
+NDJSON packet records or pcapng raw frames, optionally gzip/zstd compressed
+
+The capture path only puts an item on a bounded queue; a writer thread
+serializes, compresses and writes it. Files rotate by size and/or age, so
+long captures are kept in full without growing memory. When the queue is
+full the writer either drops the item (live capture: never stall the
+capture loop) or blocks the producer (offline analysis: lossless), and
+both cases are counted as backpressure.
+"""
+
+import gzip
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+
+from pcap_file import PcapngWriter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMATS = ('ndjson', 'pcapng')
+COMPRESSIONS = (None, 'gzip', 'zstd')
+
+DEFAULT_QUEUE_SIZE = 16384
+DEFAULT_ROTATE_BYTES = 64 * 1024 * 1024
+BATCH_SIZE = 512
+GZIP_LEVEL = 3
+ZSTD_LEVEL = 3
+
+
+def open_output(filename, compression):
+    """Open a binary output file, compressed as requested"""
+    if compression == 'gzip':
+        return gzip.open(filename, 'wb', compresslevel=GZIP_LEVEL)
+    if compression == 'zstd':
+        raw = open(filename, 'wb')
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw)
+    return open(filename, 'wb', buffering=1 << 20)
+
+
+class CaptureWriter:
+    """Bounded-queue background writer with size/time based rotation
+
+    ``submit`` takes a ``PacketView`` for NDJSON output or a
+    ``(frame_bytes, timestamp, wire_len)`` tuple for pcapng output.
+    """
+
+    def __init__(self, prefix, fmt='ndjson', compression=None,
+                 rotate_bytes=DEFAULT_ROTATE_BYTES, rotate_seconds=None,
+                 queue_size=DEFAULT_QUEUE_SIZE, block=False):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported export format '{fmt}'")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unsupported compression '{compression}'")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+
+        self.prefix = prefix
+        self.format = fmt
+        self.compression = compression
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.block = block
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.lock = threading.Lock()
+
+        self.file = None
+        self.pcapng = None
+        self.file_index = 0
+        self.file_bytes = 0
+        self.file_opened = 0
+        self.files = []
+        self.error = None
+        self.metrics = {
+            'submitted': 0,
+            'written': 0,
+            'dropped': 0,
+            'blocked': 0,
+            'blocked_seconds': 0.0,
+            'queue_high_water': 0,
+            'bytes_written': 0,
+            'files': 0
+        }
+
+    def submit(self, item):
+        """Queue one item for writing; returns False if it was dropped"""
+        if self.thread is None:
+            self._start()
+        metrics = self.metrics
+        metrics['submitted'] += 1
+
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            if not self.block:
+                metrics['dropped'] += 1
+                return False
+            metrics['blocked'] += 1
+            started = time.perf_counter()
+            self.queue.put(item)
+            metrics['blocked_seconds'] += time.perf_counter() - started
+
+        depth = self.queue.qsize()
+        if depth > metrics['queue_high_water']:
+            metrics['queue_high_water'] = depth
+        return True
+
+    def _start(self):
+        # The thread starts with the first item, so analyzers created before
+        # a fork never carry a writer thread into the child
+        self.thread = threading.Thread(target=self._run, name=f'writer-{self.format}', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        """Writer thread: drain the queue in batches until the stop marker"""
+        get = self.queue.get
+        get_nowait = self.queue.get_nowait
+
+        while True:
+            batch = [get()]
+            try:
+                while len(batch) < BATCH_SIZE:
+                    batch.append(get_nowait())
+            except queue.Empty:
+                pass
+
+            stop = False
+            for item in batch:
+                if item is None:
+                    stop = True
+                    continue
+                if self.error is None:
+                    try:
+                        self._write(item)
+                    except Exception as e:
+                        # Keep draining so producers never block on a dead writer
+                        self.error = e
+                        print(f"[-] Export writer failed: {e}")
+
+            if stop:
+                break
+
+        self._close_file()
+
+    def _write(self, item):
+        if self.file is None or self._should_rotate():
+            self._rotate()
+
+        if self.format == 'pcapng':
+            frame, timestamp, wire_len = item
+            written = self.pcapng.write(frame, timestamp, wire_len)
+        else:
+            line = json.dumps(item.to_dict(), separators=(',', ':')).encode() + b'\n'
+            self.file.write(line)
+            written = len(line)
+
+        self.file_bytes += written
+        with self.lock:
+            self.metrics['written'] += 1
+            self.metrics['bytes_written'] += written
+
+    def _should_rotate(self):
+        if self.rotate_bytes and self.file_bytes >= self.rotate_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self.file_opened >= self.rotate_seconds
+
+    def _rotate(self):
+        """Close the current file and start the next one"""
+        self._close_file()
+
+        extension = 'ndjson' if self.format == 'ndjson' else 'pcapng'
+        if self.compression == 'gzip':
+            extension += '.gz'
+        elif self.compression == 'zstd':
+            extension += '.zst'
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"{self.prefix}_{stamp}_{self.file_index:04d}.{extension}"
+
+        self.file = open_output(filename, self.compression)
+        self.file_index += 1
+        self.file_opened = time.time()
+        self.files.append(filename)
+        self.metrics['files'] += 1
+
+        if self.format == 'pcapng':
+            self.pcapng = PcapngWriter(self.file)
+            self.file_bytes = self.pcapng.bytes_written
+        else:
+            self.file_bytes = 0
+
+    def _close_file(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.pcapng = None
+
+    def snapshot(self):
+        """Mergeable writer and backpressure counters"""
+        with self.lock:
+            snapshot = dict(self.metrics)
+        snapshot['queue_depth'] = self.queue.qsize()
+        return snapshot
+
+    def close(self):
+        """Flush everything queued, then close the current file"""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
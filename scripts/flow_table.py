@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Flow Table - Bidirectional TCP/UDP/ICMP flow tracking
+Per-flow counters and TCP state with idle/active timeouts and a hard cap
+
+Flows are keyed by a packed integer built from the protocol and both
+endpoints in canonical order, so both directions of a conversation update
+the same entry. Entries live in an OrderedDict ordered by last activity:
+idle expiry and cap eviction pop from the cold end in O(1). Expired flows
+are handed to an exporter as IPFIX-style biflow records (RFC 5102/5103
+information element names).
+"""
+
+import heapq
+import json
+from collections import OrderedDict
+
+from packet_view import format_address
+
+ADDRESS_BITS = 128
+ENDPOINT_BITS = ADDRESS_BITS + 16
+# Set in the protocol part of the key so IPv4 and IPv6 flows never collide
+IPV6_KEY_FLAG = 0x100
+
+# IPFIX flowEndReason values
+END_IDLE_TIMEOUT = 1
+END_ACTIVE_TIMEOUT = 2
+END_OF_FLOW = 3
+END_FORCED = 4
+END_LACK_OF_RESOURCES = 5
+
+# Simplified TCP connection states
+TCP_NEW = 'NEW'
+TCP_SYN_SENT = 'SYN_SENT'
+TCP_SYN_RECEIVED = 'SYN_RECEIVED'
+TCP_ESTABLISHED = 'ESTABLISHED'
+TCP_CLOSING = 'CLOSING'
+TCP_CLOSED = 'CLOSED'
+TCP_RESET = 'RESET'
+
+TCP_FIN = 1
+TCP_SYN = 2
+TCP_RST = 4
+TCP_ACK = 16
+
+DEFAULT_IDLE_TIMEOUT = 60
+DEFAULT_ACTIVE_TIMEOUT = 1800
+DEFAULT_CLOSED_TIMEOUT = 5
+DEFAULT_MAX_FLOWS = 262144
+
+
+def flow_key(ip_proto, src_addr, src_port, dst_addr, dst_port):
+    """Pack a 5-tuple into a direction-independent integer key
+
+    Returns ``(key, forward)`` where ``forward`` is True when the packet's
+    source is the lower endpoint.
+    """
+    source = (src_addr << 16) | src_port
+    destination = (dst_addr << 16) | dst_port
+    if source <= destination:
+        return (((ip_proto << ENDPOINT_BITS) | source) << ENDPOINT_BITS) | destination, True
+    return (((ip_proto << ENDPOINT_BITS) | destination) << ENDPOINT_BITS) | source, False
+
+
+class Flow:
+    """Counters and state for one bidirectional flow"""
+
+    __slots__ = ('key', 'ip_proto', 'ip_version', 'src_addr', 'src_port', 'dst_addr', 'dst_port',
+                 'initiator_is_lower', 'first_seen', 'last_seen', 'packets', 'bytes',
+                 'reverse_packets', 'reverse_bytes', 'tcp_flags', 'tcp_state',
+                 'fin_seen', 'threats')
+
+    def __init__(self, key, packet, forward):
+        self.key = key
+        self.ip_proto = packet.ip_proto
+        self.ip_version = packet.ip_version
+        # The first packet's sender is treated as the flow initiator
+        self.src_addr = packet.src_addr
+        self.src_port = packet.src_port
+        self.dst_addr = packet.dst_addr
+        self.dst_port = packet.dst_port
+        self.initiator_is_lower = forward
+        self.first_seen = packet.timestamp
+        self.last_seen = packet.timestamp
+        self.packets = 0
+        self.bytes = 0
+        self.reverse_packets = 0
+        self.reverse_bytes = 0
+        self.tcp_flags = 0
+        self.tcp_state = TCP_NEW if packet.ip_proto == 6 else None
+        self.fin_seen = 0
+        self.threats = 0
+
+    def update_tcp_state(self, flags, from_initiator):
+        """Advance the simplified TCP state machine"""
+        if flags & TCP_RST:
+            self.tcp_state = TCP_RESET
+            return
+        if flags & TCP_FIN:
+            self.fin_seen |= 1 if from_initiator else 2
+            self.tcp_state = TCP_CLOSED if self.fin_seen == 3 else TCP_CLOSING
+            return
+
+        state = self.tcp_state
+        if flags & TCP_SYN:
+            if flags & TCP_ACK and not from_initiator:
+                self.tcp_state = TCP_SYN_RECEIVED
+            elif state == TCP_NEW:
+                self.tcp_state = TCP_SYN_SENT
+        elif flags & TCP_ACK and state in (TCP_NEW, TCP_SYN_SENT, TCP_SYN_RECEIVED):
+            self.tcp_state = TCP_ESTABLISHED
+
+    @property
+    def finished(self):
+        return self.tcp_state in (TCP_CLOSED, TCP_RESET)
+
+    def reset_counters(self, now):
+        """Start a new reporting interval for a long-lived flow"""
+        self.first_seen = now
+        self.packets = 0
+        self.bytes = 0
+        self.reverse_packets = 0
+        self.reverse_bytes = 0
+        self.threats = 0
+
+    def to_record(self, end_reason):
+        """Build an IPFIX-style biflow record"""
+        if self.ip_version == 6:
+            source, destination = 'sourceIPv6Address', 'destinationIPv6Address'
+        else:
+            source, destination = 'sourceIPv4Address', 'destinationIPv4Address'
+        return {
+            source: format_address(self.src_addr, self.ip_version),
+            destination: format_address(self.dst_addr, self.ip_version),
+            'sourceTransportPort': self.src_port,
+            'destinationTransportPort': self.dst_port,
+            'protocolIdentifier': self.ip_proto,
+            'flowStartMilliseconds': int(self.first_seen * 1000),
+            'flowEndMilliseconds': int(self.last_seen * 1000),
+            'packetDeltaCount': self.packets,
+            'octetDeltaCount': self.bytes,
+            'reversePacketDeltaCount': self.reverse_packets,
+            'reverseOctetDeltaCount': self.reverse_bytes,
+            'tcpControlBits': self.tcp_flags,
+            'tcpState': self.tcp_state,
+            'threatPacketCount': self.threats,
+            'flowEndReason': end_reason
+        }
+
+
+class FlowTable:
+    """Bounded bidirectional flow table with NetFlow-style expiry"""
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, active_timeout=DEFAULT_ACTIVE_TIMEOUT,
+                 closed_timeout=DEFAULT_CLOSED_TIMEOUT, max_flows=DEFAULT_MAX_FLOWS, exporter=None):
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.closed_timeout = closed_timeout
+        self.max_flows = max_flows
+        self.exporter = exporter
+        self.flows = OrderedDict()
+        self.closing = {}
+        self.next_sweep = 0
+        self.counters = {
+            'created': 0,
+            'expired': 0,
+            'evicted': 0,
+            'exported': 0
+        }
+
+    def __len__(self):
+        return len(self.flows)
+
+    def update(self, packet):
+        """Account one packet to its flow, creating the flow if needed"""
+        now = packet.timestamp
+        ip_proto = packet.ip_proto if packet.ip_version == 4 else packet.ip_proto | IPV6_KEY_FLAG
+        key, forward = flow_key(ip_proto, packet.src_addr, packet.src_port,
+                                packet.dst_addr, packet.dst_port)
+        flows = self.flows
+        flow = flows.get(key)
+
+        if flow is None:
+            if len(flows) >= self.max_flows:
+                self.expire(now)
+                if len(flows) >= self.max_flows:
+                    self._evict()
+            flow = Flow(key, packet, forward)
+            flows[key] = flow
+            self.counters['created'] += 1
+        else:
+            flows.move_to_end(key)
+            if now - flow.first_seen >= self.active_timeout:
+                self._export(flow, END_ACTIVE_TIMEOUT)
+                flow.reset_counters(now)
+
+        from_initiator = forward == flow.initiator_is_lower
+        if from_initiator:
+            flow.packets += 1
+            flow.bytes += packet.size
+        else:
+            flow.reverse_packets += 1
+            flow.reverse_bytes += packet.size
+        if now > flow.last_seen:
+            flow.last_seen = now
+        if packet.threats:
+            flow.threats += 1
+
+        if packet.ip_proto == 6:
+            flags = packet.tcp_flags
+            flow.tcp_flags |= flags
+            if flags & (TCP_SYN | TCP_FIN | TCP_RST) or flow.tcp_state != TCP_ESTABLISHED:
+                flow.update_tcp_state(flags, from_initiator)
+                if flow.finished:
+                    self.closing[key] = flow
+
+        if now >= self.next_sweep:
+            self.expire(now)
+            self.next_sweep = now + 1
+
+        return flow
+
+    def expire(self, now):
+        """Export and drop idle flows and flows that finished closing"""
+        flows = self.flows
+
+        for key, flow in list(self.closing.items()):
+            if key not in flows:
+                del self.closing[key]
+            elif now - flow.last_seen >= self.closed_timeout:
+                del self.closing[key]
+                del flows[key]
+                self.counters['expired'] += 1
+                self._export(flow, END_OF_FLOW)
+
+        while flows:
+            key, flow = next(iter(flows.items()))
+            if now - flow.last_seen < self.idle_timeout:
+                break
+            del flows[key]
+            self.closing.pop(key, None)
+            self.counters['expired'] += 1
+            self._export(flow, END_IDLE_TIMEOUT)
+
+    def _evict(self):
+        """Make room by dropping the least recently active flow"""
+        key, flow = self.flows.popitem(last=False)
+        self.closing.pop(key, None)
+        self.counters['evicted'] += 1
+        self._export(flow, END_LACK_OF_RESOURCES)
+
+    def _export(self, flow, end_reason):
+        if self.exporter is not None and (flow.packets or flow.reverse_packets):
+            self.exporter(flow.to_record(end_reason))
+            self.counters['exported'] += 1
+
+    def flush(self):
+        """Export every remaining flow, e.g. when capture stops"""
+        while self.flows:
+            _key, flow = self.flows.popitem(last=False)
+            self._export(flow, END_FORCED)
+        self.closing.clear()
+
+    def top_flows(self, count=10, key='bytes'):
+        """Return the busiest active flows as records"""
+        if key == 'packets':
+            weight = lambda f: f.packets + f.reverse_packets
+        else:
+            weight = lambda f: f.bytes + f.reverse_bytes
+        flows = heapq.nlargest(count, self.flows.values(), key=weight)
+        return [flow.to_record(None) for flow in flows]
+
+    def snapshot(self):
+        """Mergeable flow counters"""
+        snapshot = dict(self.counters)
+        snapshot['active'] = len(self.flows)
+        return snapshot
+
+
+class FlowRecordWriter:
+    """Append exported flow records to a file as newline-delimited JSON"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'a', buffering=1 << 16)
+
+    def __call__(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def close(self):
+        self.file.close()
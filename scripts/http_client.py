@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+HTTP Client - Pooled keep-alive HTTP/1.1 for the web checks
+Concurrent requests over a bounded set of persistent connections per origin
+
+Each origin (scheme, host, port) gets a pool of at most ``per_host``
+connections that stay open between requests, so a content check of
+thousands of paths pays for a handful of TCP and TLS handshakes instead
+of one per path. Requests wait on the pool's semaphore, take an idle
+connection or open a new one, and hand it back once the response has
+been read in full. A request on a reused connection that the server has
+closed in the meantime is retried once on a fresh connection.
+
+Bodies are read up to ``max_body`` bytes; a longer body is truncated
+and its connection discarded instead of drained. Certificates are not
+verified, as the checks target hosts by address.
+"""
+
+import asyncio
+import ssl
+from urllib.parse import urlsplit
+
+DEFAULT_PER_HOST = 32
+DEFAULT_TIMEOUT = 5.0
+MAX_BODY_BYTES = 64 * 1024
+USER_AGENT = 'Mozilla/5.0 (compatible; PenTest-Toolkit)'
+
+
+class HTTPError(OSError):
+    """Malformed or truncated HTTP response"""
+
+
+class HTTPResponse:
+    """Status, headers and (possibly truncated) body of one response"""
+
+    __slots__ = ('status', 'reason', 'headers', 'body', 'truncated')
+
+    def __init__(self, status, reason, headers, body, truncated=False):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.truncated = truncated
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8', errors='ignore')
+
+
+def insecure_context():
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class ConnectionPool:
+    """Persistent connections to one origin"""
+
+    def __init__(self, client, scheme, host, port):
+        self.client = client
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.host_header = host if port == (443 if scheme == 'https' else 80) else f"{host}:{port}"
+        self.idle = []
+        self.slots = asyncio.Semaphore(client.per_host)
+
+    async def connect(self):
+        context = self.client.ssl_context if self.scheme == 'https' else None
+        connection = await asyncio.open_connection(self.host, self.port, ssl=context,
+                                                   server_hostname=self.host if context else None)
+        self.client.counters['connections'] += 1
+        return connection
+
+    async def request(self, method, target, headers):
+        async with self.slots:
+            for attempt in range(2):
+                reused = bool(self.idle)
+                if reused:
+                    reader, writer = self.idle.pop()
+                else:
+                    reader, writer = await asyncio.wait_for(self.connect(), self.client.timeout)
+                try:
+                    response, keep_alive = await asyncio.wait_for(
+                        self.exchange(reader, writer, method, target, headers), self.client.timeout)
+                except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+                    writer.close()
+                    if reused and attempt == 0:
+                        continue  # The server closed the idle connection
+                    if isinstance(e, OSError):
+                        raise
+                    raise HTTPError(f"Bad response from {self.host_header}: {e}") from e
+                except BaseException:
+                    writer.close()  # Timed out or cancelled mid-response
+                    raise
+                if reused:
+                    self.client.counters['reused'] += 1
+                if keep_alive:
+                    self.idle.append((reader, writer))
+                else:
+                    writer.close()
+                return response
+
+    async def exchange(self, reader, writer, method, target, headers):
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {self.host_header}", f"User-Agent: {USER_AGENT}",
+                 "Accept: */*", "Connection: keep-alive"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        await writer.drain()
+
+        head = await reader.readuntil(b'\r\n\r\n')
+        status_line, *header_lines = head.decode('latin-1').split('\r\n')[:-2]
+        version, status, reason = (status_line.split(' ', 2) + [''])[:3]
+        status = int(status)
+        response_headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        connection = response_headers.get('connection', '').lower()
+        keep_alive = connection != 'close' and (version != 'HTTP/1.0' or connection == 'keep-alive')
+
+        max_body = self.client.max_body
+        body = b''
+        truncated = False
+        if method == 'HEAD' or status < 200 or status in (204, 304):
+            pass
+        elif 'chunked' in response_headers.get('transfer-encoding', '').lower():
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';', 1)[0], 16)
+                if size == 0:
+                    while await reader.readuntil(b'\r\n') != b'\r\n':
+                        pass  # Trailer fields
+                    break
+                if len(body) + size > max_body:
+                    body += await reader.readexactly(max_body - len(body))
+                    truncated, keep_alive = True, False
+                    break
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+        elif 'content-length' in response_headers:
+            length = int(response_headers['content-length'])
+            if length > max_body:
+                length, truncated, keep_alive = max_body, True, False
+            body = await reader.readexactly(length)
+        else:
+            body = await reader.read(max_body)  # Delimited by the server closing
+            keep_alive = False
+
+        return HTTPResponse(status, reason, response_headers, body, truncated), keep_alive
+
+
+class HTTPClient:
+    """Keep-alive connection pools shared by every request to a target"""
+
+    def __init__(self, per_host=DEFAULT_PER_HOST, timeout=DEFAULT_TIMEOUT, max_body=MAX_BODY_BYTES):
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_body = max_body
+        self.ssl_context = insecure_context()
+        self.pools = {}
+        self.counters = {
+            'requests': 0,
+            'connections': 0,
+            'reused': 0,
+            'errors': 0
+        }
+
+    async def request(self, method, url, headers=None):
+        """Send one request and read its response; raises OSError or asyncio.TimeoutError
+
+        Waiting for a free connection does not count against the
+        timeout, which bounds the connect and the exchange.
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = self.pools[key] = ConnectionPool(self, scheme, parts.hostname, port)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+
+        self.counters['requests'] += 1
+        try:
+            return await pool.request(method, target, headers or {})
+        except (OSError, asyncio.TimeoutError):
+            self.counters['errors'] += 1
+            raise
+
+    async def get(self, url, headers=None):
+        return await self.request('GET', url, headers)
+
+    async def close(self):
+        for pool in self.pools.values():
+            for _reader, writer in pool.idle:
+                writer.close()
+            pool.idle.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -21,9 +21,17 @@ from scapy.layers.l2 import ARP, Ether
 from scapy.layers.inet import IP, TCP, UDP, ICMP
 import argparse
 
+from scan_store import ScanStore, DEFAULT_TTL, HOST_PROBE, diff_host
+
+# Common IoT ports
+IOT_PORTS = [21, 22, 23, 25, 53, 80, 110, 143, 443, 515, 554, 631, 993, 995,
+             1900, 5000, 8000, 8080, 8443, 8883, 9000, 9100]
+
 class IoTScanner:
-    def __init__(self):
+    def __init__(self, store=None, full_rescan=False):
         self.devices = []
+        self.store = store  # Optional ScanStore for incremental rescans
+        self.full_rescan = full_rescan
         self.vulnerability_db = self.load_vulnerability_database()
         self.device_fingerprints = self.load_device_fingerprints()
         self.scan_results = {
@@ -161,9 +169,7 @@ class IoTScanner:
     def port_scan(self, ip, ports=None, scan_type='syn'):
         """Perform port scan on target device"""
         if ports is None:
-            # Common IoT ports
-            ports = [21, 22, 23, 25, 53, 80, 110, 143, 443, 515, 554, 631, 993, 995, 
-                    1900, 5000, 8000, 8080, 8443, 8883, 9000, 9100]
+            ports = IOT_PORTS
         
         nm = nmap.PortScanner()
         
@@ -179,12 +185,16 @@ class IoTScanner:
             
             if ip in result['scan']:
                 host_info = result['scan'][ip]
+                tcp_info = host_info.get('tcp', {})
                 return {
                     'open_ports': [port for port in host_info.get('tcp', {}) 
                                  if host_info['tcp'][port]['state'] == 'open'],
                     'services': self.extract_services(host_info.get('tcp', {})),
                     'os_info': host_info.get('osmatch', []),
-                    'status': host_info.get('status', {}).get('state', 'unknown')
+                    'status': host_info.get('status', {}).get('state', 'unknown'),
+                    # Ports nmap folds into "Not shown" are closed
+                    'port_states': {port: tcp_info[port]['state'] if port in tcp_info else 'closed'
+                                    for port in ports}
                 }
         except Exception as e:
             print(f"[-] Error scanning {ip}: {e}")
@@ -339,8 +349,16 @@ class IoTScanner:
         """Perform comprehensive security analysis on a device"""
         print(f"[+] Analyzing device {device['ip']}")
         
-        # Port scan
-        scan_result = self.port_scan(device['ip'], scan_type=scan_type)
+        # Port scan, skipping ports whose stored closed or filtered state is fresh
+        history = self.store.history(device['ip']) if self.store is not None else None
+        ports = IOT_PORTS
+        if history and not self.full_rescan:
+            ports = history.ports_to_probe(IOT_PORTS)
+        if ports:
+            scan_result = self.port_scan(device['ip'], ports=ports, scan_type=scan_type)
+        else:
+            scan_result = {'open_ports': [], 'services': [], 'os_info': [], 'port_states': {},
+                           'status': history.value(HOST_PROBE, 'status') or 'unknown'}
         
         # Identify device type
         banners = [s.get('banner', '') for s in scan_result['services']]
@@ -349,12 +367,18 @@ class IoTScanner:
         # Security assessment
         vulnerabilities = []
         
-        # Check for default credentials
+        # Check for default credentials, reusing fresh results for ports that stayed open
+        checked = []
         for service in scan_result['services']:
             if service['service'].lower() in ['http', 'https']:
-                vulns = self.check_default_credentials(
-                    device['ip'], service['port'], service['service']
-                )
+                vulns = None
+                if history and not self.full_rescan:
+                    vulns = history.reusable(service['port'], 'credentials')
+                if vulns is None:
+                    vulns = self.check_default_credentials(
+                        device['ip'], service['port'], service['service']
+                    )
+                    checked.append((service['port'], 'credentials', vulns))
                 vulnerabilities.extend(vulns)
         
         # Check for known exploits
@@ -394,6 +418,17 @@ class IoTScanner:
             'os_info': scan_result['os_info']
         }
         
+        # Record this run and compare it with the stored results
+        if self.store is not None and 'port_states' in scan_result:
+            port_states = scan_result['port_states']
+            analyzed_device['changes'] = diff_host(history, port_states, scan_result['services'], vulnerabilities)
+            results = [(port, 'port', state) for port, state in port_states.items()]
+            results.extend((service['port'], 'banner', service) for service in scan_result['services'])
+            results.extend(checked)
+            results.append((HOST_PROBE, 'vulnerabilities', vulnerabilities))
+            results.append((HOST_PROBE, 'status', scan_result['status']))
+            self.store.update(history, results)
+        
         return analyzed_device
     
     def assess_encryption(self, services):
@@ -511,10 +546,17 @@ def main():
     parser.add_argument('--threads', type=int, default=10, 
                        help='Number of threads for parallel scanning')
     parser.add_argument('--output', help='Output filename for results')
+    parser.add_argument('--cache', metavar='FILE',
+                       help='SQLite result store; rescans skip fresh results and report changes')
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL / 3600,
+                       help='Hours a stored result stays fresh (default %(default)g)')
+    parser.add_argument('--full-rescan', action='store_true',
+                       help='Probe everything even if fresh, still recording and diffing against the cache')
     
     args = parser.parse_args()
     
-    scanner = IoTScanner()
+    store = ScanStore(args.cache, ttl=args.cache_ttl * 3600) if args.cache else None
+    scanner = IoTScanner(store, args.full_rescan)
     
     try:
         devices = scanner.scan_network(
@@ -544,6 +586,9 @@ def main():
         print("\n[+] Scan interrupted by user")
     except Exception as e:
         print(f"[-] Error during scan: {e}")
+    finally:
+        if store is not None:
+            store.close()
 
 if __name__ == "__main__":
     main()
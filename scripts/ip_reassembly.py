@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+IP Reassembly - Bounded IPv4/IPv6 fragment reassembly
+Rebuilds fragmented datagrams so ports and payloads can be inspected
+
+Pending datagrams are keyed by (version, source, destination, id, protocol)
+and kept in arrival order, so timeouts and evictions pop from the oldest
+end. Memory is capped both by the number of pending datagrams and by the
+bytes they hold: a fragment that would take the held bytes over the cap
+first evicts older datagrams, and its own datagram is dropped when that
+is not enough. Datagrams that would exceed the IP maximum or receive a
+fragment overlapping one already held are discarded, as a reassembling
+host would (RFC 5722 for IPv6); an identical retransmission is ignored.
+"""
+
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+MAX_DATAGRAM = 65535
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_DATAGRAMS = 4096
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+
+class PendingDatagram:
+    """Fragments received so far for one datagram"""
+
+    __slots__ = ('first_seen', 'fragments', 'offsets', 'total_length', 'bytes', 'frames')
+
+    def __init__(self, now):
+        self.first_seen = now
+        self.fragments = {}
+        self.offsets = []  # Sorted keys of ``fragments``
+        self.total_length = None
+        self.bytes = 0
+        self.frames = 0
+
+
+class FragmentReassembler:
+    """Reassemble IP fragments within fixed time and memory limits"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_datagrams=DEFAULT_MAX_DATAGRAMS,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.timeout = timeout
+        self.max_datagrams = max_datagrams
+        self.max_bytes = max_bytes
+        self.pending = OrderedDict()
+        self.pending_bytes = 0
+        self.counters = {
+            'fragments': 0,
+            'reassembled': 0,
+            'timed_out': 0,
+            'evicted': 0,
+            'invalid': 0
+        }
+
+    def add(self, key, offset, more, data, now):
+        """Add one fragment
+
+        ``offset`` is in bytes and ``more`` is the more-fragments flag.
+        Returns the reassembled transport payload once the datagram is
+        complete, otherwise None.
+        """
+        self.counters['fragments'] += 1
+        self.expire(now)
+
+        datagram = self.pending.get(key)
+        if datagram is None:
+            while len(self.pending) >= self.max_datagrams:
+                self._drop(next(iter(self.pending)), 'evicted')
+            datagram = PendingDatagram(now)
+            self.pending[key] = datagram
+
+        end = offset + len(data)
+        if end > MAX_DATAGRAM or (more and len(data) % 8) or \
+                (datagram.total_length is not None and end > datagram.total_length):
+            self._drop(key, 'invalid')
+            return None
+
+        existing = datagram.fragments.get(offset)
+        if existing is not None:
+            if existing != data:
+                self._drop(key, 'invalid')
+            return None  # Retransmitted fragment
+
+        offsets = datagram.offsets
+        index = bisect_left(offsets, offset)
+        if (index and offsets[index - 1] + len(datagram.fragments[offsets[index - 1]]) > offset) or \
+                (index < len(offsets) and offsets[index] < end):
+            self._drop(key, 'invalid')  # Overlaps a fragment already held
+            return None
+
+        if not more:
+            if datagram.total_length is not None and datagram.total_length != end:
+                self._drop(key, 'invalid')
+                return None
+            if offsets and offsets[-1] + len(datagram.fragments[offsets[-1]]) > end:
+                self._drop(key, 'invalid')  # A held fragment ends past the last one
+                return None
+            datagram.total_length = end
+
+        if self.pending_bytes + len(data) > self.max_bytes and not self._make_room(key, len(data)):
+            self._drop(key, 'evicted')
+            return None
+
+        datagram.fragments[offset] = data
+        insort(offsets, offset)
+        datagram.bytes += len(data)
+        datagram.frames += 1
+        self.pending_bytes += len(data)
+
+        if datagram.total_length is None or datagram.bytes < datagram.total_length:
+            return None
+        return self._assemble(key, datagram)
+
+    def _make_room(self, key, size):
+        """Evict the oldest other datagrams until ``size`` more bytes fit"""
+        for other in list(self.pending):
+            if self.pending_bytes + size <= self.max_bytes:
+                break
+            if other != key:
+                self._drop(other, 'evicted')
+        return self.pending_bytes + size <= self.max_bytes
+
+    def _assemble(self, key, datagram):
+        """Join the fragments, which cannot overlap, once they tile the datagram"""
+        parts = []
+        position = 0
+        for offset in datagram.offsets:
+            if offset != position:
+                self._drop(key, 'invalid')
+                return None
+            fragment = datagram.fragments[offset]
+            parts.append(fragment)
+            position += len(fragment)
+
+        del self.pending[key]
+        self.pending_bytes -= datagram.bytes
+        self.counters['reassembled'] += 1
+        return b''.join(parts)
+
+    def expire(self, now):
+        """Discard datagrams that did not complete within the timeout"""
+        pending = self.pending
+        while pending:
+            key, datagram = next(iter(pending.items()))
+            if now - datagram.first_seen < self.timeout:
+                break
+            self._drop(key, 'timed_out')
+
+    def _drop(self, key, reason):
+        datagram = self.pending.pop(key)
+        self.pending_bytes -= datagram.bytes
+        self.counters[reason] += 1
+
+    def snapshot(self):
+        """Mergeable reassembly counters"""
+        snapshot = dict(self.counters)
+        snapshot['pending'] = len(self.pending)
+        snapshot['pending_bytes'] = self.pending_bytes
+        return snapshot
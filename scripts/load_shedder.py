@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Load Shedder - Flow-sampled deep inspection under a CPU and queue budget
+Keeps header accounting exact while payload inspection degrades gracefully
+
+Once per window the shedder compares the CPU time the processing thread
+used with the wall-clock time that passed, and looks at two queue
+signals: new kernel drops and how full the input queue is. While every
+signal is within budget all flows are inspected. Over budget, the share
+of inspected flows is cut in proportion to the excess (halved on drops or
+a full queue) down to a floor, and grown back gradually once the load
+falls below the low-water mark.
+
+Sampling is by flow hash, so an inspected flow keeps all of its packets
+and TCP streams stay contiguous; flows that already produced threats are
+always inspected. Each inspected packet carries a weight of one over its
+inclusion probability, which gives unbiased estimates of what full
+inspection would have found.
+"""
+
+import time
+
+DEFAULT_CPU_BUDGET = 0.8
+DEFAULT_WINDOW = 1.0
+DEFAULT_MIN_RATE = 1 / 64
+# Input queue fill fraction treated as overload
+DEFAULT_QUEUE_BUDGET = 0.5
+# Grow the inspected share again below this fraction of the CPU budget
+LOW_WATER = 0.7
+RECOVERY_FACTOR = 1.25
+
+SAMPLE_BITS = 16
+SAMPLE_SPACE = 1 << SAMPLE_BITS
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+class LoadShedder:
+    """Adaptive share of flows that get payload inspection"""
+
+    def __init__(self, cpu_budget=DEFAULT_CPU_BUDGET, window=DEFAULT_WINDOW,
+                 min_rate=DEFAULT_MIN_RATE, queue_budget=DEFAULT_QUEUE_BUDGET):
+        self.cpu_budget = cpu_budget
+        self.window = window
+        self.min_rate = min_rate
+        self.queue_budget = queue_budget
+        self.rate = 1.0
+        self.threshold = SAMPLE_SPACE
+        self.shedding = False
+        self.load = 0.0
+        self.next_update = 0
+        self.window_start = None
+        self.cpu_start = None
+        self.last_drops = None
+        self.counters = {
+            'sampled': 0,
+            'priority': 0,
+            'shed': 0,
+            'overloaded_windows': 0,
+            'estimated_threats': 0.0
+        }
+
+    def update(self, now, drops=0, backlog=0.0):
+        """Re-evaluate the inspected share; called once per window
+
+        ``now`` is the packet clock that schedules the next update,
+        ``drops`` the cumulative kernel drop count and ``backlog`` the
+        input queue fill fraction.
+        """
+        self.next_update = now + self.window
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        if self.window_start is None:
+            self.window_start = wall
+            self.cpu_start = cpu
+            self.last_drops = drops
+            return
+        elapsed = wall - self.window_start
+        if elapsed <= 0:
+            return
+        self.load = (cpu - self.cpu_start) / elapsed
+        new_drops = drops - self.last_drops
+        self.window_start = wall
+        self.cpu_start = cpu
+        self.last_drops = drops
+
+        rate = self.rate
+        if new_drops > 0 or backlog > self.queue_budget:
+            self.counters['overloaded_windows'] += 1
+            rate *= min(0.5, self.cpu_budget / self.load) if self.load else 0.5
+        elif self.load > self.cpu_budget:
+            self.counters['overloaded_windows'] += 1
+            rate *= self.cpu_budget / self.load
+        elif self.load < self.cpu_budget * LOW_WATER:
+            rate *= RECOVERY_FACTOR
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        self.rate = min(1.0, max(self.min_rate, rate))
+        self.threshold = int(self.rate * SAMPLE_SPACE)
+        self.shedding = self.rate < 1.0
+
+    def inspect(self, key, priority):
+        """Whether the flow ``key`` gets payload inspection; returns its weight or 0"""
+        counters = self.counters
+        if priority:
+            counters['priority'] += 1
+            return 1.0
+        if ((hash(key) * HASH_MULTIPLIER) >> SAMPLE_BITS) % SAMPLE_SPACE < self.threshold:
+            counters['sampled'] += 1
+            return 1 / self.rate
+        counters['shed'] += 1
+        return 0
+
+    def snapshot(self):
+        """Mergeable shedding counters"""
+        snapshot = dict(self.counters)
+        snapshot['shedding'] = 1 if self.shedding else 0
+        return snapshot
@@ -5,43 +5,111 @@ Real-time network monitoring with threat detection and deep packet inspection
 """
 
 import socket
-import struct
 import threading
 import json
 import time
 import sys
 from datetime import datetime
-from collections import defaultdict, deque
-import subprocess
-import re
+from collections import defaultdict
+import argparse
+import ipaddress
+
+from pcap_file import PcapReader, LINKTYPE_ETHERNET
+from packet_ring import PacketRing, update_kernel_stats
+from capture_pipeline import CapturePipeline, SNAPSHOT_PACKETS, SNAPSHOT_INTERVAL
+from signature_engine import SignatureEngine, StreamMatchState, load_rules
+from packet_view import decode_packet, SEVERITY_ORDER
+from flow_table import FlowTable, FlowRecordWriter, flow_key, IPV6_KEY_FLAG
+from rate_metrics import RateMetrics, summarize_rates
+from behaviour_detector import BehaviourDetector
+from bpf_filter import compile_filter, attach_filter, run_filter
+from capture_writer import CaptureWriter
+from packet_store import PacketStore, DEFAULT_CAPACITY
+from ip_reassembly import FragmentReassembler
+from tcp_reassembly import TcpReassembler, GAP
+from stats_server import LiveStatsServer, parse_listen, DEFAULT_PORT
+from stage_profiler import StageProfiler, summarize_profile, format_prometheus, DEFAULT_SAMPLE_EVERY
+from load_shedder import LoadShedder, DEFAULT_CPU_BUDGET
+from service_db import default_database
+
+# Busiest flows and newest packets included in each published snapshot
+PUBLISHED_FLOWS = 100
+PUBLISHED_PACKETS = 100
+# Threat batches kept in the published snapshot for readers that poll slower than it is published
+PUBLISHED_THREAT_BATCHES = 20
+PUBLISHED_THREATS = 1000
 
 class PacketAnalyzer:
-    def __init__(self):
-        self.packets = deque(maxlen=1000)  # Store last 1000 packets
+    def __init__(self, rules_file=None, flow_export=None, stream_options=None, store_packets=DEFAULT_CAPACITY):
+        self.packets = PacketStore(store_packets)  # Columnar ring of recent packets
+        self.export_packet_count = 1000
         self.stats = {
             'total_packets': 0,
             'total_bytes': 0,
             'threats_detected': 0,
-            'protocols': defaultdict(int),
-            'connections': defaultdict(int),
-            'bandwidth_usage': deque(maxlen=60)  # Last 60 seconds
+            'protocols': defaultdict(int)
         }
+        self.rates = RateMetrics()  # Per-second and per-minute counters
+        self.rules_file = rules_file
+        self.flow_export = flow_export
+        self.flow_writer = FlowRecordWriter(flow_export) if flow_export else None
+        self.flow_table = FlowTable(exporter=self.flow_writer)
+        self.stream_options = stream_options
+        self.record_writer = None
+        self.frame_writer = None
+        if stream_options:
+            self.open_stream_writers(stream_options)
         self.threat_signatures = self.load_threat_signatures()
+        if rules_file:
+            self.threat_signatures.update(load_rules(rules_file))
+        self.signature_engine = SignatureEngine(self.threat_signatures)
+        self.behaviour = BehaviourDetector()
+        self.reassembler = FragmentReassembler()
+        self.tcp_reassembly = TcpReassembler()
+        self.protocol_map = dict(default_database().port_names)  # Shared with the scanners
+        self.protocol_names = {}
         self.monitoring = False
+        self.last_packet_time = None
+        self.capture_backend = None
+        self.capture_socket = None
+        self.capture_ring = None
+        self.kernel_stats = {}
+        self.capture_filter = None
+        self.bpf_program = None
+        self.capture_cpu_time = 0.0
+        self.pipeline = None
+        # Statistics the capture thread hands to other threads during live capture
+        self.published = None
+        self.next_publish = 0
+        # Stage functions are looked up on the instance so profiling can wrap them
+        self.decode_packet = decode_packet
+        self.profiler = None
+        self.errors = defaultdict(int)  # Processing failures by exception type
+        self.shedder = None
+        self.input_backlog = None  # Fill fraction of the input queue, set by pipeline workers
         
+    def open_stream_writers(self, options):
+        """Create background writers for streaming packet records and frames
+
+        ``options`` holds ``prefix``, ``formats`` (``'ndjson'`` and/or
+        ``'pcapng'``) and the ``CaptureWriter`` settings ``compression``,
+        ``rotate_bytes``, ``rotate_seconds`` and ``block``.
+        """
+        settings = {
+            'compression': options.get('compression'),
+            'rotate_bytes': options.get('rotate_bytes'),
+            'rotate_seconds': options.get('rotate_seconds'),
+            'block': options.get('block', False)
+        }
+        if 'ndjson' in options['formats']:
+            self.record_writer = CaptureWriter(options['prefix'], 'ndjson', **settings)
+        if 'pcapng' in options['formats']:
+            self.frame_writer = CaptureWriter(options['prefix'], 'pcapng', **settings)
+    
     def load_threat_signatures(self):
         """Load threat detection signatures"""
+        # Port scans and floods are behavioural, see BehaviourDetector
         return {
-            'port_scan': {
-                'pattern': r'SYN.*RST|SYN.*FIN',
-                'description': 'Port scan attempt detected',
-                'severity': 'High'
-            },
-            'dos_attack': {
-                'pattern': r'ICMP.*flood|UDP.*flood',
-                'description': 'Potential DoS attack',
-                'severity': 'High'
-            },
             'suspicious_dns': {
                 'pattern': r'DNS.*[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}',
                 'description': 'Suspicious DNS query to IP address',
@@ -59,360 +127,850 @@ class PacketAnalyzer:
             }
         }
     
-    def parse_ethernet_header(self, packet):
-        """Parse Ethernet header"""
-        eth_header = struct.unpack('!6s6sH', packet[:14])
-        eth_protocol = socket.ntohs(eth_header[2])
-        return eth_protocol, packet[14:]
-    
-    def parse_ip_header(self, packet):
-        """Parse IP header"""
-        ip_header = struct.unpack('!BBHHHBBH4s4s', packet[:20])
-        
-        version_ihl = ip_header[0]
-        version = version_ihl >> 4
-        ihl = version_ihl & 0xF
-        iph_length = ihl * 4
-        
-        ttl = ip_header[5]
-        protocol = ip_header[6]
-        s_addr = socket.inet_ntoa(ip_header[8])
-        d_addr = socket.inet_ntoa(ip_header[9])
-        
-        return {
-            'version': version,
-            'header_length': iph_length,
-            'ttl': ttl,
-            'protocol': protocol,
-            'source': s_addr,
-            'destination': d_addr
-        }, packet[iph_length:]
-    
-    def parse_tcp_header(self, packet):
-        """Parse TCP header"""
-        tcp_header = struct.unpack('!HHLLBBHHH', packet[:20])
-        
-        source_port = tcp_header[0]
-        dest_port = tcp_header[1]
-        sequence = tcp_header[2]
-        acknowledgement = tcp_header[3]
-        doff_reserved = tcp_header[4]
-        tcph_length = doff_reserved >> 4
-        
-        flags = tcp_header[5]
-        flag_urg = (flags & 32) >> 5
-        flag_ack = (flags & 16) >> 4
-        flag_psh = (flags & 8) >> 3
-        flag_rst = (flags & 4) >> 2
-        flag_syn = (flags & 2) >> 1
-        flag_fin = flags & 1
-        
-        return {
-            'source_port': source_port,
-            'dest_port': dest_port,
-            'sequence': sequence,
-            'acknowledgement': acknowledgement,
-            'flags': {
-                'urg': flag_urg,
-                'ack': flag_ack,
-                'psh': flag_psh,
-                'rst': flag_rst,
-                'syn': flag_syn,
-                'fin': flag_fin
-            }
-        }, packet[tcph_length * 4:]
-    
-    def parse_udp_header(self, packet):
-        """Parse UDP header"""
-        udp_header = struct.unpack('!HHHH', packet[:8])
-        
-        source_port = udp_header[0]
-        dest_port = udp_header[1]
-        length = udp_header[2]
-        checksum = udp_header[3]
-        
-        return {
-            'source_port': source_port,
-            'dest_port': dest_port,
-            'length': length,
-            'checksum': checksum
-        }, packet[8:]
-    
-    def detect_protocol(self, ip_info, transport_info):
+    def detect_protocol(self, packet):
         """Detect application layer protocol"""
-        if 'source_port' not in transport_info:
-            return 'ICMP'
-        
-        port = transport_info.get('dest_port', 0)
-        
-        protocol_map = {
-            20: 'FTP-DATA',
-            21: 'FTP',
-            22: 'SSH',
-            23: 'TELNET',
-            25: 'SMTP',
-            53: 'DNS',
-            67: 'DHCP',
-            68: 'DHCP',
-            80: 'HTTP',
-            110: 'POP3',
-            143: 'IMAP',
-            443: 'HTTPS',
-            993: 'IMAPS',
-            995: 'POP3S'
-        }
+        if not packet.has_ports:
+            return 'ICMPv6' if packet.ip_proto == 58 else 'ICMP'
         
-        return protocol_map.get(port, f'TCP/{port}' if ip_info['protocol'] == 6 else f'UDP/{port}')
+        key = (packet.ip_proto << 16) | packet.dst_port
+        protocol = self.protocol_names.get(key)
+        if protocol is None:
+            port = packet.dst_port
+            protocol = self.protocol_map.get(port, f'TCP/{port}' if packet.ip_proto == 6 else f'UDP/{port}')
+            self.protocol_names[key] = protocol
+        return protocol
     
-    def analyze_threat(self, packet_info, payload):
+    def analyze_threat(self, packet, payload):
         """Analyze packet for potential threats"""
-        threats = []
+        # Under overload only a sample of flows gets payload inspection
+        shedder = self.shedder
+        weight = 1.0
+        if shedder is not None and shedder.shedding:
+            weight = self.inspection_weight(packet)
         
-        # Convert payload to string for pattern matching
-        try:
-            payload_str = payload.decode('utf-8', errors='ignore')
-        except:
-            payload_str = str(payload)
-        
-        # Check against threat signatures
-        for threat_name, signature in self.threat_signatures.items():
-            if re.search(signature['pattern'], payload_str, re.IGNORECASE):
-                threats.append({
-                    'type': threat_name,
-                    'description': signature['description'],
-                    'severity': signature['severity']
-                })
-        
-        # Additional heuristic checks
-        if packet_info.get('transport_info', {}).get('flags', {}).get('syn') and \
-           packet_info.get('transport_info', {}).get('flags', {}).get('rst'):
-            threats.append({
-                'type': 'port_scan',
-                'description': 'SYN-RST pattern indicates port scanning',
-                'severity': 'High'
-            })
+        # Check against threat signatures in a single pass over the raw bytes;
+        # TCP is matched over the reassembled stream so split patterns are seen
+        if not weight:
+            threats = []
+        elif packet.ip_proto == 6 and packet.has_ports:
+            threats = self.scan_tcp_stream(packet)
+        else:
+            threats = self.signature_engine.match(payload)
+        
+        # Port scans, host sweeps and floods over sliding windows
+        threats.extend(self.behaviour.observe(packet, packet.ip_proto != 17 or self.starts_flow(packet)))
         
         # Check for suspicious port combinations
-        dest_port = packet_info.get('transport_info', {}).get('dest_port', 0)
-        if dest_port in [1337, 31337, 4444, 5555]:  # Common backdoor ports
+        dest_port = packet.dst_port
+        if dest_port in (1337, 31337, 4444, 5555):  # Common backdoor ports
             threats.append({
                 'type': 'backdoor_port',
                 'description': f'Connection to suspicious port {dest_port}',
                 'severity': 'High'
             })
         
+        if shedder is not None and threats:
+            shedder.counters['estimated_threats'] += weight
         return threats
     
-    def process_packet(self, packet):
-        """Process and analyze a single packet"""
+    def starts_flow(self, packet):
+        """Whether a packet opens a new flow (checked before the flow table sees it)"""
+        ip_proto = packet.ip_proto if packet.ip_version == 4 else packet.ip_proto | IPV6_KEY_FLAG
+        key, _forward = flow_key(ip_proto, packet.src_addr, packet.src_port,
+                                 packet.dst_addr, packet.dst_port)
+        return key not in self.flow_table.flows
+    
+    def inspection_weight(self, packet):
+        """Sampling weight of a packet's payload inspection; 0 when it is shed"""
+        ip_proto = packet.ip_proto if packet.ip_version == 4 else packet.ip_proto | IPV6_KEY_FLAG
+        key, forward = flow_key(ip_proto, packet.src_addr, packet.src_port,
+                                packet.dst_addr, packet.dst_port)
+        # Flows that already produced threats are always inspected
+        flow = self.flow_table.flows.get(key)
+        weight = self.shedder.inspect(key, flow is not None and flow.threats > 0)
+        if not weight and packet.ip_proto == 6 and packet.has_ports:
+            stream = self.tcp_reassembly.skip(key << 1 | forward, packet)
+            if stream is not None and stream.match_state is not None:
+                stream.match_state.gap()
+        return weight
+    
+    def scan_tcp_stream(self, packet):
+        """Feed a TCP segment to its stream and match the newly contiguous bytes"""
+        ip_proto = 6 if packet.ip_version == 4 else 6 | IPV6_KEY_FLAG
+        key, forward = flow_key(ip_proto, packet.src_addr, packet.src_port,
+                                packet.dst_addr, packet.dst_port)
+        stream, chunks = self.tcp_reassembly.feed(key << 1 | forward, packet)
+        if not chunks:
+            return []
+        
+        state = stream.match_state
+        if state is None:
+            state = stream.match_state = StreamMatchState()
+        threats = []
+        for chunk in chunks:
+            if chunk is GAP:
+                state.gap()
+            else:
+                threats.extend(self.signature_engine.scan_stream(state, chunk))
+        return threats
+    
+    def process_packet(self, packet, timestamp=None, packet_size=None):
+        """Process and analyze a single packet
+
+        ``timestamp`` (epoch seconds) and ``packet_size`` (original wire
+        length) default to the current time and ``len(packet)``; offline
+        analysis passes the values recorded in the capture file.
+        
+        Returns a lazily decoded ``PacketView``; call ``to_dict()`` on it
+        for the JSON-shaped record.
+        """
         try:
-            packet_size = len(packet)
-            timestamp = datetime.now()
+            if packet_size is None:
+                packet_size = len(packet)
+            if timestamp is None:
+                timestamp = time.time()
+            if self.shedder is not None and timestamp >= self.shedder.next_update:
+                self.shedder.update(timestamp, *self.load_signals())
             
-            # Parse Ethernet header
-            eth_protocol, ip_packet = self.parse_ethernet_header(packet)
+            # Raw frames are streamed before decoding, so non-IP traffic is kept too
+            if self.frame_writer is not None:
+                self.frame_writer.submit((bytes(packet), timestamp, packet_size))
             
-            if eth_protocol != 0x0800:  # Not IPv4
-                return None
-            
-            # Parse IP header
-            ip_info, transport_packet = self.parse_ip_header(ip_packet)
+            # Parse link, IP (through VLANs and tunnels) and transport headers
+            view = self.decode_packet(packet, timestamp, packet_size, self.stats['total_packets'],
+                                 self.reassembler)
             
-            # Parse transport layer
-            transport_info = {}
-            payload = b''
+            if view is None:  # Not IP
+                return None
             
-            if ip_info['protocol'] == 6:  # TCP
-                transport_info, payload = self.parse_tcp_header(transport_packet)
-                transport_protocol = 'TCP'
-            elif ip_info['protocol'] == 17:  # UDP
-                transport_info, payload = self.parse_udp_header(transport_packet)
-                transport_protocol = 'UDP'
+            if view.fragment:
+                # Held for reassembly; the fragment completing the datagram
+                # carries its ports and payload
+                view.protocol = 'FRAGMENT'
             else:
-                transport_protocol = 'OTHER'
-                payload = transport_packet
-            
-            # Detect application protocol
-            app_protocol = self.detect_protocol(ip_info, transport_info)
-            
-            # Analyze for threats
-            packet_info = {
-                'ip_info': ip_info,
-                'transport_info': transport_info,
-                'protocol': app_protocol
-            }
-            threats = self.analyze_threat(packet_info, payload)
-            
-            # Create packet record
-            packet_record = {
-                'id': f"{timestamp.timestamp()}_{self.stats['total_packets']}",
-                'timestamp': timestamp.isoformat(),
-                'source': ip_info['source'],
-                'destination': ip_info['destination'],
-                'protocol': app_protocol,
-                'transport_protocol': transport_protocol,
-                'size': packet_size,
-                'threats': threats,
-                'threat_level': self.get_max_threat_level(threats),
-                'source_port': transport_info.get('source_port', 0),
-                'dest_port': transport_info.get('dest_port', 0),
-                'flags': transport_info.get('flags', {}),
-                'payload_preview': payload[:100].hex() if payload else ''
-            }
+                # Detect application protocol and analyze for threats
+                view.protocol = self.detect_protocol(view)
+                view.threats = self.analyze_threat(view, view.payload)
             
             # Update statistics
-            self.update_stats(packet_record)
+            self.update_stats(view)
             
             # Store packet
-            self.packets.append(packet_record)
+            self.packets.append(view)
+            if self.record_writer is not None:
+                view.detach()
+                self.record_writer.submit(view)
             
-            return packet_record
+            return view
             
         except Exception as e:
-            print(f"Error processing packet: {e}")
+            # Counted by type; only the first of each type is printed
+            name = type(e).__name__
+            if type(e).__module__ != 'builtins':
+                name = f"{type(e).__module__}.{name}"
+            self.errors[name] += 1
+            if self.errors[name] == 1:
+                print(f"[-] Error processing packet: {name}: {e}")
             return None
     
+    def load_signals(self):
+        """Kernel drops and input queue fill fraction for the load shedder"""
+        backlog = self.input_backlog() if self.input_backlog is not None else 0.0
+        return self.kernel_stats.get('drops', 0), backlog
+    
+    def enable_load_shedding(self, cpu_budget=DEFAULT_CPU_BUDGET):
+        """Shed payload inspection when processing exceeds ``cpu_budget``
+
+        Headers are still decoded and counted for every packet; see
+        ``LoadShedder``. Worker processes started afterwards shed too.
+        """
+        self.shedder = LoadShedder(cpu_budget)
+    
+    def enable_profiling(self, sample_every=DEFAULT_SAMPLE_EVERY):
+        """Time one in ``sample_every`` calls of each packet-processing stage
+
+        The stage functions are replaced by sampling wrappers on this
+        analyzer, so call this before capture starts. Nested stages are
+        timed inclusively: 'total' covers everything, 'stats' includes
+        'flows'. Worker processes started afterwards profile too.
+        """
+        profiler = self.profiler = StageProfiler(sample_every)
+        self.decode_packet = profiler.wrap('decode', self.decode_packet)
+        self.detect_protocol = profiler.wrap('classify', self.detect_protocol)
+        self.scan_tcp_stream = profiler.wrap('signatures', self.scan_tcp_stream)
+        self.signature_engine.match = profiler.wrap('signatures', self.signature_engine.match)
+        self.behaviour.observe = profiler.wrap('behaviour', self.behaviour.observe)
+        self.update_stats = profiler.wrap('stats', self.update_stats)
+        self.flow_table.update = profiler.wrap('flows', self.flow_table.update)
+        self.packets.append = profiler.wrap('store', self.packets.append)
+        if self.record_writer is not None:
+            self.record_writer.submit = profiler.wrap('export', self.record_writer.submit)
+        self.process_packet = profiler.wrap('total', self.process_packet)
+    
     def get_max_threat_level(self, threats):
         """Get the maximum threat level from a list of threats"""
         if not threats:
             return 'None'
         
-        severity_order = {'Low': 1, 'Medium': 2, 'High': 3, 'Critical': 4}
-        max_severity = max(threats, key=lambda t: severity_order.get(t['severity'], 0))
+        max_severity = max(threats, key=lambda t: SEVERITY_ORDER.get(t['severity'], 0))
         return max_severity['severity']
     
-    def update_stats(self, packet_record):
+    def update_stats(self, packet):
         """Update monitoring statistics"""
         self.stats['total_packets'] += 1
-        self.stats['total_bytes'] += packet_record['size']
+        self.stats['total_bytes'] += packet.size
         
-        if packet_record['threats']:
+        if packet.threats:
             self.stats['threats_detected'] += 1
         
-        self.stats['protocols'][packet_record['protocol']] += 1
+        self.stats['protocols'][packet.protocol] += 1
         
-        connection_key = f"{packet_record['source']}:{packet_record.get('source_port', 0)}"
-        self.stats['connections'][connection_key] += 1
+        if not packet.fragment:
+            self.flow_table.update(packet)
         
-        # Update bandwidth usage (bytes per second)
-        current_time = time.time()
-        self.stats['bandwidth_usage'].append({
-            'timestamp': current_time,
-            'bytes': packet_record['size']
-        })
+        # Update per-second/per-minute rate buckets
+        self.last_packet_time = packet.timestamp
+        self.rates.add(packet.timestamp, packet.size, packet.threats, packet.protocol)
     
-    def start_capture(self, interface='eth0', duration=None):
-        """Start packet capture"""
-        print(f"[+] Starting packet capture on interface {interface}")
+    def set_capture_filter(self, expression):
+        """Compile a tcpdump-style filter expression to classic BPF
+
+        The program is attached to the capture socket, so the kernel drops
+        non-matching frames before they are copied to userspace.
+        """
+        self.bpf_program = compile_filter(expression)
+        self.capture_filter = expression
+        print(f"[+] Compiled capture filter '{expression}' ({len(self.bpf_program)} BPF instructions)")
+    
+    def start_capture(self, interface='eth0', duration=None, backend='socket'):
+        """Start packet capture
+
+        ``backend`` selects ``'socket'`` (one ``recvfrom`` per packet) or
+        ``'ring'`` (TPACKET_V3 shared-memory ring, processed block by block).
+        """
+        print(f"[+] Starting packet capture on interface {interface} ({backend} backend)")
         self.monitoring = True
+        self.capture_backend = backend
+        cpu_start = time.process_time()
         
         try:
-            # Create raw socket
-            sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.ntohs(0x0003))
-            sock.bind((interface, 0))
-            
-            start_time = time.time()
+            self.publish_snapshot()
+            if backend == 'ring':
+                self._capture_ring(interface, duration)
+            else:
+                self._capture_socket(interface, duration)
+                    
+        except PermissionError:
+            print("[-] Permission denied. Run as root or with CAP_NET_RAW capability")
+            return False
+        except Exception as e:
+            print(f"[-] Error starting capture: {e}")
+            return False
+        finally:
+            self.monitoring = False
+            self.published = None
+            self.stop_pipeline()
+            self.capture_cpu_time = time.process_time() - cpu_start
             
+        return True
+    
+    def _capture_socket(self, interface, duration):
+        """Capture loop reading one packet per recvfrom call"""
+        # Create raw socket
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.ntohs(0x0003))
+        if self.bpf_program:
+            attach_filter(sock, self.bpf_program)
+        sock.bind((interface, 0))
+        sock.settimeout(1.0)  # Lets duration and stop_capture take effect when idle
+        self.capture_socket = sock
+        
+        handle_frame = self.frame_handler()
+        start_time = time.time()
+        
+        try:
             while self.monitoring:
-                if duration and (time.time() - start_time) > duration:
+                now = time.time()
+                if duration and (now - start_time) > duration:
                     break
+                if now >= self.next_publish:
+                    self.publish_snapshot()
                 
                 try:
                     packet, addr = sock.recvfrom(65536)
-                    self.process_packet(packet)
+                    handle_frame(packet)
                 except socket.timeout:
                     continue
                 except Exception as e:
                     print(f"Error receiving packet: {e}")
                     continue
-                    
-        except PermissionError:
-            print("[-] Permission denied. Run as root or with CAP_NET_RAW capability")
-            return False
-        except Exception as e:
-            print(f"[-] Error starting capture: {e}")
-            return False
         finally:
-            self.monitoring = False
-            
-        return True
+            self.get_kernel_statistics()
+            self.capture_socket = None
+            sock.close()
     
+    def _capture_ring(self, interface, duration):
+        """Capture loop draining whole TPACKET_V3 blocks zero-copy"""
+        ring = PacketRing(interface, bpf_program=self.bpf_program)
+        self.capture_ring = ring
+        
+        handle_frame = self.frame_handler()
+        start_time = time.time()
+        
+        try:
+            while self.monitoring:
+                now = time.time()
+                if duration and (now - start_time) > duration:
+                    break
+                if now >= self.next_publish:
+                    self.publish_snapshot()
+                
+                for timestamp, frame, wire_len in ring.read_blocks(timeout_ms=100):
+                    handle_frame(frame, timestamp, wire_len)
+        finally:
+            self.get_kernel_statistics()
+            self.capture_ring = None
+            ring.close()
+    
+    def publish_snapshot(self):
+        """Hand other threads a consistent copy of the live counters
+
+        Runs on the capture thread, the only writer of the analyzer's
+        state. Readers pick up the whole dict through one reference, so
+        the per-packet path needs no lock and readers never iterate
+        structures that are being modified. Threats stored since the last
+        publish are added as one ``(cursor, records)`` batch; the newest
+        batches are kept so readers can catch up by cursor.
+        """
+        previous = self.published
+        if self.pipeline is None:
+            threat_cursor = previous['threat_cursor'] if previous is not None else self.packets.written
+            threat_cursor, threats = self.packets.threats_after(threat_cursor, PUBLISHED_THREATS)
+            batches = previous['threats'] if previous is not None else []
+            if threats:
+                batches = batches[1 - PUBLISHED_THREAT_BATCHES:] + [(threat_cursor, threats)]
+            self.published = {
+                'stats': self.stats_snapshot(),
+                'flows': self.flow_table.top_flows(PUBLISHED_FLOWS),
+                'packets': self.packets.recent(PUBLISHED_PACKETS),
+                'threats': batches,
+                'threat_cursor': threat_cursor,
+                'kernel': self.get_kernel_statistics()
+            }
+        else:
+            self.published = {
+                'stats': None,
+                'flows': None,
+                'packets': None,
+                'threats': None,
+                'threat_cursor': None,
+                'kernel': self.get_kernel_statistics()
+            }
+        self.next_publish = time.time() + SNAPSHOT_INTERVAL
+    
+    def start_pipeline(self, workers):
+        """Shard packet processing across worker processes by flow hash"""
+        def make_worker_analyzer(shard):
+            # Each shard streams expired flows to its own file
+            flow_export = f"{self.flow_export}.{shard}" if self.flow_export else None
+            stream_options = None
+            if self.stream_options:
+                stream_options = dict(self.stream_options, prefix=f"{self.stream_options['prefix']}.{shard}")
+            analyzer = PacketAnalyzer(self.rules_file, flow_export, stream_options,
+                                      self.packets.capacity)
+            if self.profiler is not None:
+                analyzer.enable_profiling(self.profiler.sample_every)
+            if self.shedder is not None:
+                analyzer.enable_load_shedding(self.shedder.cpu_budget)
+            return analyzer
+        
+        self.pipeline = CapturePipeline(make_worker_analyzer, workers)
+        self.pipeline.start()
+    
+    def stop_pipeline(self):
+        """Drain the worker processes and keep their final statistics"""
+        if self.pipeline is not None:
+            self.pipeline.stop()
+    
+    def frame_handler(self, wait=False):
+        """Return the per-frame entry point for capture loops
+
+        With ``wait`` (file input) a full pipeline ring blocks until a
+        worker makes room instead of dropping the frame.
+        """
+        if self.pipeline is not None and self.pipeline.running:
+            return self.pipeline.dispatch_wait if wait else self.pipeline.dispatch
+        return self.process_packet
+    
+    def get_kernel_statistics(self):
+        """Get kernel receive/drop counters for the active capture socket"""
+        try:
+            if self.capture_ring is not None:
+                self.kernel_stats = self.capture_ring.statistics()
+            elif self.capture_socket is not None:
+                update_kernel_stats(self.capture_socket, self.kernel_stats)
+        except OSError:
+            pass
+        return dict(self.kernel_stats)
+    
+    def analyze_file(self, filename):
+        """Analyze packets from an existing pcap/pcapng capture file
+
+        The file is memory-mapped and streamed frame by frame through
+        ``process_packet``, so memory use does not grow with file size.
+        """
+        print(f"[+] Analyzing capture file {filename}")
+        processed = 0
+        skipped = 0
+        filtered = 0
+        program = self.bpf_program
+        start_time = time.time()
+
+        handle_frame = self.frame_handler(wait=True)
+        
+        try:
+            with PcapReader(filename) as reader:
+                print(f"[+] Detected {reader.format} format")
+                for timestamp, frame, orig_len, linktype in reader:
+                    if linktype != LINKTYPE_ETHERNET:
+                        skipped += 1
+                        continue
+                    # Same program the kernel would run on a live capture
+                    if program and not run_filter(program, frame):
+                        filtered += 1
+                        continue
+                    handle_frame(frame, timestamp, orig_len)
+                    processed += 1
+        finally:
+            self.stop_pipeline()
+
+        elapsed = time.time() - start_time
+        rate = processed / elapsed if elapsed > 0 else 0
+        print(f"[+] Processed {processed} packets in {elapsed:.2f}s ({rate:.0f} packets/s)")
+        if skipped:
+            print(f"[-] Skipped {skipped} frames with unsupported link types")
+        if filtered:
+            print(f"[+] Capture filter rejected {filtered} frames")
+
+        return processed
+
     def stop_capture(self):
         """Stop packet capture"""
         self.monitoring = False
         print("[+] Packet capture stopped")
     
-    def get_statistics(self):
-        """Get current monitoring statistics"""
-        # Calculate bandwidth
-        current_time = time.time()
-        recent_bandwidth = [
-            entry for entry in self.stats['bandwidth_usage']
-            if current_time - entry['timestamp'] <= 60
-        ]
-        
-        bandwidth_bps = sum(entry['bytes'] for entry in recent_bandwidth) / 60 if recent_bandwidth else 0
+    def stats_snapshot(self):
+        """Get mergeable counters for this analyzer's share of the traffic"""
+        # Rates are relative to the last packet once capture ends, so
+        # offline analysis reports the rate at the end of the file
+        if self.monitoring or self.last_packet_time is None:
+            current_time = time.time()
+        else:
+            current_time = self.last_packet_time
         
         return {
             'total_packets': self.stats['total_packets'],
             'total_bytes': self.stats['total_bytes'],
             'threats_detected': self.stats['threats_detected'],
-            'active_connections': len(self.stats['connections']),
-            'bandwidth_bps': bandwidth_bps,
-            'top_protocols': dict(sorted(self.stats['protocols'].items(), key=lambda x: x[1], reverse=True)[:10]),
-            'monitoring': self.monitoring
+            'active_connections': len(self.flow_table),
+            'rates': self.rates.snapshot(current_time),
+            'protocols': dict(self.stats['protocols']),
+            'flows': self.flow_table.snapshot(),
+            'behaviour': self.behaviour.snapshot(),
+            'store': self.packets.snapshot(),
+            'reassembly': self.reassembler.snapshot(),
+            'tcp_reassembly': self.tcp_reassembly.snapshot(),
+            'export': self.export_snapshot(),
+            'errors': dict(self.errors),
+            'profile': self.profiler.snapshot() if self.profiler is not None else {},
+            'shedding': self.shedder.snapshot() if self.shedder is not None else {}
+        }
+    
+    def export_snapshot(self):
+        """Streaming writer counters keyed by output format"""
+        snapshot = {}
+        if self.record_writer is not None:
+            snapshot['ndjson'] = self.record_writer.snapshot()
+        if self.frame_writer is not None:
+            snapshot['pcapng'] = self.frame_writer.snapshot()
+        return snapshot
+    
+    def get_statistics(self):
+        """Get current monitoring statistics"""
+        published = self.published
+        if self.pipeline is not None:
+            # Live shards are aligned to the wall clock, offline ones to the newest packet
+            snapshot = self.pipeline.merged_snapshot(time.time() if self.monitoring else None)
+        elif published is not None:
+            snapshot = published['stats']
+        else:
+            snapshot = self.stats_snapshot()
+        
+        rates = summarize_rates(snapshot.get('rates', {}))
+        
+        statistics = {
+            'total_packets': snapshot.get('total_packets', 0),
+            'total_bytes': snapshot.get('total_bytes', 0),
+            'threats_detected': snapshot.get('threats_detected', 0),
+            'active_connections': snapshot.get('active_connections', 0),
+            'bandwidth_bps': rates['bandwidth_bps'],
+            'packets_per_second': rates['packets_per_second'],
+            'rates': rates,
+            'top_protocols': dict(sorted(snapshot.get('protocols', {}).items(), key=lambda x: x[1], reverse=True)[:10]),
+            'flows': snapshot.get('flows', {}),
+            'behaviour': snapshot.get('behaviour', {}),
+            'export': snapshot.get('export', {}),
+            'store': snapshot.get('store', {}),
+            'reassembly': snapshot.get('reassembly', {}),
+            'tcp_reassembly': snapshot.get('tcp_reassembly', {}),
+            'errors': snapshot.get('errors', {}),
+            'profile': summarize_profile(snapshot.get('profile', {})),
+            'monitoring': self.monitoring,
+            'capture_backend': self.capture_backend,
+            'capture_filter': self.capture_filter,
+            'capture_cpu_seconds': self.capture_cpu_time,
+            'kernel': published['kernel'] if published is not None else self.get_kernel_statistics()
         }
+        
+        if self.pipeline is not None:
+            statistics['pipeline'] = self.pipeline.status()
+        statistics['queues'] = self.queue_depths(statistics)
+        self.apply_sampling(statistics, snapshot.get('shedding', {}))
+        
+        return statistics
+    
+    def apply_sampling(self, statistics, shedding):
+        """Scale counts that overload made partial and mark them as sampled
+
+        Packets the kernel or the pipeline rings dropped are added to the
+        packet total (and at the mean size to the byte total); when
+        inspection was shed the threat count becomes the weighted estimate.
+        The observed values are kept under ``'sampling'``.
+        """
+        lost = statistics['kernel'].get('drops', 0)
+        for shard in statistics.get('pipeline', {}).get('shards', ()):
+            lost += shard['dropped']
+        shed = shedding.get('shed', 0)
+        sampling = {
+            'lost_packets': lost,
+            'shed_packets': shed,
+            'priority_packets': shedding.get('priority', 0),
+            'shedding': shedding.get('shedding', 0),
+            'observed_packets': statistics['total_packets'],
+            'observed_bytes': statistics['total_bytes'],
+            'observed_threats': statistics['threats_detected']
+        }
+        
+        packets = statistics['total_packets']
+        if lost and packets:
+            statistics['total_packets'] = packets + lost
+            statistics['total_bytes'] = round(statistics['total_bytes'] * (packets + lost) / packets)
+        if shed:
+            statistics['threats_detected'] = round(shedding['estimated_threats'])
+        statistics['sampled'] = bool(lost or shed)
+        statistics['sampling'] = sampling
+    
+    def queue_depths(self, statistics):
+        """Current depth of every internal queue, for gauges"""
+        queues = {
+            'tcp_reassembly_bytes': statistics['tcp_reassembly'].get('buffered_bytes', 0),
+            'ip_fragments_pending': statistics['reassembly'].get('pending', 0)
+        }
+        for fmt, writer in statistics['export'].items():
+            queues[f'{fmt}_writer'] = writer.get('queue_depth', 0)
+        for shard, status in enumerate(statistics.get('pipeline', {}).get('shards', ())):
+            queues[f'pipeline_ring_{shard}_bytes'] = status['ring_bytes']
+        return queues
+    
+    def get_prometheus_metrics(self):
+        """Current statistics in the Prometheus text exposition format"""
+        return format_prometheus(self.get_statistics())
+    
+    def get_top_flows(self, count=10):
+        """Get the busiest active flows as IPFIX-style records"""
+        if self.pipeline is not None:
+            return self.pipeline.top_flows(count)
+        published = self.published
+        if published is not None:
+            return published['flows'][:count]
+        return self.flow_table.top_flows(count)
+    
+    def close(self):
+        """Export every remaining flow and flush all output files"""
+        self.flow_table.flush()
+        if self.flow_writer is not None:
+            self.flow_writer.close()
+        self.close_stream_writers()
+    
+    def close_stream_writers(self):
+        """Wait for the streaming writers to drain and close their files"""
+        for writer in (self.record_writer, self.frame_writer):
+            if writer is not None:
+                writer.close()
     
     def get_recent_packets(self, count=50):
-        """Get recent packets"""
-        return list(self.packets)[-count:]
+        """Get recent packets as JSON-shaped records"""
+        if self.pipeline is not None:
+            return self.pipeline.recent_packets(count)
+        published = self.published
+        if published is not None:
+            return published['packets'][-count:] if count > 0 else []
+        return self.packets.recent(count)
+    
+    def get_new_threats(self, cursor=None, limit=100):
+        """Packets with threats seen since ``cursor``
+
+        Returns ``(cursor, records)``; pass the cursor back on the next call.
+        A None cursor starts from now. During a capture the threats come
+        from the published snapshot; with worker processes only the
+        packets in the latest shard snapshots are considered.
+        """
+        if self.pipeline is not None:
+            threats = [p for p in self.pipeline.recent_packets(SNAPSHOT_PACKETS) if p['threats']]
+            seen = {p['id'] for p in threats}
+            if cursor is None:
+                return seen, []
+            return seen, [p for p in threats if p['id'] not in cursor][-limit:]
+        published = self.published
+        if published is not None:
+            if cursor is None:
+                return published['threat_cursor'], []
+            threats = [t for end, records in published['threats'] if end > cursor for t in records]
+            return published['threat_cursor'], threats[-limit:]
+        if cursor is None:
+            return self.packets.written, []
+        return self.packets.threats_after(cursor, limit)
+    
+    def query_packets(self, src=None, dst=None, host=None, last_seconds=None, limit=100, **filters):
+        """Search the retained packets through the packet store indexes
+
+        Addresses are IPv4 or IPv6 strings; ``last_seconds`` limits the search to
+        the window ending at the newest packet. Other keyword filters
+        (``src_port``, ``dst_port``, ``port``, ``protocol``,
+        ``min_severity``, ``since``, ``until``) are passed through to
+        ``PacketStore.query``.
+        """
+        if self.pipeline is not None:
+            raise ValueError("Packet queries need a single analyzer (run without --workers)")
+        for name, value in (('src', src), ('dst', dst), ('host', host)):
+            if value is not None:
+                address = ipaddress.ip_address(value)
+                filters[name] = self.packets.address_key(int(address), address.version, intern=False)
+        if last_seconds is not None and self.last_packet_time is not None:
+            filters['since'] = self.last_packet_time - last_seconds
+        return self.packets.query(limit=limit, **filters)
     
     def export_packets(self, filename=None):
         """Export captured packets to JSON file"""
         if not filename:
             filename = f"network_capture_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         
+        packets = self.get_recent_packets(self.export_packet_count)
         export_data = {
             'capture_info': {
                 'timestamp': datetime.now().isoformat(),
-                'total_packets': len(self.packets),
+                'total_packets': len(packets),
                 'statistics': self.get_statistics()
             },
-            'packets': list(self.packets)
+            'packets': packets
         }
         
         with open(filename, 'w') as f:
             json.dump(export_data, f, indent=2)
         
-        print(f"[+] Exported {len(self.packets)} packets to {filename}")
+        print(f"[+] Exported {len(packets)} packets to {filename}")
         return filename
 
+def print_stream_summary(stats):
+    """Print streaming writer totals for the end-of-run summaries"""
+    for fmt, writer in stats['export'].items():
+        print(f"Streamed {fmt}: {writer['written']} records, {writer['files']} files, "
+              f"{writer['bytes_written']} bytes (dropped {writer['dropped']}, "
+              f"blocked {writer['blocked_seconds']:.2f}s)")
+
+def print_sampling_summary(stats):
+    """Say which summary counts are estimates and what was actually observed"""
+    if stats['sampled']:
+        sampling = stats['sampling']
+        print(f"Sampled: totals include {sampling['lost_packets']} dropped packets; "
+              f"{sampling['shed_packets']} packets skipped payload inspection")
+        print(f"Observed: {sampling['observed_packets']} packets, {sampling['observed_bytes']} bytes, "
+              f"{sampling['observed_threats']} threats")
+
+def print_profile_summary(stats):
+    """Print per-stage timings and processing errors when there are any"""
+    if stats['profile']:
+        print(f"{'Stage':12} {'Samples':>9} {'Mean':>9} {'p50':>9} {'p90':>9} {'p99':>9}")
+        for stage, timing in stats['profile'].items():
+            print(f"{stage:12} {timing['samples']:>9} " +
+                  ' '.join(f"{timing[key] / 1000:>7.1f}µs" for key in ('mean_ns', 'p50_ns', 'p90_ns', 'p99_ns')))
+    for name, count in stats['errors'].items():
+        print(f"Processing Errors ({name}): {count}")
+
+def write_metrics(analyzer, filename):
+    """Write the final statistics as a Prometheus text file"""
+    try:
+        with open(filename, 'w') as f:
+            f.write(analyzer.get_prometheus_metrics())
+    except OSError as e:
+        print(f"[-] Cannot write metrics to {filename}: {e}")
+        return
+    print(f"[+] Wrote Prometheus metrics to {filename}")
+
+QUERY_KEYS = {
+    'src': ('src', str),
+    'dst': ('dst', str),
+    'host': ('host', str),
+    'sport': ('src_port', int),
+    'dport': ('dst_port', int),
+    'port': ('port', int),
+    'protocol': ('protocol', str),
+    'severity': ('min_severity', str),
+    'last': ('last_seconds', float),
+    'limit': ('limit', int)
+}
+
+def run_query(analyzer, terms):
+    """Run a ``--query`` search and print the matching packets"""
+    filters = {}
+    try:
+        for term in terms:
+            key, _, value = term.partition('=')
+            name, convert = QUERY_KEYS[key.strip()]
+            filters[name] = convert(value.strip())
+        start = time.perf_counter()
+        packets = analyzer.query_packets(**filters)
+    except (KeyError, ValueError, OSError) as e:
+        print(f"[-] Invalid query: {e}")
+        return
+    elapsed = (time.perf_counter() - start) * 1000
+    
+    print(f"\n[+] Query matched {len(packets)} packets in {elapsed:.1f} ms")
+    for packet in packets[-20:]:
+        print(f"{packet['timestamp'][:19]} | {packet['source']:15}:{packet['source_port']:<5} → "
+              f"{packet['destination']:15}:{packet['dest_port']:<5} | {packet['protocol']:8} | "
+              f"{packet['threat_level']}")
+
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python3 network_analyzer.py <command> [options]")
-        print("Commands:")
-        print("  capture <interface> [duration] - Start packet capture")
-        print("  analyze <pcap_file> - Analyze existing capture file")
-        print("  monitor - Start real-time monitoring")
+    parser = argparse.ArgumentParser(description='Network Analyzer')
+    subparsers = parser.add_subparsers(dest='command', metavar='<command>')
+    subparsers.required = True
+    
+    capture_parser = subparsers.add_parser('capture', help='Start packet capture')
+    capture_parser.add_argument('interface', nargs='?', default='eth0', help='Interface to capture on')
+    capture_parser.add_argument('duration', nargs='?', type=int, help='Capture duration in seconds')
+    capture_parser.add_argument('--backend', choices=['socket', 'ring'], default='socket',
+                                help='Capture backend (ring = TPACKET_V3 shared-memory ring)')
+    
+    analyze_parser = subparsers.add_parser('analyze', help='Analyze existing capture file')
+    analyze_parser.add_argument('pcap_file', help='pcap or pcapng file to analyze')
+    
+    monitor_parser = subparsers.add_parser('monitor', help='Start real-time monitoring')
+    monitor_parser.add_argument('--interface', default='eth0', help='Interface to capture on')
+    monitor_parser.add_argument('--backend', choices=['socket', 'ring'], default='socket',
+                                help='Capture backend (ring = TPACKET_V3 shared-memory ring)')
+    
+    # Options shared by every command
+    for subparser in (capture_parser, analyze_parser, monitor_parser):
+        subparser.add_argument('--workers', type=int, default=1,
+                               help='Worker processes for flow-sharded analysis')
+        subparser.add_argument('--rules', help='JSON file with additional threat signatures')
+        subparser.add_argument('--flow-export', help='Stream expired flows to this file as NDJSON')
+        subparser.add_argument('--filter', help='tcpdump-style capture filter, e.g. "tcp port 80"')
+        subparser.add_argument('--stream', metavar='PREFIX',
+                               help='Stream every packet to rotating files starting with PREFIX')
+        subparser.add_argument('--stream-format', choices=['ndjson', 'pcapng', 'both'], default='ndjson',
+                               help='Stream packet records (ndjson), raw frames (pcapng) or both')
+        subparser.add_argument('--compress', choices=['gzip', 'zstd'],
+                               help='Compress streamed files (zstd needs the zstandard package)')
+        subparser.add_argument('--rotate-mb', type=int, default=64,
+                               help='Start a new stream file after this many megabytes')
+        subparser.add_argument('--rotate-seconds', type=int,
+                               help='Start a new stream file after this many seconds')
+        subparser.add_argument('--store-packets', type=int, default=DEFAULT_CAPACITY,
+                               help='Packets retained in memory for queries and the API '
+                                    '(raise to millions for longer query history)')
+        subparser.add_argument('--profile', type=int, nargs='?', const=DEFAULT_SAMPLE_EVERY, metavar='N',
+                               help=f'Time packet-processing stages on one packet in N '
+                                    f'(default {DEFAULT_SAMPLE_EVERY})')
+        subparser.add_argument('--metrics', metavar='FILE',
+                               help='Write final statistics to FILE in Prometheus text format')
+    for subparser, default in ((capture_parser, None), (monitor_parser, str(DEFAULT_PORT))):
+        subparser.add_argument('--listen', metavar='[HOST:]PORT', default=default,
+                               help='Serve live statistics over HTTP/WebSocket (default host 127.0.0.1)')
+        subparser.add_argument('--interval', type=float, default=1.0,
+                               help='Seconds between live statistics updates')
+        subparser.add_argument('--shed-load', type=float, nargs='?', const=DEFAULT_CPU_BUDGET, metavar='CPU',
+                               help=f'Inspect payloads of only a sample of flows while processing uses '
+                                    f'more than this CPU fraction (default {DEFAULT_CPU_BUDGET})')
+    analyze_parser.add_argument('--query', action='append', metavar='KEY=VALUE',
+                                help='Search retained packets after analysis; repeat to combine '
+                                     '(src, dst, host, sport, dport, port, protocol, severity, last)')
+    
+    args = parser.parse_args()
+    
+    command = args.command
+    stream_options = None
+    if args.stream:
+        stream_options = {
+            'prefix': args.stream,
+            'formats': ['ndjson', 'pcapng'] if args.stream_format == 'both' else [args.stream_format],
+            'compression': args.compress,
+            'rotate_bytes': args.rotate_mb * 1024 * 1024,
+            'rotate_seconds': args.rotate_seconds,
+            # Offline analysis can wait for the writer; live capture must not
+            'block': command == 'analyze'
+        }
+    
+    try:
+        analyzer = PacketAnalyzer(rules_file=args.rules, flow_export=args.flow_export,
+                                  stream_options=stream_options, store_packets=args.store_packets)
+    except ValueError as e:
+        print(f"[-] {e}")
         sys.exit(1)
     
-    analyzer = PacketAnalyzer()
-    command = sys.argv[1]
+    if args.filter:
+        try:
+            analyzer.set_capture_filter(args.filter)
+        except (ValueError, OSError) as e:
+            print(f"[-] Invalid capture filter: {e}")
+            sys.exit(1)
+    
+    # Before the pipeline starts, so the workers profile and shed too
+    if args.profile:
+        analyzer.enable_profiling(args.profile)
+    if getattr(args, 'shed_load', None):
+        analyzer.enable_load_shedding(args.shed_load)
+    
+    if args.workers > 1:
+        analyzer.start_pipeline(args.workers)
+    
+    server = None
+    if getattr(args, 'listen', None):
+        try:
+            host, port = parse_listen(args.listen)
+            server = LiveStatsServer(analyzer, host, port, args.interval)
+            server.start()
+        except (ValueError, OSError) as e:
+            print(f"[-] Cannot serve live statistics on {args.listen}: {e}")
+            sys.exit(1)
     
     if command == 'capture':
-        interface = sys.argv[2] if len(sys.argv) > 2 else 'eth0'
-        duration = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        interface = args.interface
+        duration = args.duration
         
         print(f"[+] Starting network capture on {interface}")
         if duration:
             print(f"[+] Capture duration: {duration} seconds")
         
         try:
-            analyzer.start_capture(interface, duration)
+            analyzer.start_capture(interface, duration, args.backend)
         except KeyboardInterrupt:
             print("\n[+] Capture interrupted by user")
         finally:
             analyzer.stop_capture()
+            analyzer.close_stream_writers()
+            if server is not None:
+                server.stop()
             
         # Export results
         filename = analyzer.export_packets()
@@ -425,7 +983,51 @@ def main():
         print(f"Total Bytes: {stats['total_bytes']}")
         print(f"Threats Detected: {stats['threats_detected']}")
         print(f"Active Connections: {stats['active_connections']}")
+        if stats['kernel']:
+            print(f"Kernel Packets: {stats['kernel']['packets']}")
+            print(f"Kernel Drops: {stats['kernel']['drops']}")
+        if stats['capture_filter']:
+            print(f"Capture Filter: {stats['capture_filter']}")
+        print(f"Capture CPU Time: {stats['capture_cpu_seconds']:.2f}s")
+        print_sampling_summary(stats)
+        print_stream_summary(stats)
+        print_profile_summary(stats)
         print(f"Export File: {filename}")
+        if args.metrics:
+            write_metrics(analyzer, args.metrics)
+        analyzer.close()
+        
+    elif command == 'analyze':
+        pcap_file = args.pcap_file
+        
+        try:
+            analyzer.analyze_file(pcap_file)
+        except (OSError, ValueError) as e:
+            print(f"[-] Error reading {pcap_file}: {e}")
+            sys.exit(1)
+        analyzer.close_stream_writers()
+        
+        filename = analyzer.export_packets()
+        stats = analyzer.get_statistics()
+        
+        print("\n" + "="*50)
+        print("ANALYSIS SUMMARY")
+        print("="*50)
+        print(f"Total Packets: {stats['total_packets']}")
+        print(f"Total Bytes: {stats['total_bytes']}")
+        print(f"Threats Detected: {stats['threats_detected']}")
+        print(f"Active Connections: {stats['active_connections']}")
+        print(f"Flows Seen: {stats['flows'].get('created', 0)}")
+        print_sampling_summary(stats)
+        print_stream_summary(stats)
+        print_profile_summary(stats)
+        print(f"Export File: {filename}")
+        
+        if args.query:
+            run_query(analyzer, args.query)
+        if args.metrics:
+            write_metrics(analyzer, args.metrics)
+        analyzer.close()
         
     elif command == 'monitor':
         print("[+] Starting real-time monitoring mode")
@@ -434,15 +1036,21 @@ def main():
         # Start capture in background thread
         capture_thread = threading.Thread(
             target=analyzer.start_capture,
-            args=('eth0', None)
+            args=(args.interface, None, args.backend)
         )
         capture_thread.daemon = True
         capture_thread.start()
         
         try:
             while True:
-                time.sleep(5)
-                stats = analyzer.get_statistics()
+                # Redrawn on each publish of the live statistics server
+                if server is not None:
+                    stats = server.wait_for_update(5)
+                    if not stats:
+                        continue
+                else:
+                    time.sleep(5)
+                    stats = analyzer.get_statistics()
                 recent_packets = analyzer.get_recent_packets(10)
                 
                 # Clear screen and show stats
@@ -450,10 +1058,12 @@ def main():
                 print("="*80)
                 print("NETWORK ANALYZER - REAL-TIME MONITORING")
                 print("="*80)
-                print(f"Packets: {stats['total_packets']} | "
+                print(f"{'Sampled ' if stats['sampled'] else ''}"
+                      f"Packets: {stats['total_packets']} | "
                       f"Bytes: {stats['total_bytes']} | "
                       f"Threats: {stats['threats_detected']} | "
-                      f"Bandwidth: {stats['bandwidth_bps']:.1f} B/s")
+                      f"Bandwidth: {stats['bandwidth_bps']:.1f} B/s | "
+                      f"Kernel Drops: {stats['kernel'].get('drops', 0)}")
                 print("-"*80)
                 
                 # Show recent packets
@@ -465,6 +1075,12 @@ def main():
                 
         except KeyboardInterrupt:
             analyzer.stop_capture()
+            capture_thread.join()
+            if server is not None:
+                server.stop()
+            if args.metrics:
+                write_metrics(analyzer, args.metrics)
+            analyzer.close()
             print("\n[+] Monitoring stopped")
 
 if __name__ == "__main__":
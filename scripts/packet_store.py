@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Packet Store - Columnar ring buffer of packet metadata with indexed queries
+Up to millions of retained packets in preallocated arrays instead of dicts
+
+Every packet gets an absolute position; its row is ``position % capacity``.
+Columns hold timestamps, addresses, ports, sizes, protocol ids, TCP flags
+and the highest threat severity. IPv4 addresses are stored as-is; IPv6
+addresses are interned as a counter id with the top bit set, and the
+address <-> key tables are pruned with the indexes.
+Secondary indexes map source/destination address, source/destination
+port, protocol and "has threats" to ascending arrays of positions, so a
+query walks only the shortest matching posting list and checks the
+remaining conditions against the columns. Positions that have fallen out
+of the ring are trimmed from the indexes by a sweep that starts once per
+``capacity`` packets. The sweep visits a slice of the index keys every
+``capacity / COMPACTION_STEPS`` packets, so index memory stays
+proportional to the ring without any single packet paying for a walk over
+every key.
+
+Timestamps are assumed to be (nearly) non-decreasing in insertion order,
+which holds for live capture and for sorted capture files; time ranges are
+resolved by binary search over the ring.
+"""
+
+import heapq
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+from packet_view import format_address, SEVERITY_ORDER, TCP_FLAGS
+
+IPV6_KEY = 1 << 63
+
+DEFAULT_CAPACITY = 1000
+COMPACTION_STEPS = 64
+PREVIEW_ROWS = 1000
+PREVIEW_BYTES = 100
+
+SEVERITY_NAMES = {level: name for name, level in SEVERITY_ORDER.items()}
+SEVERITY_NAMES[0] = 'None'
+TRANSPORT_NAMES = {6: 'TCP', 17: 'UDP'}
+
+
+class PacketStore:
+    """Fixed-capacity columnar packet ring with secondary indexes"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, preview_rows=PREVIEW_ROWS):
+        self.capacity = capacity
+        self.written = 0
+        self.next_compaction = capacity
+        self.compaction_interval = max(capacity // COMPACTION_STEPS, 1)
+        # Running compaction sweep: (mapping, keys left to visit), last first
+        self.sweep = []
+        self.sweep_budget = 0
+        self.sweep_started = 0
+
+        self.timestamps = array('d', [0.0]) * capacity
+        self.src_addrs = array('Q', [0]) * capacity
+        self.dst_addrs = array('Q', [0]) * capacity
+        self.src_ports = array('H', [0]) * capacity
+        self.dst_ports = array('H', [0]) * capacity
+        self.sizes = array('I', [0]) * capacity
+        self.ip_protos = array('B', [0]) * capacity
+        self.protocol_ids = array('H', [0]) * capacity
+        self.tcp_flags = array('B', [0]) * capacity
+        self.severities = array('B', [0]) * capacity
+        self.seqs = array('Q', [0]) * capacity
+
+        # Threat details for rows that have any, keyed by row
+        self.threat_details = {}
+        # Payload previews are only kept for the most recent rows
+        self.preview_rows = preview_rows
+        self.previews = [None] * preview_rows
+
+        self.protocol_names = []
+        self.protocol_ids_by_name = {}
+        # Interned IPv6 addresses: key -> address and address -> key
+        self.ipv6_addresses = {}
+        self.ipv6_keys = {}
+        self.next_ipv6_id = 1
+
+        self.by_src = {}
+        self.by_dst = {}
+        self.by_src_port = {}
+        self.by_dst_port = {}
+        self.by_protocol = {}
+        self.threat_positions = array('Q')
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    @property
+    def oldest(self):
+        """Position of the oldest packet still in the ring"""
+        return max(self.written - self.capacity, 0)
+
+    def protocol_id(self, name):
+        """Intern a protocol name as a small integer"""
+        protocol_id = self.protocol_ids_by_name.get(name)
+        if protocol_id is None:
+            protocol_id = len(self.protocol_names)
+            self.protocol_names.append(name)
+            self.protocol_ids_by_name[name] = protocol_id
+        return protocol_id
+
+    def address_key(self, address, version=4, intern=True):
+        """Column/index key for an address; IPv6 addresses are interned
+
+        With ``intern=False`` an unknown IPv6 address is not added and gets
+        a key that matches no stored packet.
+        """
+        if version == 4:
+            return address
+        key = self.ipv6_keys.get(address)
+        if key is None:
+            if not intern:
+                return IPV6_KEY
+            key = IPV6_KEY | self.next_ipv6_id
+            self.next_ipv6_id += 1
+            self.ipv6_keys[address] = key
+            self.ipv6_addresses[key] = address
+        return key
+
+    def format_key(self, key):
+        if key & IPV6_KEY:
+            return format_address(self.ipv6_addresses[key], 6)
+        return format_address(key)
+
+    def append(self, packet):
+        """Store one decoded ``PacketView``"""
+        position = self.written
+        row = position % self.capacity
+        protocol_id = self.protocol_ids_by_name.get(packet.protocol)
+        if protocol_id is None:
+            protocol_id = self.protocol_id(packet.protocol)
+        src_addr = packet.src_addr
+        dst_addr = packet.dst_addr
+        if packet.ip_version == 6:
+            src_addr = self.address_key(src_addr, 6)
+            dst_addr = self.address_key(dst_addr, 6)
+        src_port = packet.src_port
+        dst_port = packet.dst_port
+
+        self.timestamps[row] = packet.timestamp
+        self.src_addrs[row] = src_addr
+        self.dst_addrs[row] = dst_addr
+        self.src_ports[row] = src_port
+        self.dst_ports[row] = dst_port
+        self.sizes[row] = packet.size
+        self.ip_protos[row] = packet.ip_proto
+        self.protocol_ids[row] = protocol_id
+        self.tcp_flags[row] = packet.tcp_flags
+        self.seqs[row] = packet.seq
+
+        threats = packet.threats
+        if threats:
+            self.severities[row] = max(SEVERITY_ORDER.get(t['severity'], 1) for t in threats)
+            self.threat_details[row] = threats
+            self.threat_positions.append(position)
+        elif self.severities[row]:
+            self.severities[row] = 0
+            del self.threat_details[row]
+
+        self.previews[position % self.preview_rows] = (position, bytes(packet.payload[:PREVIEW_BYTES]))
+
+        # Index updates, unrolled: this runs once per packet
+        try:
+            self.by_src[src_addr].append(position)
+        except KeyError:
+            self.by_src[src_addr] = array('Q', (position,))
+        try:
+            self.by_dst[dst_addr].append(position)
+        except KeyError:
+            self.by_dst[dst_addr] = array('Q', (position,))
+        try:
+            self.by_src_port[src_port].append(position)
+        except KeyError:
+            self.by_src_port[src_port] = array('Q', (position,))
+        try:
+            self.by_dst_port[dst_port].append(position)
+        except KeyError:
+            self.by_dst_port[dst_port] = array('Q', (position,))
+        try:
+            self.by_protocol[protocol_id].append(position)
+        except KeyError:
+            self.by_protocol[protocol_id] = array('Q', (position,))
+
+        self.written = position + 1
+        if self.written >= self.next_compaction:
+            self.compact_step()
+
+    def compact_step(self):
+        """Trim the next slice of index keys, starting a sweep when none is running"""
+        if not self.sweep:
+            self.start_sweep()
+        self.compact_keys(self.sweep_budget)
+        if self.sweep:
+            self.next_compaction = self.written + self.compaction_interval
+        else:
+            self.next_compaction = self.sweep_started + self.capacity
+
+    def compact(self):
+        """Drop positions that have left the ring from every index at once"""
+        self.start_sweep()
+        self.compact_keys(sum(len(keys) for _mapping, keys in self.sweep))
+        self.next_compaction = self.written + self.capacity
+
+    def start_sweep(self):
+        # IPv6 addresses are visited last, once the address indexes are trimmed
+        self.sweep = [(self.ipv6_addresses, list(self.ipv6_addresses))]
+        for index in (self.by_protocol, self.by_dst_port, self.by_src_port, self.by_dst, self.by_src):
+            self.sweep.append((index, list(index)))
+        self.sweep_budget = sum(len(keys) for _mapping, keys in self.sweep) // COMPACTION_STEPS + 1
+        self.sweep_started = self.written
+        start = bisect_left(self.threat_positions, self.oldest)
+        if start:
+            self.threat_positions = self.threat_positions[start:]
+
+    def compact_keys(self, budget):
+        """Visit up to ``budget`` keys of the running sweep"""
+        oldest = self.oldest
+        sweep = self.sweep
+        ipv6_addresses = self.ipv6_addresses
+        while sweep and budget > 0:
+            mapping, keys = sweep[-1]
+            batch = keys[-budget:]
+            del keys[-budget:]
+            budget -= len(batch)
+            if not keys:
+                sweep.pop()
+
+            if mapping is ipv6_addresses:
+                for key in batch:
+                    if key not in self.by_src and key not in self.by_dst:
+                        address = ipv6_addresses.pop(key, None)
+                        if address is not None:
+                            del self.ipv6_keys[address]
+                continue
+            for key in batch:
+                positions = mapping.get(key)
+                if positions is None or positions[0] >= oldest:
+                    continue
+                start = bisect_left(positions, oldest)
+                if start == len(positions):
+                    del mapping[key]
+                else:
+                    mapping[key] = positions[start:]
+
+    def position_at(self, timestamp):
+        """First retained position whose timestamp is >= ``timestamp``"""
+        low = self.oldest
+        high = self.written
+        timestamps = self.timestamps
+        capacity = self.capacity
+        while low < high:
+            middle = (low + high) // 2
+            if timestamps[middle % capacity] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def query(self, src=None, dst=None, host=None, src_port=None, dst_port=None, port=None,
+              protocol=None, min_severity=None, since=None, until=None, limit=100):
+        """Find retained packets matching every given condition
+
+        Addresses are ``address_key`` values, ``protocol`` an application protocol name
+        and ``min_severity`` a severity name (``'Low'`` .. ``'Critical'``).
+        ``host``/``port`` match either direction. Returns up to ``limit``
+        of the newest matches as records, oldest first.
+        """
+        low = self.oldest
+        high = self.written
+        if since is not None:
+            low = max(low, self.position_at(since))
+        if until is not None:
+            high = min(high, self.position_at(until))
+        if low >= high:
+            return []
+
+        # Candidate position sources from the indexes, each newest first
+        candidates = []
+
+        def posting(positions):
+            if positions is None:
+                return None
+            start = bisect_left(positions, low)
+            end = bisect_left(positions, high)
+            return end - start, (positions[i] for i in range(end - 1, start - 1, -1))
+
+        def either(index_a, index_b, key):
+            first = posting(index_a.get(key))
+            second = posting(index_b.get(key))
+            sources = [s for s in (first, second) if s is not None]
+            if not sources:
+                return 0, iter(())
+            if len(sources) == 1:
+                return sources[0]
+            merged = heapq.merge(first[1], second[1], reverse=True)
+            return first[0] + second[0], dedupe(merged)
+
+        for value, index in ((src, self.by_src), (dst, self.by_dst),
+                             (src_port, self.by_src_port), (dst_port, self.by_dst_port)):
+            if value is not None:
+                candidates.append(posting(index.get(value)) or (0, iter(())))
+        if host is not None:
+            candidates.append(either(self.by_src, self.by_dst, host))
+        if port is not None:
+            candidates.append(either(self.by_src_port, self.by_dst_port, port))
+
+        protocol_id = None
+        if protocol is not None:
+            protocol_id = self.protocol_ids_by_name.get(protocol)
+            if protocol_id is None:
+                return []
+            candidates.append(posting(self.by_protocol.get(protocol_id)) or (0, iter(())))
+
+        severity = 0
+        if min_severity is not None:
+            severity = SEVERITY_ORDER.get(min_severity, 1)
+            candidates.append(posting(self.threat_positions))
+
+        if candidates:
+            _count, positions = min(candidates, key=lambda c: c[0])
+        else:
+            positions = iter(range(high - 1, low - 1, -1))
+
+        capacity = self.capacity
+        matches = []
+        for position in positions:
+            row = position % capacity
+            if src is not None and self.src_addrs[row] != src:
+                continue
+            if dst is not None and self.dst_addrs[row] != dst:
+                continue
+            if host is not None and host != self.src_addrs[row] and host != self.dst_addrs[row]:
+                continue
+            if src_port is not None and self.src_ports[row] != src_port:
+                continue
+            if dst_port is not None and self.dst_ports[row] != dst_port:
+                continue
+            if port is not None and port != self.src_ports[row] and port != self.dst_ports[row]:
+                continue
+            if protocol_id is not None and self.protocol_ids[row] != protocol_id:
+                continue
+            if self.severities[row] < severity:
+                continue
+            matches.append(position)
+            if len(matches) >= limit:
+                break
+
+        matches.reverse()
+        return [self.record(position) for position in matches]
+
+    def recent(self, count=50):
+        """The newest ``count`` packets as records, oldest first"""
+        start = max(self.written - count, self.oldest)
+        return [self.record(position) for position in range(start, self.written)]
+
+    def threats_after(self, position, limit=100):
+        """Packets with threats stored at or after ``position``
+
+        Returns ``(next_position, records)``; pass ``next_position`` back to
+        continue from there. Only the newest ``limit`` threats are returned
+        when more are waiting.
+        """
+        written = self.written
+        positions = self.threat_positions
+        start = bisect_left(positions, max(position, self.oldest))
+        end = bisect_left(positions, written, start)
+        start = max(start, end - limit)
+        return written, [self.record(positions[i]) for i in range(start, end)]
+
+    def record(self, position):
+        """Materialise the JSON-shaped record for a retained position"""
+        row = position % self.capacity
+        ip_proto = self.ip_protos[row]
+        timestamp = self.timestamps[row]
+        flags = self.tcp_flags[row]
+
+        preview = self.previews[position % self.preview_rows]
+        payload = preview[1] if preview is not None and preview[0] == position else b''
+
+        return {
+            'id': f"{timestamp}_{self.seqs[row]}",
+            'timestamp': datetime.fromtimestamp(timestamp).isoformat(),
+            'source': self.format_key(self.src_addrs[row]),
+            'destination': self.format_key(self.dst_addrs[row]),
+            'protocol': self.protocol_names[self.protocol_ids[row]],
+            'transport_protocol': TRANSPORT_NAMES.get(ip_proto, 'OTHER'),
+            'size': self.sizes[row],
+            'threats': list(self.threat_details.get(row, ())),
+            'threat_level': SEVERITY_NAMES.get(self.severities[row], 'None'),
+            'source_port': self.src_ports[row],
+            'dest_port': self.dst_ports[row],
+            'flags': {name: 1 if flags & bit else 0 for name, bit in TCP_FLAGS} if ip_proto == 6 else {},
+            'payload_preview': payload.hex()
+        }
+
+    def snapshot(self):
+        """Mergeable store counters"""
+        return {
+            'retained': len(self),
+            'stored': self.written
+        }
+
+
+def dedupe(positions):
+    """Collapse equal neighbours of a sorted position stream"""
+    previous = None
+    for position in positions:
+        if position != previous:
+            yield position
+            previous = position
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Packet View - Lazily decoded, slotted view over a raw captured frame
+Only the header fields the analyzer needs per packet are unpacked eagerly
+
+Addresses stay as integers, timestamps as epoch floats and the payload as a
+slice of the capture buffer. The slice ends where the IP length says the
+packet ends, so Ethernet padding of short frames is never taken for
+payload; a zero IPv4 total length (segmentation offload) or IPv6 payload
+length (jumbogram) leaves it running to the end of the frame. Dotted-quad strings, ISO timestamps, flag
+dicts and the hex payload preview are produced by ``to_dict()`` when a
+packet is exported or served over the API.
+
+Plain Ethernet/IPv4 frames take a short fast path. Everything else goes
+through a table-driven decoder chain: 802.1Q/802.1ad/QinQ tags, IPv6 with
+extension headers, IP-in-IP, GRE (including transparent Ethernet bridging)
+and VXLAN. Tunnelled packets are reported by their innermost IP header,
+with the layers they were carried in listed in ``encapsulation``.
+"""
+
+import socket
+import struct
+from datetime import datetime
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_TEB = 0x6558  # Transparent Ethernet bridging inside GRE
+VLAN_ETHERTYPES = (0x8100, 0x88A8, 0x9100)
+ETHERNET_HEADER_LEN = 14
+PAYLOAD_PREVIEW_BYTES = 100
+
+IPPROTO_IPIP = 4
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPPROTO_IPV6 = 41
+IPPROTO_GRE = 47
+IPPROTO_ICMPV6 = 58
+VXLAN_PORT = 4789
+MAX_LAYERS = 8
+
+# IPv6 extension headers with the generic (next header, length in 8 octets) layout
+IPV6_EXTENSION_HEADERS = (0, 43, 60)
+IPV6_FRAGMENT_HEADER = 44
+IPV6_AH_HEADER = 51
+
+ETHERTYPE = struct.Struct('!H')
+# version/IHL, total length, flags/fragment offset, protocol, source, destination
+IPV4_HEADER = struct.Struct('!BxH2xHxB2xII')
+# identification
+IPV4_IDENT = struct.Struct('!H')
+# payload length, next header, source, destination
+IPV6_HEADER = struct.Struct('!4xHB1x16s16s')
+IPV6_FRAGMENT = struct.Struct('!BxHI')
+# source port, destination port, sequence number, data offset, flags
+TCP_HEADER = struct.Struct('!HHI4xBB')
+PORTS = struct.Struct('!HH')
+ADDRESS = struct.Struct('!I')
+GRE_HEADER = struct.Struct('!HH')
+
+TCP_FLAGS = (('urg', 32), ('ack', 16), ('psh', 8), ('rst', 4), ('syn', 2), ('fin', 1))
+TCP_SYN = 2
+TCP_RST = 4
+
+SEVERITY_ORDER = {'Low': 1, 'Medium': 2, 'High': 3, 'Critical': 4}
+
+
+def format_address(address, version=4):
+    """Format an integer IPv4 or IPv6 address"""
+    if version == 6:
+        return socket.inet_ntop(socket.AF_INET6, address.to_bytes(16, 'big'))
+    return socket.inet_ntoa(ADDRESS.pack(address))
+
+
+class PacketView:
+    """One decoded packet, referencing its capture buffer"""
+
+    __slots__ = ('buf', 'timestamp', 'size', 'seq', 'ip_proto', 'src_addr', 'dst_addr',
+                 'src_port', 'dst_port', 'tcp_flags', 'tcp_seq', 'has_ports', 'payload_offset',
+                 'payload_end', 'protocol', 'threats', 'ip_version', 'vlan', 'encapsulation', 'fragment')
+
+    def __init__(self, buf, timestamp, size, seq, ip_proto, src_addr, dst_addr, ip_version=4):
+        self.buf = buf
+        self.timestamp = timestamp
+        self.size = size
+        self.seq = seq
+        self.ip_proto = ip_proto
+        self.src_addr = src_addr
+        self.dst_addr = dst_addr
+        self.src_port = 0
+        self.dst_port = 0
+        self.tcp_flags = 0
+        self.tcp_seq = 0
+        self.has_ports = False
+        self.payload_offset = 0
+        self.payload_end = len(buf)
+        self.protocol = None
+        self.threats = ()
+        self.ip_version = ip_version
+        self.vlan = None
+        self.encapsulation = ()
+        self.fragment = False
+
+    @property
+    def payload(self):
+        """Application payload as a zero-copy slice of the buffer"""
+        return memoryview(self.buf)[self.payload_offset:self.payload_end]
+
+    @property
+    def source(self):
+        return format_address(self.src_addr, self.ip_version)
+
+    @property
+    def destination(self):
+        return format_address(self.dst_addr, self.ip_version)
+
+    @property
+    def transport_protocol(self):
+        if self.ip_proto == 6:
+            return 'TCP'
+        if self.ip_proto == 17:
+            return 'UDP'
+        return 'OTHER'
+
+    @property
+    def flags(self):
+        if self.ip_proto != 6:
+            return {}
+        return {name: 1 if self.tcp_flags & bit else 0 for name, bit in TCP_FLAGS}
+
+    @property
+    def threat_level(self):
+        if not self.threats:
+            return 'None'
+        return max(self.threats, key=lambda t: SEVERITY_ORDER.get(t['severity'], 0))['severity']
+
+    def detach(self):
+        """Stop referencing a shared capture buffer before the packet is kept
+
+        Ring, mmap and shared-memory buffers are reused once the capture
+        loop moves on, so only the headers and the preview bytes are copied.
+        """
+        if not isinstance(self.buf, bytes):
+            self.buf = bytes(self.buf[:min(self.payload_offset + PAYLOAD_PREVIEW_BYTES, self.payload_end)])
+            self.payload_end = min(self.payload_end, len(self.buf))
+
+    def to_dict(self):
+        """Materialise the JSON-shaped packet record"""
+        payload = self.payload[:PAYLOAD_PREVIEW_BYTES]
+        return {
+            'id': f"{self.timestamp}_{self.seq}",
+            'timestamp': datetime.fromtimestamp(self.timestamp).isoformat(),
+            'source': self.source,
+            'destination': self.destination,
+            'protocol': self.protocol,
+            'transport_protocol': self.transport_protocol,
+            'size': self.size,
+            'threats': list(self.threats),
+            'threat_level': self.threat_level,
+            'source_port': self.src_port,
+            'dest_port': self.dst_port,
+            'flags': self.flags,
+            'payload_preview': payload.hex() if payload else ''
+        }
+
+
+def decode_transport(packet, buf, offset):
+    """Fill in ports, TCP flags and the payload offset"""
+    ip_proto = packet.ip_proto
+    if ip_proto == IPPROTO_TCP:
+        packet.src_port, packet.dst_port, packet.tcp_seq, data_offset, packet.tcp_flags = \
+            TCP_HEADER.unpack_from(buf, offset)
+        packet.has_ports = True
+        packet.payload_offset = offset + (data_offset >> 4) * 4
+    elif ip_proto == IPPROTO_UDP:
+        packet.src_port, packet.dst_port = PORTS.unpack_from(buf, offset)
+        packet.has_ports = True
+        packet.payload_offset = offset + 8
+    else:
+        packet.payload_offset = offset
+    return packet
+
+
+def decode_packet(buf, timestamp, size, seq, reassembler=None):
+    """Decode the link, network and transport headers of an Ethernet frame
+
+    Returns None for frames without an IP packet. ``reassembler`` (a
+    ``FragmentReassembler``) rebuilds fragmented datagrams; fragments that
+    do not complete a datagram come back with ``fragment`` set and no ports.
+    """
+    if ETHERTYPE.unpack_from(buf, 12)[0] == ETH_P_IP:
+        version_ihl, total_length, fragment, ip_proto, src_addr, dst_addr = \
+            IPV4_HEADER.unpack_from(buf, ETHERNET_HEADER_LEN)
+        # Fast path: unfragmented TCP/UDP/ICMP over IPv4, decoded inline
+        if not fragment & 0x3FFF:
+            transport_offset = ETHERNET_HEADER_LEN + (version_ihl & 0x0F) * 4
+            ip_end = ETHERNET_HEADER_LEN + total_length
+            if ip_proto == IPPROTO_TCP:
+                packet = PacketView(buf, timestamp, size, seq, ip_proto, src_addr, dst_addr)
+                packet.src_port, packet.dst_port, packet.tcp_seq, data_offset, packet.tcp_flags = \
+                    TCP_HEADER.unpack_from(buf, transport_offset)
+                packet.has_ports = True
+                packet.payload_offset = transport_offset + (data_offset >> 4) * 4
+                if total_length and ip_end < packet.payload_end:
+                    packet.payload_end = ip_end
+                return packet
+            if ip_proto == IPPROTO_UDP:
+                src_port, dst_port = PORTS.unpack_from(buf, transport_offset)
+                if dst_port != VXLAN_PORT:
+                    packet = PacketView(buf, timestamp, size, seq, ip_proto, src_addr, dst_addr)
+                    packet.src_port = src_port
+                    packet.dst_port = dst_port
+                    packet.has_ports = True
+                    packet.payload_offset = transport_offset + 8
+                    if total_length and ip_end < packet.payload_end:
+                        packet.payload_end = ip_end
+                    return packet
+            elif ip_proto not in IP_DECODERS:
+                packet = PacketView(buf, timestamp, size, seq, ip_proto, src_addr, dst_addr)
+                packet.payload_offset = transport_offset
+                if total_length and ip_end < packet.payload_end:
+                    packet.payload_end = ip_end
+                return packet
+
+    return DecodeChain(buf, timestamp, size, seq, reassembler).run()
+
+
+class DecodeChain:
+    """State for walking one frame's layers through the decoder tables"""
+
+    __slots__ = ('buf', 'timestamp', 'size', 'seq', 'reassembler', 'layers', 'vlan', 'packet',
+                 'packet_layer')
+
+    def __init__(self, buf, timestamp, size, seq, reassembler):
+        self.buf = buf
+        self.timestamp = timestamp
+        self.size = size
+        self.seq = seq
+        self.reassembler = reassembler
+        self.layers = []
+        self.vlan = None
+        self.packet = None
+        self.packet_layer = 0
+
+    def run(self):
+        """Decode layer by layer until a transport header (or a dead end)"""
+        step = (decode_ethertype, ETHERTYPE.unpack_from(self.buf, 12)[0], ETHERNET_HEADER_LEN)
+        try:
+            for _ in range(MAX_LAYERS):
+                decoder, value, offset = step
+                step = decoder(self, value, offset)
+                if step is None:
+                    break
+        except (struct.error, IndexError, ValueError):
+            pass  # Truncated inner layer: keep the outermost complete packet
+
+        packet = self.packet
+        if packet is not None:
+            packet.vlan = self.vlan
+            # Only the layers outside the reported IP header are encapsulation
+            packet.encapsulation = tuple(self.layers[:self.packet_layer])
+        return packet
+
+    def ip_packet(self, ip_proto, src_addr, dst_addr, version, offset, end=None):
+        """Record an IP layer and continue with its payload
+
+        ``end`` is where the IP packet ends in the buffer, when its length
+        field gives one; bytes after it (link-layer padding) are not payload.
+        """
+        self.layers.append(f'ipv{version}')
+        decoder = IP_DECODERS.get(ip_proto)
+        if decoder is not None:
+            # Keep the tunnel packet in case the inner layers cannot be decoded
+            if self.packet is None:
+                self.packet = PacketView(self.buf, self.timestamp, self.size, self.seq,
+                                         ip_proto, src_addr, dst_addr, version)
+                self.packet.payload_offset = offset
+                if end is not None and end < self.packet.payload_end:
+                    self.packet.payload_end = end
+                self.packet_layer = len(self.layers) - 1
+            return decoder, ip_proto, offset
+
+        packet = decode_transport(
+            PacketView(self.buf, self.timestamp, self.size, self.seq, ip_proto, src_addr, dst_addr, version),
+            self.buf, offset)
+        if end is not None and end < packet.payload_end:
+            packet.payload_end = end
+        self.packet = packet
+        self.packet_layer = len(self.layers) - 1
+        if ip_proto == IPPROTO_UDP and packet.dst_port == VXLAN_PORT:
+            return decode_vxlan, None, offset + 8
+        return None
+
+    def fragment(self, key, fragment_offset, more, data_start, data_end,
+                 ip_proto, src_addr, dst_addr, version):
+        """Hand a fragment to the reassembler; continue only when complete"""
+        buf = self.buf
+        if self.reassembler is not None:
+            data = self.reassembler.add(key, fragment_offset, more,
+                                        bytes(buf[data_start:data_end]), self.timestamp)
+            if data is not None:
+                # Reassembled: outer headers followed by the whole datagram payload
+                self.buf = bytes(buf[:data_start]) + data
+                return self.ip_packet(ip_proto, src_addr, dst_addr, version, data_start)
+        elif fragment_offset == 0:
+            # No reassembly: the first fragment still carries the ports
+            return self.ip_packet(ip_proto, src_addr, dst_addr, version, data_start)
+
+        self.layers.append(f'ipv{version}')
+        packet = PacketView(buf, self.timestamp, self.size, self.seq, ip_proto, src_addr, dst_addr, version)
+        packet.payload_offset = len(buf)
+        packet.fragment = True
+        self.packet = packet
+        self.packet_layer = len(self.layers) - 1
+        return None
+
+
+def decode_ethertype(chain, ethertype, offset):
+    decoder = ETHERTYPE_DECODERS.get(ethertype)
+    if decoder is None:
+        return None
+    return decoder(chain, ethertype, offset)
+
+
+def decode_ethernet(chain, _value, offset):
+    """Inner Ethernet frame (VXLAN, GRE transparent bridging)"""
+    chain.layers.append('ethernet')
+    return decode_ethertype, ETHERTYPE.unpack_from(chain.buf, offset + 12)[0], offset + 14
+
+
+def decode_vlan(chain, _ethertype, offset):
+    """802.1Q / 802.1ad tag; the outermost VLAN id is reported"""
+    tci, ethertype = PORTS.unpack_from(chain.buf, offset)
+    if chain.vlan is None:
+        chain.vlan = tci & 0x0FFF
+    chain.layers.append(f'vlan:{tci & 0x0FFF}')
+    return decode_ethertype, ethertype, offset + 4
+
+
+def decode_ipv4(chain, _ethertype, offset):
+    buf = chain.buf
+    version_ihl, total_length, fragment, ip_proto, src_addr, dst_addr = IPV4_HEADER.unpack_from(buf, offset)
+    header_length = (version_ihl & 0x0F) * 4
+    if fragment & 0x3FFF:
+        ident = IPV4_IDENT.unpack_from(buf, offset + 4)[0]
+        return chain.fragment((4, src_addr, dst_addr, ident, ip_proto),
+                              (fragment & 0x1FFF) * 8, bool(fragment & 0x2000),
+                              offset + header_length, offset + total_length,
+                              ip_proto, src_addr, dst_addr, 4)
+    return chain.ip_packet(ip_proto, src_addr, dst_addr, 4, offset + header_length,
+                           offset + total_length if total_length else None)
+
+
+def decode_ipv6(chain, _ethertype, offset):
+    buf = chain.buf
+    payload_length, next_header, src, dst = IPV6_HEADER.unpack_from(buf, offset)
+    src_addr = int.from_bytes(src, 'big')
+    dst_addr = int.from_bytes(dst, 'big')
+    end = offset + 40 + payload_length
+    offset += 40
+
+    # Walk the extension header chain to the upper-layer protocol
+    while True:
+        if next_header in IPV6_EXTENSION_HEADERS:
+            next_header, length = buf[offset], buf[offset + 1]
+            offset += (length + 1) * 8
+        elif next_header == IPV6_AH_HEADER:
+            next_header, length = buf[offset], buf[offset + 1]
+            offset += (length + 2) * 4
+        elif next_header == IPV6_FRAGMENT_HEADER:
+            next_header, fragment, ident = IPV6_FRAGMENT.unpack_from(buf, offset)
+            offset += 8
+            if fragment & 0xFFF9:
+                return chain.fragment((6, src_addr, dst_addr, ident, next_header),
+                                      fragment & 0xFFF8, bool(fragment & 1),
+                                      offset, end, next_header, src_addr, dst_addr, 6)
+        else:
+            break
+
+    return chain.ip_packet(next_header, src_addr, dst_addr, 6, offset, end if payload_length else None)
+
+
+def decode_ip_in_ip(chain, ip_proto, offset):
+    ethertype = ETH_P_IP if ip_proto == IPPROTO_IPIP else ETH_P_IPV6
+    return decode_ethertype, ethertype, offset
+
+
+def decode_gre(chain, _ip_proto, offset):
+    """GRE (RFC 2784/2890): skip optional checksum, key and sequence fields"""
+    flags, ethertype = GRE_HEADER.unpack_from(chain.buf, offset)
+    chain.layers.append('gre')
+    offset += 4
+    if flags & 0x8000:
+        offset += 4
+    if flags & 0x2000:
+        offset += 4
+    if flags & 0x1000:
+        offset += 4
+    if ethertype == ETH_P_TEB:
+        return decode_ethernet, None, offset
+    return decode_ethertype, ethertype, offset
+
+
+def decode_vxlan(chain, _value, offset):
+    chain.layers.append('vxlan')
+    return decode_ethernet, None, offset + 8
+
+
+ETHERTYPE_DECODERS = {
+    ETH_P_IP: decode_ipv4,
+    ETH_P_IPV6: decode_ipv6
+}
+for _ethertype in VLAN_ETHERTYPES:
+    ETHERTYPE_DECODERS[_ethertype] = decode_vlan
+
+IP_DECODERS = {
+    IPPROTO_IPIP: decode_ip_in_ip,
+    IPPROTO_IPV6: decode_ip_in_ip,
+    IPPROTO_GRE: decode_gre
+}
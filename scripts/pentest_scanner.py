@@ -5,134 +5,160 @@ Advanced vulnerability scanning and network reconnaissance tool
 """
 
 import socket
-import threading
 import subprocess
 import json
 import sys
+import asyncio
+import argparse
 from datetime import datetime
-import requests
-import ssl
 import nmap
 from urllib.parse import urljoin, urlparse
 import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from scan_engine import (ConnectScanner, ScanScheduler, parse_ports, OPEN, DEFAULT_CONCURRENCY,
+                         DEFAULT_TIMEOUT, DEFAULT_PER_HOST, DEFAULT_ACTIVE_HOSTS)
+from scan_targets import expand_target, iter_targets
+from banner_grabber import BannerGrabber, DEFAULT_TIMEOUT as BANNER_TIMEOUT, DEFAULT_IN_FLIGHT
+from service_db import default_database
+from http_client import HTTPClient, DEFAULT_PER_HOST as HTTP_PER_HOST
+from tls_scanner import TLSScanner, DEFAULT_HANDSHAKES, EXPIRY_WARNING_DAYS, refresh_validity
+from scan_store import ScanStore, DEFAULT_TTL, HOST_PROBE, diff_host
+
+# Hosts whose vulnerability checks run at the same time
+ASSESS_WORKERS = 16
+
+# Per-port checks whose findings are stored and reused like banners
+CHECK_PROBES = ('web', 'ssh', 'ftp')
+
+# Paths requested by the web content check unless a wordlist is given
+COMMON_FILES = ["/robots.txt", "/.htaccess", "/config.php", "/admin.php"]
+
+def load_wordlist(filename):
+    """Paths of a content-discovery wordlist, one per line; '#' starts a comment"""
+    paths = []
+    seen = set()
+    with open(filename, errors='ignore') as f:
+        for line in f:
+            path = line.split('#', 1)[0].strip()
+            if not path:
+                continue
+            if not path.startswith('/'):
+                path = '/' + path
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
 
 class NetworkScanner:
-    def __init__(self, target):
+    def __init__(self, target, concurrency=DEFAULT_CONCURRENCY, rate=None, timeout=DEFAULT_TIMEOUT,
+                 banner_timeout=BANNER_TIMEOUT, web_paths=None, http_concurrency=HTTP_PER_HOST, tls_scanner=None):
         self.target = target
         self.open_ports = []
         self.services = []
         self.vulnerabilities = []
+        self.engine = ConnectScanner(concurrency=concurrency, rate=rate, timeout=timeout)
+        self.banner_timeout = banner_timeout
+        self.service_db = default_database()  # Port names, probes and banner fingerprints
+        self.scan_stats = {}
+        self.web_paths = web_paths if web_paths is not None else COMMON_FILES
+        self.http_concurrency = http_concurrency  # Requests in flight to each web port
+        self.web_stats = {}
+        self.tls_scanner = tls_scanner or TLSScanner()  # May be shared; caches results per (host, port)
+        self.tls_results = []
+        self.check_results = {}  # (port, 'web'|'ssh'|'ftp') -> findings; seeded entries are not re-checked
         
-    def port_scan(self, start_port=1, end_port=1000):
-        """Perform TCP port scan"""
+    def port_scan(self, start_port=1, end_port=1000, ports=None):
+        """Perform TCP connect scan
+
+        ``ports`` (any iterable) overrides the ``start_port``..``end_port``
+        range. Open ports are reported as they are found.
+        """
         print(f"[+] Starting port scan on {self.target}")
+        if ports is None:
+            ports = range(start_port, end_port + 1)
+        start_time = time.time()
         
-        def scan_port(port):
-            try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(1)
-                result = sock.connect_ex((self.target, port))
-                if result == 0:
-                    self.open_ports.append(port)
-                    print(f"[+] Port {port} is open")
-                sock.close()
-            except:
-                pass
+        def on_result(result):
+            if result['state'] == OPEN:
+                self.open_ports.append(result['port'])
+                print(f"[+] Port {result['port']} is open")
         
-        threads = []
-        for port in range(start_port, end_port + 1):
-            thread = threading.Thread(target=scan_port, args=(port,))
-            threads.append(thread)
-            thread.start()
-            
-            # Limit concurrent threads
-            if len(threads) >= 100:
-                for t in threads:
-                    t.join()
-                threads = []
+        try:
+            results = self.engine.scan_ports(self.target, ports, on_result)
+        except socket.gaierror as e:
+            print(f"[-] Cannot resolve {self.target}: {e}")
+            return self.open_ports
         
-        # Wait for remaining threads
-        for thread in threads:
-            thread.join()
-            
+        self.open_ports.sort()
+        host = self.engine.hosts[self.target]
+        self.scan_stats = dict(host.counters, duration=round(time.time() - start_time, 2),
+                               rtt_timeout=round(host.rtt.timeout, 3))
+        print(f"[+] Scanned {len(results)} ports in {self.scan_stats['duration']:.2f}s "
+              f"({host.counters['closed']} closed, {host.counters['filtered']} filtered)")
         return self.open_ports
     
+    def load_port_scan(self, job):
+        """Take the port scan results of a completed ``ScanJob``"""
+        self.open_ports = job.open_ports
+        host = job.state
+        self.scan_stats = dict(host.counters, duration=round(job.duration, 2),
+                               rtt_timeout=round(host.rtt.timeout, 3))
+    
+    def assess(self, detect_services=True):
+        """Service detection and vulnerability checks on the scanned ports; returns the report
+
+        Pass ``detect_services=False`` when ``services`` was already filled
+        from banners grabbed during the port scan.
+        """
+        if detect_services:
+            self.service_detection()
+        self.vulnerability_scan()
+        return self.generate_report()
+    
     def service_detection(self):
         """Detect services running on open ports"""
         print(f"[+] Detecting services on {self.target}")
         
-        common_services = {
-            21: "FTP",
-            22: "SSH", 
-            23: "Telnet",
-            25: "SMTP",
-            53: "DNS",
-            80: "HTTP",
-            110: "POP3",
-            143: "IMAP",
-            443: "HTTPS",
-            993: "IMAPS",
-            995: "POP3S",
-            3306: "MySQL",
-            5432: "PostgreSQL",
-            6379: "Redis",
-            27017: "MongoDB"
-        }
-        
-        for port in self.open_ports:
-            service_name = common_services.get(port, "Unknown")
-            
-            # Try to grab banner
-            try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(3)
-                sock.connect((self.target, port))
-                
-                if port == 80:
-                    sock.send(b"HEAD / HTTP/1.0\r\n\r\n")
-                elif port == 21:
-                    pass  # FTP sends banner automatically
-                else:
-                    sock.send(b"\r\n")
-                
-                banner = sock.recv(1024).decode('utf-8', errors='ignore').strip()
-                sock.close()
-                
-                self.services.append({
-                    "port": port,
-                    "service": service_name,
-                    "banner": banner[:100] if banner else "No banner",
-                    "version": self.extract_version(banner) if banner else "Unknown"
-                })
-                
-            except:
-                self.services.append({
-                    "port": port,
-                    "service": service_name,
-                    "banner": "Connection failed",
-                    "version": "Unknown"
-                })
+        # All banners are grabbed concurrently
+        async def grab_all():
+            grabber = BannerGrabber(self.banner_timeout)
+            return await asyncio.gather(*(grabber.grab(self.target, port) for port in self.open_ports))
         
+        banners = asyncio.run(grab_all())
+        self.services = [self.service_record(port, banner) for port, banner in zip(self.open_ports, banners)]
         return self.services
     
-    def extract_version(self, banner):
+    def service_record(self, port, data):
+        """Service entry for a port from its grabbed banner bytes (None if unreachable)"""
+        service_name = self.service_db.service_name(port)
+        if data is None:
+            return {
+                "port": port,
+                "service": service_name,
+                "banner": "Connection failed",
+                "version": "Unknown"
+            }
+        
+        banner = data.decode('utf-8', errors='ignore').strip()
+        match = self.service_db.identify(banner, port)
+        if match is not None and service_name == "Unknown":
+            service_name = match['service'] or service_name
+        return {
+            "port": port,
+            "service": service_name,
+            "banner": banner[:100] if banner else "No banner",
+            "product": match['product'] if match else "",
+            "version": self.extract_version(banner, port) if banner else "Unknown"
+        }
+    
+    def extract_version(self, banner, port=None):
         """Extract version information from service banner"""
-        if "Apache" in banner:
-            try:
-                return banner.split("Apache/")[1].split()[0]
-            except:
-                return "Apache (version unknown)"
-        elif "nginx" in banner:
-            try:
-                return banner.split("nginx/")[1].split()[0]
-            except:
-                return "nginx (version unknown)"
-        elif "OpenSSH" in banner:
-            try:
-                return banner.split("OpenSSH_")[1].split()[0]
-            except:
-                return "OpenSSH (version unknown)"
-        return "Unknown"
+        match = self.service_db.identify(banner, port)
+        if match is None or not match['product']:
+            return "Unknown"
+        return match['version'] or f"{match['product']} (version unknown)"
     
     def vulnerability_scan(self):
         """Check for common vulnerabilities"""
@@ -142,90 +168,192 @@ class NetworkScanner:
         if 80 in self.open_ports or 443 in self.open_ports:
             self.check_web_vulnerabilities()
         
+        # Check TLS on every port that may speak it
+        self.check_tls_vulnerabilities()
+        
         # Check for SSH vulnerabilities
         if 22 in self.open_ports:
-            self.check_ssh_vulnerabilities()
+            self.run_check(22, 'ssh', self.check_ssh_vulnerabilities)
         
         # Check for FTP vulnerabilities
         if 21 in self.open_ports:
-            self.check_ftp_vulnerabilities()
+            self.run_check(21, 'ftp', self.check_ftp_vulnerabilities)
             
         return self.vulnerabilities
     
+    def run_check(self, port, probe, check):
+        """Run one port's check, or reuse its findings from ``check_results``
+
+        Findings are only recorded when the check completed; a check that
+        could not reach the service is run again next time.
+        """
+        findings = self.check_results.get((port, probe))
+        if findings is not None:
+            self.vulnerabilities.extend(findings)
+            return
+        start = len(self.vulnerabilities)
+        if check():
+            self.check_results[(port, probe)] = self.vulnerabilities[start:]
+    
     def check_web_vulnerabilities(self):
         """Check for web application vulnerabilities"""
         protocols = []
-        if 80 in self.open_ports:
-            protocols.append("http")
-        if 443 in self.open_ports:
-            protocols.append("https")
+        for port, protocol in ((80, "http"), (443, "https")):
+            if port not in self.open_ports:
+                continue
+            findings = self.check_results.get((port, 'web'))
+            if findings is not None:
+                self.vulnerabilities.extend(findings)
+            else:
+                protocols.append(protocol)
+        if not protocols:
+            return
+        start = len(self.vulnerabilities)
         
-        for protocol in protocols:
-            base_url = f"{protocol}://{self.target}"
-            
+        # Every web check for the target shares one pool of keep-alive connections
+        async def check_all():
+            async with HTTPClient(self.http_concurrency) as client:
+                completed = await asyncio.gather(*(self.check_web_paths(client, protocol)
+                                                   for protocol in protocols))
+            return client.counters, completed
+        
+        counters, completed = asyncio.run(check_all())
+        self.web_stats = dict(counters, paths=len(self.web_paths))
+        # Both ports are checked at once, so their findings are split by port
+        for protocol, done in zip(protocols, completed):
+            port = 443 if protocol == "https" else 80
+            if done:
+                self.check_results[(port, 'web')] = [v for v in self.vulnerabilities[start:] if v["port"] == port]
+        print(f"[+] {self.target}: {self.web_stats['requests']} web requests over "
+              f"{self.web_stats['connections']} connections")
+    
+    async def check_web_paths(self, client, protocol):
+        """Directory listing and sensitive file checks on one web port
+
+        Returns True when every request got a response, so the findings are complete.
+        """
+        base_url = f"{protocol}://{self.target}"
+        port = 443 if protocol == "https" else 80
+        
+        async def fetch(path):
             try:
-                # Check for directory listing
-                response = requests.get(f"{base_url}/admin/", timeout=5, verify=False)
-                if "Index of" in response.text or "Directory listing" in response.text:
-                    self.vulnerabilities.append({
-                        "type": "Directory Listing",
-                        "severity": "Medium",
-                        "description": "Directory listing enabled on /admin/ path",
-                        "port": 443 if protocol == "https" else 80,
-                        "service": protocol.upper(),
-                        "recommendation": "Disable directory listing and implement proper access controls"
-                    })
-                
-                # Check for common files
-                common_files = ["/robots.txt", "/.htaccess", "/config.php", "/admin.php"]
-                for file_path in common_files:
-                    try:
-                        response = requests.get(f"{base_url}{file_path}", timeout=3, verify=False)
-                        if response.status_code == 200:
-                            self.vulnerabilities.append({
-                                "type": "Information Disclosure",
-                                "severity": "Low",
-                                "description": f"Sensitive file {file_path} is accessible",
-                                "port": 443 if protocol == "https" else 80,
-                                "service": protocol.upper(),
-                                "recommendation": f"Restrict access to {file_path} or remove if not needed"
-                            })
-                    except:
-                        continue
-                
-                # Check SSL configuration for HTTPS
-                if protocol == "https":
-                    self.check_ssl_vulnerabilities()
-                        
-            except requests.RequestException:
-                pass
+                return await client.get(f"{base_url}{path}")
+            except (OSError, asyncio.TimeoutError):
+                return None
+        
+        # Check for directory listing
+        response = await fetch("/admin/")
+        if response is None:
+            return False
+        if "Index of" in response.text or "Directory listing" in response.text:
+            self.vulnerabilities.append({
+                "type": "Directory Listing",
+                "severity": "Medium",
+                "description": "Directory listing enabled on /admin/ path",
+                "port": port,
+                "service": protocol.upper(),
+                "recommendation": "Disable directory listing and implement proper access controls"
+            })
+        
+        # Check for common files, all paths in flight under the per-host limit
+        responses = await asyncio.gather(*(fetch(file_path) for file_path in self.web_paths))
+        for file_path, response in zip(self.web_paths, responses):
+            if response is not None and response.status == 200:
+                self.vulnerabilities.append({
+                    "type": "Information Disclosure",
+                    "severity": "Low",
+                    "description": f"Sensitive file {file_path} is accessible",
+                    "port": port,
+                    "service": protocol.upper(),
+                    "recommendation": f"Restrict access to {file_path} or remove if not needed"
+                })
+        return all(response is not None for response in responses)
     
-    def check_ssl_vulnerabilities(self):
-        """Check SSL/TLS configuration"""
-        try:
-            context = ssl.create_default_context()
-            with socket.create_connection((self.target, 443), timeout=5) as sock:
-                with context.wrap_socket(sock, server_hostname=self.target) as ssock:
-                    cert = ssock.getpeercert()
-                    cipher = ssock.cipher()
-                    
-                    # Check for weak ciphers
-                    if cipher and len(cipher) > 1:
-                        cipher_name = cipher[0]
-                        if any(weak in cipher_name.lower() for weak in ['rc4', 'des', 'md5']):
-                            self.vulnerabilities.append({
-                                "type": "Weak SSL Configuration",
-                                "severity": "High",
-                                "description": f"Weak cipher suite detected: {cipher_name}",
-                                "port": 443,
-                                "service": "HTTPS",
-                                "recommendation": "Configure strong cipher suites and disable weak protocols"
-                            })
-        except:
-            pass
+    def tls_candidates(self):
+        """Open ports that may speak TLS: all but those that sent a plaintext banner"""
+        plaintext = {service["port"] for service in self.services
+                     if service["banner"] not in ("No banner", "Connection failed")
+                     and all(char.isprintable() or char in "\r\n\t" for char in service["banner"])}
+        return [port for port in self.open_ports if port not in plaintext]
+    
+    def check_tls_vulnerabilities(self):
+        """Check protocol versions, cipher suites and certificates of TLS ports"""
+        ports = self.tls_candidates()
+        if not ports:
+            return
+        results = asyncio.run(self.tls_scanner.assess_ports(self.target, ports))
+        self.tls_results = [result for result in results if result["tls"]]
+        services = {service["port"]: service["service"] for service in self.services}
+        
+        for result in self.tls_results:
+            port = result["port"]
+            service = services.get(port, "Unknown")
+            if service == "Unknown":
+                service = "TLS"
+            
+            # Check for weak ciphers and protocols
+            if result["weak_ciphers"]:
+                self.vulnerabilities.append({
+                    "type": "Weak SSL Configuration",
+                    "severity": "High",
+                    "description": f"Weak cipher suites accepted: {', '.join(result['weak_ciphers'])}",
+                    "port": port,
+                    "service": service,
+                    "recommendation": "Configure strong cipher suites and disable weak protocols"
+                })
+            if result["weak_protocols"]:
+                self.vulnerabilities.append({
+                    "type": "Deprecated TLS Protocol",
+                    "severity": "Medium",
+                    "description": f"Deprecated protocol versions enabled: {', '.join(result['weak_protocols'])}",
+                    "port": port,
+                    "service": service,
+                    "recommendation": "Disable TLS 1.0 and 1.1 and require TLS 1.2 or later"
+                })
+            
+            # Check the certificate
+            cert = result["certificate"]
+            if not cert or "error" in cert:
+                continue
+            if cert["expired"]:
+                self.vulnerabilities.append({
+                    "type": "Expired Certificate",
+                    "severity": "High",
+                    "description": f"Certificate for {cert['subject']} expired on {cert['not_after']}",
+                    "port": port,
+                    "service": service,
+                    "recommendation": "Renew the certificate"
+                })
+            elif cert["days_left"] < EXPIRY_WARNING_DAYS:
+                self.vulnerabilities.append({
+                    "type": "Certificate Expiring Soon",
+                    "severity": "Low",
+                    "description": f"Certificate for {cert['subject']} expires on {cert['not_after']}",
+                    "port": port,
+                    "service": service,
+                    "recommendation": "Renew the certificate before it expires"
+                })
+            elif result["trusted"] is False:
+                self.vulnerabilities.append({
+                    "type": "Untrusted Certificate",
+                    "severity": "Medium",
+                    "description": f"Certificate for {cert['subject']} does not verify: {result['verify_error']}",
+                    "port": port,
+                    "service": service,
+                    "recommendation": "Use a certificate issued by a trusted CA that matches the host name"
+                })
+            if any(weak in cert["signature_algorithm"].lower() for weak in ['md5', 'sha1']):
+                self.vulnerabilities.append({
+                    "type": "Weak Certificate Signature",
+                    "severity": "Medium",
+                    "description": f"Certificate is signed with {cert['signature_algorithm']}",
+                    "port": port,
+                    "service": service,
+                    "recommendation": "Reissue the certificate with a SHA-256 or stronger signature"
+                })
     
     def check_ssh_vulnerabilities(self):
-        """Check SSH configuration"""
+        """Check SSH configuration; returns False when the check could not complete"""
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.settimeout(5)
@@ -248,10 +376,11 @@ class NetworkScanner:
                         "recommendation": "Update SSH to the latest stable version"
                     })
         except:
-            pass
+            return False
+        return True
     
     def check_ftp_vulnerabilities(self):
-        """Check FTP configuration"""
+        """Check FTP configuration; returns False when the check could not complete"""
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.settimeout(5)
@@ -274,7 +403,8 @@ class NetworkScanner:
             
             sock.close()
         except:
-            pass
+            return False
+        return True
     
     def generate_report(self):
         """Generate comprehensive scan report"""
@@ -288,35 +418,198 @@ class NetworkScanner:
                 "critical_high": len([v for v in self.vulnerabilities if v["severity"] in ["Critical", "High"]])
             },
             "open_ports": self.open_ports,
+            "port_scan": self.scan_stats,
+            "web_checks": self.web_stats,
+            "tls": self.tls_results,
             "services": self.services,
             "vulnerabilities": self.vulnerabilities
         }
         
         return report
 
+async def audit_targets(targets, ports, engine, per_host=DEFAULT_PER_HOST, max_hosts=DEFAULT_ACTIVE_HOSTS,
+                        on_report=None, grabber=None, scanner_options=None, store=None, full=False):
+    """Port-scan every target through one scheduler, assessing each host as it completes
+
+    Banner grabs start the moment a port is found open and overlap the
+    rest of the scan; ``grabber`` bounds how many run at once.
+    ``scanner_options`` are passed to each host's ``NetworkScanner``.
+    ``on_report(report)`` is called with each host's report as soon as
+    it is ready. Returns the number of hosts scanned.
+
+    With a ``ScanStore``, fresh closed and filtered ports are not probed
+    again, and fresh banners, TLS assessments and web, SSH and FTP check
+    findings of ports that stayed open are reused. Each report gains a
+    "changes" diff against the stored results. ``full`` probes
+    everything but still records and diffs.
+    """
+    loop = asyncio.get_running_loop()
+    scheduler = ScanScheduler(engine, per_host=per_host, max_hosts=max_hosts)
+    if grabber is None:
+        grabber = BannerGrabber()
+    assessments = []
+    grabs = {}  # Host -> [(port, banner task)]
+    histories = {}  # Host -> HostHistory
+    reused = {}  # Host -> {port: stored service record}
+    
+    def ports_for(host):
+        history = histories[host] = store.history(host)
+        return ports if full else history.ports_to_probe(ports)
+    
+    def on_result(job, result):
+        if result['state'] == OPEN:
+            print(f"[+] {job.host}: port {result['port']} is open")
+            history = histories.get(job.host)
+            service = history.reusable(result['port'], 'banner') if history and not full else None
+            if service is not None:
+                reused.setdefault(job.host, {})[result['port']] = service
+                return
+            task = asyncio.ensure_future(grabber.grab(job.state.address, result['port']))
+            grabs.setdefault(job.host, []).append((result['port'], task))
+    
+    async def assess(job, scanner):
+        host_grabs = sorted(grabs.pop(job.host, ()))
+        banners = await asyncio.gather(*(task for _port, task in host_grabs))
+        services = [scanner.service_record(port, banner) for (port, _task), banner in zip(host_grabs, banners)]
+        host_reused = reused.pop(job.host, {})
+        scanner.services = sorted(services + list(host_reused.values()), key=lambda service: service["port"])
+        
+        history = histories.pop(job.host, None)
+        seeded = set()
+        seeded_checks = set()
+        if history and not full:
+            for port in job.open_ports:
+                tls = history.reusable(port, 'tls')
+                if tls is not None:
+                    scanner.tls_scanner.results[(job.host, port)] = refresh_validity(tls)
+                    seeded.add(port)
+                for probe in CHECK_PROBES:
+                    findings = history.reusable(port, probe)
+                    if findings is not None:
+                        scanner.check_results[(port, probe)] = findings
+                        seeded_checks.add((port, probe))
+        
+        report = await loop.run_in_executor(executor, scanner.assess, False)
+        if store is not None:
+            results = [(result['port'], 'port', result['state']) for result in job.results]
+            results.extend((service["port"], 'banner', service) for service in services)
+            results.extend((port, 'tls', scanner.tls_scanner.results[(job.host, port)])
+                           for port in scanner.tls_candidates()
+                           if port not in seeded and (job.host, port) in scanner.tls_scanner.results)
+            results.extend((port, probe, findings) for (port, probe), findings in scanner.check_results.items()
+                           if (port, probe) not in seeded_checks)
+            results.append((HOST_PROBE, 'vulnerabilities', scanner.vulnerabilities))
+            report["changes"] = diff_host(history, {result['port']: result['state'] for result in job.results},
+                                          scanner.services, scanner.vulnerabilities)
+            report["cache"] = {
+                "ports_reused": len(ports) - len(job.results),
+                "banners_reused": len(host_reused),
+                "tls_reused": len(seeded),
+                "checks_reused": len(seeded_checks)
+            }
+            store.update(history, results)
+        on_report(report)
+    
+    with ThreadPoolExecutor(max_workers=ASSESS_WORKERS) as executor:
+        async for job in scheduler.run(targets, ports, on_result, ports_for if store is not None else None):
+            if job.error:
+                print(f"[-] {job.error}")
+                histories.pop(job.host, None)
+                on_report({"target": job.host, "scan_time": datetime.now().isoformat(), "error": job.error})
+                continue
+            print(f"[+] {job.host}: {len(job.open_ports)} open ports in {job.duration:.2f}s")
+            scanner = NetworkScanner(job.host, **(scanner_options or {}))
+            scanner.load_port_scan(job)
+            assessments.append(asyncio.ensure_future(assess(job, scanner)))
+        await asyncio.gather(*assessments)
+    return len(assessments)
+
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python3 pentest_scanner.py <target>")
+    parser = argparse.ArgumentParser(description='Network Security Scanner')
+    parser.add_argument('targets', nargs='*', metavar='target',
+                        help='Hosts, addresses, CIDR blocks (10.0.0.0/24), ranges (10.0.0.1-20) or @file; '
+                             'only scan hosts you are authorised to test')
+    parser.add_argument('-iL', '--target-file', action='append', default=[],
+                        help='File with one target per line (repeatable)')
+    parser.add_argument('--ports', default='1-1000',
+                        help='Ports to scan, e.g. "22,80,8000-8100" or "-" for all (default 1-1000)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='Connection attempts in flight at once')
+    parser.add_argument('--rate', type=float, help='Maximum connection attempts per second to each host')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help='Initial connect timeout in seconds, adapted to the measured RTT')
+    parser.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST,
+                        help='Connection attempts in flight to any one host')
+    parser.add_argument('--max-hosts', type=int, default=DEFAULT_ACTIVE_HOSTS,
+                        help='Targets scanned at the same time')
+    parser.add_argument('--banner-timeout', type=float, default=BANNER_TIMEOUT,
+                        help='Seconds to wait for a service banner')
+    parser.add_argument('--banner-concurrency', type=int, default=DEFAULT_IN_FLIGHT,
+                        help='Banner grabs in flight at once')
+    parser.add_argument('--wordlist', action='append', default=[],
+                        help='File of paths for the web content check, one per line (repeatable)')
+    parser.add_argument('--http-concurrency', type=int, default=HTTP_PER_HOST,
+                        help='Keep-alive connections and requests in flight to each web port')
+    parser.add_argument('--tls-concurrency', type=int, default=DEFAULT_HANDSHAKES,
+                        help='TLS handshakes in flight to each TLS port')
+    parser.add_argument('--cache', metavar='FILE',
+                        help='SQLite result store; rescans skip fresh results and report changes')
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL / 3600,
+                        help='Hours a stored result stays fresh (default %(default)g)')
+    parser.add_argument('--full-rescan', action='store_true',
+                        help='Probe everything even if fresh, still recording and diffing against the cache')
+    parser.add_argument('--output', help='Append each host report to this file as a JSON line')
+    args = parser.parse_args()
+    
+    if not args.targets and not args.target_file:
+        parser.error('at least one target or --target-file is required')
+    try:
+        ports = parse_ports(args.ports)
+        web_paths = None
+        if args.wordlist:
+            web_paths = list(dict.fromkeys(path for filename in args.wordlist for path in load_wordlist(filename)))
+        for spec in args.targets:
+            list(islice(expand_target(spec), 1))
+    except (ValueError, OSError) as e:
+        print(f"[-] Invalid scan arguments: {e}")
         sys.exit(1)
     
-    target = sys.argv[1]
+    targets = iter_targets(args.targets, args.target_file)
     
-    print(f"[+] Starting security scan of {target}")
+    print(f"[+] Starting security scan of {', '.join(args.targets + args.target_file)}")
     print("=" * 50)
     
-    scanner = NetworkScanner(target)
+    output = open(args.output, 'a') if args.output else None
+    store = ScanStore(args.cache, ttl=args.cache_ttl * 3600) if args.cache else None
     
-    # Perform scans
-    scanner.port_scan(1, 1000)
-    scanner.service_detection()
-    scanner.vulnerability_scan()
+    def on_report(report):
+        # Each host's report is printed as soon as its checks finish
+        print("\n" + "=" * 50)
+        print(f"SCAN COMPLETE: {report['target']}")
+        print("=" * 50)
+        print(json.dumps(report, indent=2))
+        if output is not None:
+            output.write(json.dumps(report) + "\n")
+            output.flush()
     
-    # Generate and print report
-    report = scanner.generate_report()
-    print("\n" + "=" * 50)
-    print("SCAN COMPLETE")
-    print("=" * 50)
-    print(json.dumps(report, indent=2))
+    engine = ConnectScanner(concurrency=args.concurrency, rate=args.rate, timeout=args.timeout)
+    start_time = time.time()
+    try:
+        grabber = BannerGrabber(args.banner_timeout, args.banner_concurrency)
+        scanner_options = {"web_paths": web_paths, "http_concurrency": args.http_concurrency,
+                           "tls_scanner": TLSScanner(max_handshakes=args.tls_concurrency)}
+        hosts = asyncio.run(audit_targets(targets, ports, engine, args.per_host, args.max_hosts, on_report,
+                                          grabber, scanner_options, store, args.full_rescan))
+    except KeyboardInterrupt:
+        print("\n[+] Scan interrupted by user")
+        hosts = None
+    finally:
+        if output is not None:
+            output.close()
+        if store is not None:
+            store.close()
+    if hosts is not None:
+        print(f"\n[+] Scanned {hosts} hosts in {time.time() - start_time:.2f}s")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Rate Metrics - Time-bucketed traffic counters in preallocated arrays
+Per-second and per-minute rings for bytes, packets, threats and protocols
+
+Each ring holds one bucket per interval and tags it with the interval
+number it belongs to; a bucket is zeroed lazily the first time a packet
+from a newer interval lands in it. Updates are O(1) and rate/percentile
+queries walk at most one ring, so results are exact at any packet rate.
+
+Each series in a snapshot carries the interval number it ends at, so
+snapshots taken at different times (one per pipeline worker) can be
+shifted onto the same intervals with ``align_rates`` before they are
+added up.
+"""
+
+from array import array
+
+SECOND_BUCKETS = 60
+MINUTE_BUCKETS = 60
+PROTOCOL_SLOTS = 32
+OTHER_PROTOCOL = 'OTHER'
+
+
+class CounterRing:
+    """Fixed ring of counters, one bucket per ``interval`` seconds"""
+
+    def __init__(self, interval, buckets, protocol_slots):
+        self.interval = interval
+        self.buckets = buckets
+        self.protocol_slots = protocol_slots
+        self.epochs = array('q', [-1]) * buckets
+        self.bytes = array('Q', [0]) * buckets
+        self.packets = array('Q', [0]) * buckets
+        self.threats = array('Q', [0]) * buckets
+        self.protocols = array('Q', [0]) * (buckets * protocol_slots)
+
+    def add(self, timestamp, size, threat, protocol_slot):
+        """Count one packet in the bucket for ``timestamp``"""
+        epoch = int(timestamp // self.interval)
+        index = epoch % self.buckets
+
+        if self.epochs[index] != epoch:
+            if epoch < self.epochs[index]:
+                return  # Older than the ring's window
+            self.epochs[index] = epoch
+            self.bytes[index] = 0
+            self.packets[index] = 0
+            self.threats[index] = 0
+            row = index * self.protocol_slots
+            self.protocols[row:row + self.protocol_slots] = array('Q', [0]) * self.protocol_slots
+
+        self.bytes[index] += size
+        self.packets[index] += 1
+        if threat:
+            self.threats[index] += 1
+        self.protocols[index * self.protocol_slots + protocol_slot] += 1
+
+    def series(self, now):
+        """Per-interval totals for the ring's window, oldest first
+
+        Intervals with no traffic (or already overwritten) count as zero.
+        """
+        current = int(now // self.interval)
+        series = {'bytes': [], 'packets': [], 'threats': [], 'end': current}
+
+        for epoch in range(current - self.buckets + 1, current + 1):
+            index = epoch % self.buckets
+            if self.epochs[index] == epoch:
+                series['bytes'].append(self.bytes[index])
+                series['packets'].append(self.packets[index])
+                series['threats'].append(self.threats[index])
+            else:
+                series['bytes'].append(0)
+                series['packets'].append(0)
+                series['threats'].append(0)
+
+        return series
+
+    def protocol_totals(self, now):
+        """Per-slot packet counts summed over the ring's window"""
+        current = int(now // self.interval)
+        totals = [0] * self.protocol_slots
+
+        for epoch in range(current - self.buckets + 1, current + 1):
+            index = epoch % self.buckets
+            if self.epochs[index] == epoch:
+                row = index * self.protocol_slots
+                for slot, count in enumerate(self.protocols[row:row + self.protocol_slots]):
+                    totals[slot] += count
+
+        return totals
+
+
+class RateMetrics:
+    """Per-second and per-minute traffic rates with protocol breakdown"""
+
+    def __init__(self, seconds=SECOND_BUCKETS, minutes=MINUTE_BUCKETS, protocol_slots=PROTOCOL_SLOTS):
+        self.per_second = CounterRing(1, seconds, protocol_slots)
+        self.per_minute = CounterRing(60, minutes, protocol_slots)
+        # The last slot collects protocols seen after the table filled up
+        self.protocol_names = [None] * protocol_slots
+        self.protocol_names[-1] = OTHER_PROTOCOL
+        self.protocol_slot = {}
+
+    def add(self, timestamp, size, threat, protocol):
+        """Count one packet"""
+        slot = self.protocol_slot.get(protocol)
+        if slot is None:
+            slot = self._assign_slot(protocol)
+        self.per_second.add(timestamp, size, threat, slot)
+        self.per_minute.add(timestamp, size, threat, slot)
+
+    def _assign_slot(self, protocol):
+        slot = len(self.protocol_slot)
+        if slot >= len(self.protocol_names) - 1:
+            slot = len(self.protocol_names) - 1
+        else:
+            self.protocol_names[slot] = protocol
+        self.protocol_slot[protocol] = slot
+        return slot
+
+    def snapshot(self, now):
+        """Mergeable series and per-protocol counts as of ``now``"""
+        protocols = {}
+        for slot, count in enumerate(self.per_second.protocol_totals(now)):
+            if count:
+                protocols[self.protocol_names[slot]] = count
+
+        return {
+            'seconds': self.per_second.series(now),
+            'minutes': self.per_minute.series(now),
+            'protocols_last_minute': protocols
+        }
+
+
+def shift_series(series, end):
+    """Copy of a series moved to end at interval ``end``, without its ``'end'`` tag"""
+    shift = end - series['end']
+    shifted = {}
+    for name, values in series.items():
+        if name == 'end':
+            continue
+        if abs(shift) >= len(values):
+            shifted[name] = [0] * len(values)
+        elif shift >= 0:
+            shifted[name] = values[shift:] + [0] * shift
+        else:
+            shifted[name] = [0] * -shift + values[:shift]
+    return shifted
+
+
+def align_rates(snapshots, now=None):
+    """Put the rate series of several statistics snapshots on the same intervals
+
+    Series are shifted to end at the interval of ``now`` (default: the
+    newest interval any snapshot reached), so adding them element-wise
+    adds up the same seconds and minutes. Returns shallow copies of the
+    snapshots.
+    """
+    aligned = [dict(snapshot) for snapshot in snapshots]
+    for ring, interval in (('seconds', 1), ('minutes', 60)):
+        tagged = [snapshot['rates'][ring] for snapshot in aligned
+                  if 'end' in snapshot.get('rates', {}).get(ring, {})]
+        if not tagged:
+            continue
+        end = int(now // interval) if now is not None else max(series['end'] for series in tagged)
+        for snapshot in aligned:
+            rates = snapshot.get('rates')
+            if rates and 'end' in rates.get(ring, {}):
+                rates = snapshot['rates'] = dict(rates)
+                rates[ring] = shift_series(rates[ring], end)
+    return aligned
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(int(round(fraction * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize_rates(rates):
+    """Turn merged per-second and per-minute series into rate figures"""
+    seconds = rates.get('seconds', {})
+    minutes = rates.get('minutes', {})
+    bytes_per_second = seconds.get('bytes', [])
+    packets_per_second = seconds.get('packets', [])
+    window = len(bytes_per_second) or 1
+
+    return {
+        'bandwidth_bps': sum(bytes_per_second) / window,
+        'packets_per_second': sum(packets_per_second) / window,
+        'threats_last_minute': sum(seconds.get('threats', [])),
+        'bandwidth_bps_p50': percentile(bytes_per_second, 0.50),
+        'bandwidth_bps_p95': percentile(bytes_per_second, 0.95),
+        'bandwidth_bps_p99': percentile(bytes_per_second, 0.99),
+        'bandwidth_bps_peak': max(bytes_per_second) if bytes_per_second else 0,
+        'packets_per_second_p95': percentile(packets_per_second, 0.95),
+        'bytes_per_minute': minutes.get('bytes', []),
+        'threats_per_minute': minutes.get('threats', []),
+        'protocols_last_minute': rates.get('protocols_last_minute', {})
+    }
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Scan Engine - Asynchronous TCP connect scanning
+Windowed non-blocking connects with per-host rate limits and RTT-based timeouts
+
+A fixed pool of worker coroutines pulls ports from a shared iterator, so
+the number of connects in flight stays at the concurrency window and a
+slow port holds up only its own slot. Every answered probe, accepted or
+refused, is an RTT sample: each host keeps a smoothed RTT and variance
+(RFC 6298) and probes time out after ``srtt + 4 * rttvar``, clamped to
+``[min_timeout, max_timeout]``. Ports that time out are retried with the
+adapted timeout before being reported filtered. Results are yielded as
+they complete.
+
+``ScanScheduler`` runs the same probes for many targets at once,
+interleaving hosts round-robin under a global window and a per-host
+limit, and hands back each target as soon as its last probe completes.
+
+Connects are issued directly on non-blocking sockets and completed from
+the event loop's writer callbacks, which avoids a task and a
+``wait_for`` per probe.
+"""
+
+import asyncio
+import errno
+import resource
+import socket
+import time
+from collections import deque
+
+DEFAULT_CONCURRENCY = 1000
+DEFAULT_TIMEOUT = 1.0
+MIN_TIMEOUT = 0.1
+MAX_TIMEOUT = 3.0
+DEFAULT_RETRIES = 1
+# Multi-target scans: probes in flight per host, targets resolved at once
+DEFAULT_PER_HOST = 256
+DEFAULT_ACTIVE_HOSTS = 64
+# File descriptors left for everything that is not a probe socket
+RESERVED_FDS = 64
+
+OPEN = 'open'
+CLOSED = 'closed'
+FILTERED = 'filtered'
+
+REFUSED_ERRORS = (errno.ECONNREFUSED, errno.ECONNRESET)
+# Local resource exhaustion: wait and try the same port again
+RESOURCE_ERRORS = (errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.EADDRNOTAVAIL, errno.EAGAIN)
+RESOURCE_BACKOFF = 0.01
+
+
+def parse_ports(spec):
+    """Expand ``'22,80,8000-8100'`` (or ``'-'`` for all) into a sorted port list"""
+    if spec.strip() == '-':
+        return list(range(1, 65536))
+    ports = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        low = int(first) if first else 1
+        high = int(last) if last else (65535 if _ else low)
+        if not 1 <= low <= high <= 65535:
+            raise ValueError(f"Invalid port range {part}")
+        ports.update(range(low, high + 1))
+    return sorted(ports)
+
+
+def raise_open_file_limit(needed):
+    """Raise the soft descriptor limit towards ``needed``; returns the usable probe count"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = needed + RESERVED_FDS
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        new_soft = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (new_soft, hard))
+            soft = new_soft
+        except (ValueError, OSError):
+            pass
+    if soft == resource.RLIM_INFINITY:
+        return needed
+    return max(1, min(needed, soft - RESERVED_FDS))
+
+
+class RttEstimator:
+    """Smoothed round-trip time of one host and the probe timeout derived from it"""
+
+    __slots__ = ('srtt', 'rttvar', 'timeout', 'min_timeout', 'max_timeout')
+
+    def __init__(self, initial=DEFAULT_TIMEOUT, min_timeout=MIN_TIMEOUT, max_timeout=MAX_TIMEOUT):
+        self.srtt = None
+        self.rttvar = 0.0
+        self.timeout = initial
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.timeout = min(max(self.srtt + 4 * self.rttvar, self.min_timeout), self.max_timeout)
+
+
+class RateLimiter:
+    """Token bucket spacing connection attempts to one host"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate / 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostState:
+    """Resolved address, RTT estimate, rate limit and counters for one target"""
+
+    def __init__(self, host, family, address, rtt, limiter=None):
+        self.host = host
+        self.family = family
+        self.address = address
+        self.rtt = rtt
+        self.limiter = limiter
+        self.counters = {
+            'probes': 0,
+            'open': 0,
+            'closed': 0,
+            'filtered': 0,
+            'retries': 0
+        }
+
+
+class ConnectScanner:
+    """Asynchronous TCP connect scanner with a fixed concurrency window"""
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, rate=None, timeout=DEFAULT_TIMEOUT,
+                 min_timeout=MIN_TIMEOUT, max_timeout=MAX_TIMEOUT, retries=DEFAULT_RETRIES):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max(max_timeout, timeout)
+        self.retries = retries
+        self.hosts = {}  # Target -> HostState of its latest scan
+
+    async def resolve(self, host):
+        """Look the target up once and set up its per-host state"""
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        family, _type, _proto, _name, sockaddr = infos[0]
+        rtt = RttEstimator(self.timeout, self.min_timeout, self.max_timeout)
+        limiter = RateLimiter(self.rate) if self.rate else None
+        state = self.hosts[host] = HostState(host, family, sockaddr[0], rtt, limiter)
+        return state
+
+    async def connect(self, state, port):
+        """One connect attempt; returns ``(state, rtt)`` with rtt None on timeout"""
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(state.family, socket.SOCK_STREAM)
+        try:
+            sock.setblocking(False)
+            start = time.perf_counter()
+            try:
+                sock.connect((state.address, port))
+                return OPEN, time.perf_counter() - start
+            except (BlockingIOError, InterruptedError):
+                pass
+            except OSError as e:
+                # Loopback and local firewalls can answer synchronously
+                if e.errno in REFUSED_ERRORS:
+                    return CLOSED, time.perf_counter() - start
+                raise
+
+            fd = sock.fileno()
+            done = loop.create_future()
+
+            def finish(result):
+                if not done.done():
+                    done.set_result(result)
+
+            loop.add_writer(fd, finish, True)
+            timer = loop.call_later(state.rtt.timeout, finish, False)
+            try:
+                answered = await done
+            finally:
+                loop.remove_writer(fd)
+                timer.cancel()
+            if not answered:
+                return FILTERED, None
+
+            error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            rtt = time.perf_counter() - start
+            if error == 0:
+                return OPEN, rtt
+            if error in REFUSED_ERRORS:
+                return CLOSED, rtt
+            if error in RESOURCE_ERRORS:
+                raise OSError(error, 'connect')
+            return FILTERED, None  # Unreachable and other ICMP errors
+        finally:
+            sock.close()
+
+    async def probe(self, state, port):
+        """Probe one port with retries; returns a result record"""
+        attempts = 0
+        while True:
+            if state.limiter is not None:
+                await state.limiter.acquire()
+            try:
+                status, rtt = await self.connect(state, port)
+            except OSError as e:
+                if e.errno in RESOURCE_ERRORS:
+                    await asyncio.sleep(RESOURCE_BACKOFF)
+                    continue
+                status, rtt = FILTERED, None
+            state.counters['probes'] += 1
+            if rtt is not None:
+                state.rtt.sample(rtt)
+            if status != FILTERED or attempts >= self.retries:
+                break
+            attempts += 1
+            state.counters['retries'] += 1
+
+        state.counters[status] += 1
+        return {'host': state.host, 'port': port, 'state': status, 'rtt': rtt}
+
+    async def scan(self, host, ports):
+        """Probe ``ports`` on ``host``, yielding result records as they complete"""
+        state = await self.resolve(host)
+        ports = list(ports)
+        window = raise_open_file_limit(min(self.concurrency, len(ports)) or 1)
+        results = asyncio.Queue()
+        pending = iter(ports)
+
+        async def worker():
+            # Shared iterator: each worker takes the next port when its slot frees up
+            for port in pending:
+                results.put_nowait(await self.probe(state, port))
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(window)]
+        finished = asyncio.gather(*workers)
+        finished.add_done_callback(lambda _: results.put_nowait(None))
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                yield result
+            await finished
+        finally:
+            for task in workers:
+                task.cancel()
+
+    def scan_ports(self, host, ports, on_result=None):
+        """Blocking wrapper around ``scan``; returns every result record"""
+        async def run():
+            collected = []
+            async for result in self.scan(host, ports):
+                collected.append(result)
+                if on_result is not None:
+                    on_result(result)
+            return collected
+
+        return asyncio.run(run())
+
+
+class ScanJob:
+    """Port probes of one target inside a ``ScanScheduler`` run"""
+
+    def __init__(self, host, ports):
+        self.host = host
+        self.ports = iter(ports)
+        self.state = None       # HostState once resolved
+        self.error = None
+        self.in_flight = 0
+        self.exhausted = False
+        self.results = []
+        self.started = time.time()
+        self.duration = 0.0
+
+    @property
+    def open_ports(self):
+        return sorted(r['port'] for r in self.results if r['state'] == OPEN)
+
+
+class ScanScheduler:
+    """Interleaves the port probes of many targets under global and per-host limits
+
+    ``concurrency`` workers share the work: each takes the next port of the
+    next target in round-robin order that is below ``per_host`` probes in
+    flight. Up to ``max_hosts`` targets are resolved and active at once;
+    the next target is admitted as soon as one completes, so a large
+    network is never held in memory.
+    """
+
+    def __init__(self, engine, concurrency=None, per_host=DEFAULT_PER_HOST, max_hosts=DEFAULT_ACTIVE_HOSTS):
+        self.engine = engine
+        self.concurrency = concurrency or engine.concurrency
+        self.per_host = per_host
+        self.max_hosts = max_hosts
+
+    async def run(self, targets, ports, on_result=None, ports_for=None):
+        """Scan every target; yields each ``ScanJob`` as soon as it is complete
+
+        ``ports`` is reused for every target unless ``ports_for(host)`` is
+        given, which returns the ports to probe on that host instead.
+        ``on_result(job, result)``, if given, is called with every probe
+        result as it arrives.
+        """
+        ports = list(ports)
+        targets = iter(targets)
+        active = deque()
+        completed = asyncio.Queue()
+        admitting = True
+        open_jobs = 0
+        wake = asyncio.Event()
+        window = raise_open_file_limit(self.concurrency)
+
+        def notify():
+            nonlocal wake
+            wake.set()
+            wake = asyncio.Event()
+
+        def complete(job):
+            nonlocal open_jobs
+            open_jobs -= 1
+            job.duration = time.time() - job.started
+            job.results.sort(key=lambda r: r['port'])
+            completed.put_nowait(job)
+            notify()
+
+        def next_work():
+            for _ in range(len(active)):
+                job = active.popleft()
+                if job.in_flight >= self.per_host:
+                    active.append(job)
+                    continue
+                port = next(job.ports, None)
+                if port is None:
+                    job.exhausted = True
+                    if job.in_flight == 0:
+                        complete(job)
+                    continue
+                active.append(job)
+                return job, port
+            return None, None
+
+        async def admit():
+            # Resolve targets ahead of the workers, keeping max_hosts open
+            nonlocal admitting, open_jobs
+            for host in targets:
+                while open_jobs >= self.max_hosts:
+                    await wake.wait()
+                job = ScanJob(host, ports if ports_for is None else ports_for(host))
+                open_jobs += 1
+                try:
+                    job.state = await self.engine.resolve(host)
+                except (OSError, UnicodeError) as e:
+                    job.error = f"Cannot resolve {host}: {e}"
+                    complete(job)
+                    continue
+                job.started = time.time()
+                active.append(job)
+                notify()
+            admitting = False
+            notify()
+
+        async def worker():
+            while True:
+                job, port = next_work()
+                if job is None:
+                    if not admitting and open_jobs == 0:
+                        return
+                    await wake.wait()
+                    continue
+                job.in_flight += 1
+                result = await self.engine.probe(job.state, port)
+                job.in_flight -= 1
+                job.results.append(result)
+                if on_result is not None:
+                    on_result(job, result)
+                if job.exhausted and job.in_flight == 0:
+                    complete(job)
+                elif job.in_flight == self.per_host - 1:
+                    notify()  # A slot opened on a host that was at its limit
+
+        tasks = [asyncio.ensure_future(admit())]
+        tasks.extend(asyncio.ensure_future(worker()) for _ in range(window))
+        finished = asyncio.gather(*tasks)
+        finished.add_done_callback(lambda _: completed.put_nowait(None))
+        try:
+            while True:
+                job = await completed.get()
+                if job is None:
+                    break
+                yield job
+            await finished
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Scan Store - Persistent scan results for incremental rescans
+SQLite rows keyed by (host, port, probe) with a check time and a TTL
+
+Each row holds the JSON result of one probe: the state of a port, the
+service record built from its banner, a TLS assessment, the findings of
+a port's web, SSH or FTP check, or (port 0) a host's vulnerability list.
+A rescan loads a host's rows once and asks the history what is still
+fresh:
+
+    port state     open ports are always re-probed, since everything
+                   else depends on them; closed and filtered ports are
+                   skipped while fresh
+    banner, tls,   reused while fresh and the port stayed open
+    web, ssh, ftp
+
+Reused results keep their original check time, so they expire on
+schedule. Each key's TTL is scaled by a fixed factor between 0.5 and 1.5
+derived from the key. Expiry is therefore spread over several runs
+instead of every port going stale on the same night.
+
+After a host is assessed, its new results are written in one
+transaction and compared with the history. The diff lists newly opened
+and closed ports, changed banners, and new and resolved
+vulnerabilities.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+DEFAULT_TTL = 72 * 3600
+HOST_PROBE = 0  # Port of host-level rows such as the vulnerability list
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    host TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    probe TEXT NOT NULL,
+    value TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    changed_at REAL NOT NULL,
+    PRIMARY KEY (host, port, probe)
+) WITHOUT ROWID
+"""
+
+
+def vulnerability_key(vulnerability):
+    """Identity of a finding across runs"""
+    return json.dumps([vulnerability.get('port', ''), vulnerability.get('type', ''),
+                       vulnerability.get('cve', ''), vulnerability.get('description', '')])
+
+
+class HostHistory:
+    """Stored results of one host as they were before this run"""
+
+    def __init__(self, host, rows, ttl, now=None):
+        self.host = host
+        self.rows = rows  # (port, probe) -> (value, checked_at)
+        self.ttl = ttl
+        self.now = now or time.time()
+
+    def __bool__(self):
+        return bool(self.rows)
+
+    def value(self, port, probe):
+        row = self.rows.get((port, probe))
+        return row[0] if row is not None else None
+
+    def fresh(self, port, probe):
+        row = self.rows.get((port, probe))
+        if row is None:
+            return False
+        spread = 0.5 + (zlib.crc32(f"{self.host}:{port}:{probe}".encode()) & 0xffff) / 0x10000
+        return self.now - row[1] < self.ttl * spread
+
+    def cached(self, port, probe):
+        """Stored value of a probe while it is fresh, else None"""
+        return self.value(port, probe) if self.fresh(port, probe) else None
+
+    def reusable(self, port, probe):
+        """Fresh result for a port that was open before and is still open"""
+        if self.value(port, 'port') != 'open':
+            return None
+        return self.cached(port, probe)
+
+    def ports_to_probe(self, ports):
+        """Ports whose state must be probed again: open, stale or never seen"""
+        return [port for port in ports if self.value(port, 'port') == 'open' or not self.fresh(port, 'port')]
+
+
+class ScanStore:
+    """SQLite store of per-(host, port, probe) scan results with TTLs; safe to share between threads"""
+
+    def __init__(self, filename, ttl=DEFAULT_TTL):
+        self.filename = filename
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(SCHEMA)
+        self.db.commit()
+
+    def history(self, host, now=None):
+        with self.lock:
+            rows = self.db.execute('SELECT port, probe, value, checked_at FROM results WHERE host = ?',
+                                   (host,)).fetchall()
+        return HostHistory(host, {(port, probe): (json.loads(value), checked_at)
+                                  for port, probe, value, checked_at in rows}, self.ttl, now)
+
+    def update(self, history, results, now=None):
+        """Write ``(port, probe, value)`` results checked in this run
+
+        ``changed_at`` moves only when a value differs from the stored one.
+        """
+        now = now or time.time()
+        rows = []
+        for port, probe, value in results:
+            previous = history.rows.get((port, probe))
+            changed = previous is None or previous[0] != value
+            rows.append((history.host, port, probe, json.dumps(value), now, now if changed else None))
+        with self.lock, self.db:
+            self.db.executemany(
+                'INSERT INTO results (host, port, probe, value, checked_at, changed_at) '
+                'VALUES (?1, ?2, ?3, ?4, ?5, COALESCE(?6, ?5)) '
+                'ON CONFLICT (host, port, probe) DO UPDATE SET value = excluded.value, '
+                'checked_at = excluded.checked_at, changed_at = COALESCE(?6, changed_at)',
+                rows)
+
+    def close(self):
+        self.db.close()
+
+
+def diff_host(history, port_states, services, vulnerabilities):
+    """Changes of one host since its stored history
+
+    ``port_states`` maps the ports probed in this run to their state;
+    ``services`` and ``vulnerabilities`` are this run's records.
+    """
+    if not history:
+        return {"first_scan": True}
+    opened = sorted(port for port, state in port_states.items()
+                    if state == 'open' and history.value(port, 'port') != 'open')
+    closed = sorted(port for port, state in port_states.items()
+                    if state != 'open' and history.value(port, 'port') == 'open')
+
+    changed_banners = []
+    for service in services:
+        before = history.value(service['port'], 'banner')
+        if before is not None and before.get('banner') != service.get('banner'):
+            changed_banners.append({
+                "port": service['port'],
+                "before": before.get('banner'),
+                "after": service.get('banner')
+            })
+
+    previous = {vulnerability_key(v): v for v in history.value(HOST_PROBE, 'vulnerabilities') or ()}
+    current = {vulnerability_key(v): v for v in vulnerabilities}
+    return {
+        "first_scan": False,
+        "opened_ports": opened,
+        "closed_ports": closed,
+        "changed_banners": changed_banners,
+        "new_vulnerabilities": [v for key, v in current.items() if key not in previous],
+        "resolved_vulnerabilities": [v for key, v in previous.items() if key not in current]
+    }
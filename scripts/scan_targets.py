@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Scan Targets - Target list expansion for the network scanners
+Hostnames, addresses, CIDR blocks, address ranges and target files
+
+Targets are expanded lazily, so a large block is never materialised as a
+list. Duplicates across specs and files are skipped by keeping the merged
+address ranges already yielded, so memory grows with the number of specs
+rather than the number of hosts.
+
+Accepted forms:
+    host.example.com        hostname, resolved by the scanner
+    192.0.2.10, 2001:db8::1 single address
+    192.0.2.0/24            every host address of a network
+    192.0.2.10-192.0.2.40   inclusive address range
+    192.0.2.10-40           range over the last IPv4 octet
+    @targets.txt            one spec per line, '#' starts a comment
+"""
+
+import ipaddress
+from bisect import bisect_right
+
+
+def target_ranges(spec):
+    """Yield the hostnames and (version, first, last) address ranges of one spec"""
+    spec = spec.strip()
+    if spec.startswith('@'):
+        yield from read_target_ranges(spec[1:])
+        return
+    if '/' in spec:
+        network = ipaddress.ip_network(spec, strict=False)
+        first = int(network.network_address)
+        last = int(network.broadcast_address)
+        # Same hosts as network.hosts(): IPv4 skips the network and broadcast
+        # addresses, IPv6 the subnet-router anycast address
+        if network.num_addresses > 2:
+            first += 1
+            if network.version == 4:
+                last -= 1
+        yield network.version, first, last
+        return
+    if '-' in spec:
+        first, _, last = spec.partition('-')
+        try:
+            start = ipaddress.ip_address(first)
+        except ValueError:
+            yield spec  # A hostname containing a dash
+            return
+        if '.' not in last and ':' not in last and start.version == 4:
+            octets = first.split('.')
+            last = '.'.join(octets[:3] + [last])
+        end = ipaddress.ip_address(last)
+        if end.version != start.version or end < start:
+            raise ValueError(f"Invalid address range {spec}")
+        yield start.version, int(start), int(end)
+        return
+    try:
+        address = ipaddress.ip_address(spec)
+    except ValueError:
+        yield spec
+        return
+    yield address.version, int(address), int(address)
+
+
+def read_target_ranges(filename):
+    """Yield the hostnames and address ranges of every spec in a target file"""
+    with open(filename) as f:
+        for line in f:
+            line = line.split('#', 1)[0]
+            for spec in line.split():
+                yield from target_ranges(spec)
+
+
+def range_hosts(target):
+    """Yield the hosts of one ``target_ranges`` item"""
+    if isinstance(target, str):
+        yield target
+        return
+    version, first, last = target
+    address_type = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+    for value in range(first, last + 1):
+        yield str(address_type(value))
+
+
+def expand_target(spec):
+    """Yield the hosts of one target spec"""
+    for target in target_ranges(spec):
+        yield from range_hosts(target)
+
+
+def read_target_file(filename):
+    """Yield the hosts of every spec in a target file"""
+    for target in read_target_ranges(filename):
+        yield from range_hosts(target)
+
+
+class AddressCoverage:
+    """Disjoint, merged address ranges of one IP version, in ascending order"""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def claim(self, first, last):
+        """Cover ``first``..``last``; returns the sub-ranges that were not covered yet"""
+        starts = self.starts
+        ends = self.ends
+        index = bisect_right(starts, first) - 1
+        if index < 0 or ends[index] < first - 1:
+            index += 1
+        gaps = []
+        position = first
+        low = first
+        high = last
+        stop = index
+        while stop < len(starts) and starts[stop] <= last + 1:
+            if starts[stop] > position:
+                gaps.append((position, starts[stop] - 1))
+            position = max(position, ends[stop] + 1)
+            low = min(low, starts[stop])
+            high = max(high, ends[stop])
+            stop += 1
+        if position <= last:
+            gaps.append((position, last))
+        starts[index:stop] = [low]
+        ends[index:stop] = [high]
+        return gaps
+
+
+def iter_targets(specs, files=()):
+    """Expand target specs and files into unique hosts, in order"""
+    hostnames = set()
+    coverage = {4: AddressCoverage(), 6: AddressCoverage()}
+    sources = [target_ranges(spec) for spec in specs]
+    sources.extend(read_target_ranges(filename) for filename in files)
+    for source in sources:
+        for target in source:
+            if isinstance(target, str):
+                if target not in hostnames:
+                    hostnames.add(target)
+                    yield target
+                continue
+            version, first, last = target
+            for gap_first, gap_last in coverage[version].claim(first, last):
+                yield from range_hosts((version, gap_first, gap_last))
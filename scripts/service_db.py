@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Service Database - Port names, service probes and banner fingerprints
+Data-driven service identification shared by the scanners and the analyzer
+
+The database is a JSON file in the spirit of nmap-service-probes:
+    ports     port -> service name
+    probes    payload sent to a port before its banner is read (an empty
+              payload waits for the server to speak first)
+    matches   regexes over banners with service, product, version and
+              info templates; ``$1`` .. ``$9`` insert capture groups
+
+Matches are compiled once. Patterns anchored with ``^`` and starting
+with a literal are indexed by the first character of that literal, so a
+banner is only tried against the fingerprints that can match its first
+byte plus the unanchored ones. Candidate lists are memoised per (port,
+first character); fingerprints whose port hints include the port are
+tried first, otherwise file order decides. Adding a product means adding
+an entry to the file.
+"""
+
+import json
+import os
+import re
+
+DEFAULT_DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'service_probes.json')
+REGEX_METACHARACTERS = frozenset('.^$*+?{}[]\\|()')
+TEMPLATE_GROUP = re.compile(r'\$(\d)')
+
+
+def literal_prefix(pattern):
+    """Leading literal text of a regex (without a ``^`` anchor)"""
+    if '|' in pattern:
+        return ''  # Alternatives may start differently
+    prefix = []
+    position = 0
+    while position < len(pattern):
+        char = pattern[position]
+        if char == '\\' and position + 1 < len(pattern) and not pattern[position + 1].isalnum():
+            char = pattern[position + 1]  # Escaped punctuation is literal
+            step = 2
+        elif char in REGEX_METACHARACTERS:
+            break
+        else:
+            step = 1
+        if pattern[position + step:position + step + 1] in ('*', '?', '{'):
+            break  # A quantified character is optional
+        prefix.append(char)
+        position += step
+    return ''.join(prefix)
+
+
+def expand_template(template, match):
+    return TEMPLATE_GROUP.sub(lambda m: match.group(int(m.group(1))) or '', template)
+
+
+class Fingerprint:
+    """One compiled banner match"""
+
+    __slots__ = ('index', 'service', 'product', 'version', 'info', 'regex', 'anchored', 'prefix', 'ports')
+
+    def __init__(self, index, entry):
+        pattern = entry['pattern']
+        self.index = index
+        self.service = entry.get('service', '')
+        self.product = entry.get('product', '')
+        self.version = entry.get('version', '')
+        self.info = entry.get('info', '')
+        self.regex = re.compile(pattern, re.DOTALL)
+        self.anchored = pattern.startswith('^')
+        self.prefix = literal_prefix(pattern[1:] if self.anchored else pattern)
+        self.ports = frozenset(entry.get('ports', ()))
+
+    def apply(self, banner):
+        """Identification record for ``banner``, or None"""
+        if self.prefix:
+            if self.anchored:
+                if not banner.startswith(self.prefix):
+                    return None
+            elif self.prefix not in banner:
+                return None
+        match = self.regex.match(banner) if self.anchored else self.regex.search(banner)
+        if match is None:
+            return None
+        return {
+            'service': expand_template(self.service, match),
+            'product': expand_template(self.product, match),
+            'version': expand_template(self.version, match),
+            'info': expand_template(self.info, match)
+        }
+
+
+class ServiceDatabase:
+    """Compiled port names, probes and banner fingerprints"""
+
+    def __init__(self, data):
+        self.port_names = {int(port): name for port, name in data.get('ports', {}).items()}
+
+        self.probes = {}
+        self.default_probe = b'\r\n'
+        for probe in data.get('probes', ()):
+            payload = probe['payload'].encode('latin-1')
+            if probe.get('default'):
+                self.default_probe = payload
+            for port in probe.get('ports', ()):
+                self.probes.setdefault(port, payload)
+
+        self.fingerprints = [Fingerprint(i, entry) for i, entry in enumerate(data.get('matches', ()))]
+        self.by_first_char = {}
+        self.unindexed = []
+        for fingerprint in self.fingerprints:
+            if fingerprint.anchored and fingerprint.prefix:
+                self.by_first_char.setdefault(fingerprint.prefix[0], []).append(fingerprint)
+            else:
+                self.unindexed.append(fingerprint)
+        self.candidates = {}
+
+    @classmethod
+    def load(cls, filename=DEFAULT_DATABASE):
+        with open(filename) as f:
+            return cls(json.load(f))
+
+    def service_name(self, port, default='Unknown'):
+        return self.port_names.get(port, default)
+
+    def probe_for(self, port):
+        """Payload to send to ``port`` before reading; empty for server-first services"""
+        return self.probes.get(port, self.default_probe)
+
+    def candidates_for(self, port, first):
+        key = (port, first)
+        candidates = self.candidates.get(key)
+        if candidates is None:
+            pool = self.by_first_char.get(first, []) + self.unindexed
+            pool.sort(key=lambda f: (port not in f.ports, f.index))
+            candidates = self.candidates[key] = tuple(pool)
+        return candidates
+
+    def identify(self, banner, port=None):
+        """Service, product, version and info of a decoded banner, or None"""
+        if not banner:
+            return None
+        for fingerprint in self.candidates_for(port, banner[0]):
+            result = fingerprint.apply(banner)
+            if result is not None:
+                return result
+        return None
+
+
+_default_database = None
+
+
+def default_database():
+    """The bundled database, loaded on first use"""
+    global _default_database
+    if _default_database is None:
+        _default_database = ServiceDatabase.load()
+    return _default_database
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Signature Engine - Compiled multi-pattern payload matching
+Literal prefilter automaton plus confirming regexes, working on raw bytes
+
+Every signature contributes one or more required literals ("anchors"). All
+anchors are compiled into a single trie-shaped regular expression, so the
+payload is scanned once by the C regex engine no matter how many signatures
+are loaded, and per-position work grows with anchor depth rather than with
+the number of signatures. Only signatures whose anchor was seen run their
+full confirming regex.
+
+Rules files are JSON, either an object mapping names to signatures or a
+list of signatures carrying a ``name`` key::
+
+    {"ftp_creds": {"pattern": "FTP.*USER", "description": "...",
+                   "severity": "Medium", "literals": ["user"]}}
+
+``literals`` is optional; when omitted the anchors are derived from the
+pattern, and signatures with no derivable anchor are confirmed on every
+payload.
+
+``scan_stream`` matches a reassembled byte stream chunk by chunk. The
+prefilter resumes from a carried tail of (longest anchor - 1) bytes, so
+each stream byte passes through it once. Confirming regexes only run for
+signatures whose anchor is still inside a bounded window of recent bytes,
+and each match is reported once. While no anchor is pending a stream only
+keeps a short context, so idle connections stay cheap.
+"""
+
+import json
+import re
+
+MIN_LITERAL_LENGTH = 2
+STREAM_WINDOW = 4096
+# Bytes kept before a future anchor when nothing is pending
+STREAM_CONTEXT = 256
+
+REGEX_SPECIAL = set('.^$*+?{}[]\\|()')
+OPTIONAL_QUANTIFIERS = ('*', '?', '{0')
+
+
+def split_alternatives(pattern):
+    """Split a regex on its top-level ``|`` operators"""
+    alternatives = []
+    depth = 0
+    in_class = False
+    start = 0
+    i = 0
+
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            i += 2
+            continue
+        if in_class:
+            if char == ']':
+                in_class = False
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            alternatives.append(pattern[start:i])
+            start = i + 1
+        i += 1
+
+    alternatives.append(pattern[start:])
+    return alternatives
+
+
+def skip_group(pattern, i):
+    """Return the index just past the group or character class opening at ``i``"""
+    depth = 0
+    in_class = False
+
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            i += 2
+            continue
+        if in_class:
+            if char == ']':
+                in_class = False
+                if depth == 0:
+                    return i + 1
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+
+    return len(pattern)
+
+
+def literal_runs(alternative):
+    """Yield the runs of plain literal characters in one alternative
+
+    Groups and character classes are skipped as a whole: their contents may
+    be optional, alternated or negated, so they never yield anchors.
+    """
+    run = []
+    i = 0
+
+    while i < len(alternative):
+        char = alternative[i]
+
+        if char == '\\' and i + 1 < len(alternative):
+            escaped = alternative[i + 1]
+            if escaped.isalnum():
+                # Character class escape such as \d, \w, \s or a backreference
+                yield ''.join(run)
+                run = []
+            else:
+                run.append(escaped)
+            i += 2
+        elif char in REGEX_SPECIAL:
+            if alternative.startswith(OPTIONAL_QUANTIFIERS, i) and run:
+                run.pop()  # The quantified character may be absent
+            yield ''.join(run)
+            run = []
+            if char in '[(':
+                i = skip_group(alternative, i)
+            elif char == '{':
+                i = alternative.find('}', i) + 1 or len(alternative)
+            else:
+                i += 1
+        else:
+            run.append(char)
+            i += 1
+
+    yield ''.join(run)
+
+
+def extract_literals(pattern):
+    """Derive the anchors a pattern cannot match without
+
+    Returns one lowercase literal per top-level alternative (the longest
+    run in each), or None when some alternative has no usable literal.
+    """
+    literals = []
+
+    for alternative in split_alternatives(pattern):
+        runs = [run for run in literal_runs(alternative) if len(run) >= MIN_LITERAL_LENGTH]
+        if not runs:
+            return None
+        literals.append(max(runs, key=len).lower())
+
+    return literals
+
+
+def trie_regex(literals):
+    """Build a regex that matches any literal, factored as a trie
+
+    Alternatives sharing a prefix share one branch, and longer
+    continuations are tried first so the longest anchor wins.
+    """
+    trie = {}
+    for literal in literals:
+        node = trie
+        for byte in literal:
+            node = node.setdefault(byte, {})
+        node[None] = True
+
+    def build(node):
+        terminal = None in node
+        branches = [re.escape(bytes([byte])) + build(child)
+                    for byte, child in sorted((k, v) for k, v in node.items() if k is not None)]
+        if not branches:
+            return b''
+        if len(branches) == 1:
+            body = branches[0]
+        else:
+            body = b'(?:' + b'|'.join(branches) + b')'
+        if terminal:
+            if len(branches) == 1 and len(body) > 1:
+                return b'(?:' + body + b')?'
+            return body + b'?'
+        return body
+
+    return build(trie)
+
+
+def load_rules(filename):
+    """Load signatures from a JSON rules file into a name -> signature dict"""
+    with open(filename) as f:
+        rules = json.load(f)
+
+    if isinstance(rules, list):
+        return {rule['name']: rule for rule in rules}
+    return rules
+
+
+class StreamMatchState:
+    """Matcher state carried between the chunks of one byte stream"""
+
+    __slots__ = ('tail', 'window', 'window_start', 'offset', 'pending', 'last_match')
+
+    def __init__(self):
+        self.tail = b''          # Lowercased end of the stream, for anchors split across chunks
+        self.window = b''        # Recent raw bytes the confirming regexes run over
+        self.window_start = 0
+        self.offset = 0          # Stream bytes consumed so far
+        self.pending = {}        # Signature index -> stream offset of its latest anchor
+        self.last_match = {}     # Signature index -> stream offset its last match ended at
+
+    def gap(self):
+        """Forget the context before a hole in the stream"""
+        self.tail = b''
+        self.window = b''
+        self.window_start = self.offset
+        self.pending.clear()
+
+
+class SignatureEngine:
+    """Single-pass matcher over a set of payload signatures"""
+
+    def __init__(self, signatures):
+        self.signatures = []
+        self.unanchored = []
+        literal_map = {}
+
+        for name, signature in signatures.items():
+            entry = {
+                'name': name,
+                'regex': re.compile(signature['pattern'].encode(), re.IGNORECASE),
+                'threat': {
+                    'type': name,
+                    'description': signature['description'],
+                    'severity': signature['severity']
+                }
+            }
+            index = len(self.signatures)
+            self.signatures.append(entry)
+
+            literals = signature.get('literals') or extract_literals(signature['pattern'])
+            if not literals:
+                self.unanchored.append(index)
+                continue
+            for literal in literals:
+                literal_map.setdefault(literal.lower().encode(), set()).add(index)
+
+        # A match reports only the longest anchor at a position, so each
+        # anchor also carries the signatures of anchors that prefix it
+        self.candidates = {}
+        for literal in literal_map:
+            indexes = set()
+            for length in range(MIN_LITERAL_LENGTH, len(literal) + 1):
+                indexes |= literal_map.get(literal[:length], set())
+            self.candidates[literal] = indexes
+
+        if literal_map:
+            self.prefilter = re.compile(b'(?=(' + trie_regex(literal_map) + b'))')
+        else:
+            self.prefilter = None
+        self.max_literal = max((len(literal) for literal in literal_map), default=0)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def match(self, payload):
+        """Return the threat dicts of every signature matching ``payload``"""
+        if not payload:
+            return []
+
+        data = bytes(payload)
+        hits = set(self.unanchored)
+
+        if self.prefilter is not None:
+            candidates = self.candidates
+            seen = set()
+            for found in self.prefilter.finditer(data.lower()):
+                literal = found.group(1)
+                if literal not in seen:
+                    seen.add(literal)
+                    hits |= candidates[literal]
+
+        threats = []
+        for index in sorted(hits):
+            entry = self.signatures[index]
+            if entry['regex'].search(data):
+                threats.append(dict(entry['threat']))
+        return threats
+
+    def scan_stream(self, state, chunk):
+        """Match the next in-order chunk of a stream; returns new threats"""
+        data = bytes(chunk)
+        if not data:
+            return []
+
+        start = state.offset
+        end = start + len(data)
+        pending = state.pending
+
+        if self.prefilter is not None:
+            tail = state.tail
+            scan = tail + data.lower()
+            base = start - len(tail)
+            candidates = self.candidates
+            for found in self.prefilter.finditer(scan):
+                literal = found.group(1)
+                if found.start() + len(literal) <= len(tail):
+                    continue  # Entirely inside the tail: seen with the last chunk
+                position = base + found.start()
+                for index in candidates[literal]:
+                    pending[index] = position
+            keep = self.max_literal - 1
+            state.tail = scan[-keep:] if keep > 0 else b''
+
+        keep = STREAM_WINDOW - len(data)
+        window = (state.window[-keep:] if keep > 0 else b'') + data
+        window_start = end - len(window)
+        state.window = window
+        state.window_start = window_start
+        state.offset = end
+
+        for index, position in list(pending.items()):
+            if position < window_start:
+                del pending[index]  # Anchor aged out of the window
+
+        threats = []
+        last_match = state.last_match
+        for index in sorted(set(pending) | set(self.unanchored)):
+            entry = self.signatures[index]
+            reported = last_match.get(index, -1)
+            for found in entry['regex'].finditer(window):
+                match_end = window_start + found.end()
+                # Only matches that reach into this chunk and were not reported yet
+                if match_end > start and match_end > reported:
+                    threats.append(dict(entry['threat']))
+                    last_match[index] = match_end
+                    pending.pop(index, None)
+                    break
+
+        if not pending and not self.unanchored and len(window) > STREAM_CONTEXT:
+            # Any later match needs a new anchor; keep only the context it may start in
+            state.window = window[-STREAM_CONTEXT:]
+            state.window_start = end - STREAM_CONTEXT
+        return threats
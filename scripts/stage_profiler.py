@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Stage Profiler - Sampled per-stage timing histograms for the packet path
+Toggleable hot-path instrumentation with Prometheus text exposition
+
+Profiling works by replacing the analyzer's stage methods with wrappers
+that time one call in ``sample_every`` and count the rest; when profiling
+is off the original methods are used, so the disabled cost is zero. Each
+stage keeps a log2 histogram of nanoseconds in a fixed-size array. The
+snapshot is a mergeable dict whose bucket lists add element-wise, so the
+histograms of pipeline workers combine like every other counter.
+
+``format_prometheus`` renders a ``get_statistics()`` dict in the
+Prometheus text format (version 0.0.4).
+"""
+
+import time
+from array import array
+
+DEFAULT_SAMPLE_EVERY = 64
+# Bucket b counts samples of 2**(b-1) .. 2**b - 1 ns
+HISTOGRAM_BUCKETS = 40
+# Bucket bounds exported to Prometheus: 128 ns .. ~1 s
+PROMETHEUS_BUCKETS = range(7, 31)
+
+
+class StageProfiler:
+    """Sampled timing histograms for named pipeline stages"""
+
+    def __init__(self, sample_every=DEFAULT_SAMPLE_EVERY):
+        self.sample_every = max(1, sample_every)
+        self.stages = {}
+
+    def wrap(self, stage, function):
+        """Return ``function`` timed one call in ``sample_every``
+
+        Functions wrapped under the same stage name share its histogram.
+        """
+        if stage not in self.stages:
+            # Histogram buckets, then [samples, sampled ns]
+            self.stages[stage] = (array('Q', [0]) * HISTOGRAM_BUCKETS, array('Q', [0, 0]))
+        buckets, totals = self.stages[stage]
+
+        sample_every = self.sample_every
+        countdown = sample_every
+        clock = time.perf_counter_ns
+        last_bucket = HISTOGRAM_BUCKETS - 1
+
+        def timed(*args):
+            nonlocal countdown
+            countdown -= 1
+            if countdown:
+                return function(*args)
+            countdown = sample_every
+            start = clock()
+            try:
+                return function(*args)
+            finally:
+                elapsed = clock() - start
+                buckets[min(elapsed.bit_length(), last_bucket)] += 1
+                totals[0] += 1
+                totals[1] += elapsed
+
+        timed.__wrapped__ = function
+        return timed
+
+    def snapshot(self):
+        """Mergeable per-stage samples, sampled time and histogram buckets"""
+        return {
+            stage: {
+                'samples': totals[0],
+                'sampled_ns': totals[1],
+                'buckets': list(buckets)
+            }
+            for stage, (buckets, totals) in self.stages.items()
+        }
+
+
+def bucket_upper_ns(bucket):
+    return (1 << bucket) - 1 if bucket else 0
+
+
+def histogram_percentile(buckets, fraction):
+    """Upper bound (ns) of the bucket holding the given fraction of samples"""
+    total = sum(buckets)
+    if not total:
+        return 0
+    rank = fraction * total
+    seen = 0
+    for bucket, count in enumerate(buckets):
+        seen += count
+        if seen >= rank:
+            return bucket_upper_ns(bucket)
+    return bucket_upper_ns(len(buckets) - 1)
+
+
+def summarize_profile(profile):
+    """Mean and percentile estimates per stage from a (merged) profile snapshot"""
+    summary = {}
+    for stage, data in profile.items():
+        samples = data.get('samples', 0)
+        if not samples:
+            continue
+        buckets = data['buckets']
+        summary[stage] = {
+            'samples': samples,
+            'sampled_ns': data['sampled_ns'],
+            'buckets': buckets,
+            'mean_ns': data['sampled_ns'] / samples,
+            'p50_ns': histogram_percentile(buckets, 0.50),
+            'p90_ns': histogram_percentile(buckets, 0.90),
+            'p99_ns': histogram_percentile(buckets, 0.99)
+        }
+    return summary
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_prometheus(statistics):
+    """Render a ``get_statistics()`` dict as Prometheus text"""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP network_analyzer_{name} {help_text}")
+        lines.append(f"# TYPE network_analyzer_{name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{label_value(text)}"' for key, text in labels.items())
+            suffix = f'{{{label_text}}}' if label_text else ''
+            lines.append(f"network_analyzer_{name}{suffix} {value}")
+
+    metric('packets_total', 'counter', 'Packets processed', [({}, statistics.get('total_packets', 0))])
+    metric('bytes_total', 'counter', 'Bytes processed', [({}, statistics.get('total_bytes', 0))])
+    metric('threat_packets_total', 'counter', 'Packets with at least one threat',
+           [({}, statistics.get('threats_detected', 0))])
+    metric('active_flows', 'gauge', 'Flows in the flow table',
+           [({}, statistics.get('active_connections', 0))])
+    metric('bandwidth_bytes_per_second', 'gauge', 'Bandwidth over the last second',
+           [({}, statistics.get('bandwidth_bps', 0))])
+    metric('protocol_packets_total', 'counter', 'Packets per application protocol',
+           [({'protocol': name}, count) for name, count in statistics.get('top_protocols', {}).items()])
+    metric('processing_errors_total', 'counter', 'Packets that failed processing, by exception type',
+           [({'type': name}, count) for name, count in statistics.get('errors', {}).items()])
+    metric('queue_depth', 'gauge', 'Items, bytes or datagrams waiting in internal queues',
+           [({'queue': name}, depth) for name, depth in statistics.get('queues', {}).items()])
+
+    sampling = statistics.get('sampling') or {}
+    if sampling:
+        metric('sampled', 'gauge', 'Whether totals include estimates for dropped or uninspected packets',
+               [({}, 1 if statistics.get('sampled') else 0)])
+        metric('shed_packets_total', 'counter', 'Packets that skipped payload inspection under overload',
+               [({}, sampling.get('shed_packets', 0))])
+
+    kernel = statistics.get('kernel') or {}
+    if kernel:
+        metric('kernel_packets_total', 'counter', 'Packets seen by the kernel socket',
+               [({}, kernel.get('packets', 0))])
+        metric('kernel_drops_total', 'counter', 'Packets dropped by the kernel',
+               [({}, kernel.get('drops', 0))])
+
+    profile = statistics.get('profile')
+    if profile:
+        name = 'stage_duration_seconds'
+        lines.append(f"# HELP network_analyzer_{name} Sampled duration of each packet-processing stage")
+        lines.append(f"# TYPE network_analyzer_{name} histogram")
+        for stage, data in profile.items():
+            buckets = data['buckets']
+            cumulative = 0
+            for bucket, count in enumerate(buckets):
+                cumulative += count
+                if bucket in PROMETHEUS_BUCKETS:
+                    bound = (1 << bucket) / 1e9
+                    lines.append(f'network_analyzer_{name}_bucket{{stage="{stage}",le="{bound:.9g}"}} '
+                                 f'{cumulative}')
+            lines.append(f'network_analyzer_{name}_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+            lines.append(f'network_analyzer_{name}_sum{{stage="{stage}"}} {data["sampled_ns"] / 1e9:.9f}')
+            lines.append(f'network_analyzer_{name}_count{{stage="{stage}"}} {data["samples"]}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Stats Server - Live analyzer statistics over HTTP and WebSocket
+asyncio endpoint that pushes stat deltas and new-threat events to dashboards
+
+The server runs its own event loop on a background thread. Once per
+interval a single publisher takes one statistics snapshot, diffs it
+against the previous one and collects the threats stored since the last
+tick. Each resulting message is encoded once and put on every
+subscriber's bounded queue, so the analyzer is read once per tick however
+many dashboards are connected, and nothing is ever called from the
+capture thread. A subscriber that falls behind has its backlog replaced
+by a fresh full snapshot instead of buffering without bound.
+
+Endpoints:
+    GET /stats              latest published statistics
+    GET /packets?count=N    most recent packet records
+    GET /flows?count=N      busiest active flows
+    GET /threats?count=N    recent threat events
+    GET /metrics            statistics in the Prometheus text format
+    GET /live               WebSocket: a snapshot, then delta/threats messages
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+
+from stage_profiler import format_prometheus
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_INTERVAL = 1.0
+
+CLIENT_QUEUE = 64
+THREAT_BACKLOG = 1000
+THREATS_PER_TICK = 200
+MAX_COUNT = 1000
+MAX_HEADER_BYTES = 16384
+MAX_CLIENT_FRAME = 65536
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+def parse_listen(value):
+    """Split ``[HOST:]PORT`` into ``(host, port)``"""
+    host, _, port = value.rpartition(':')
+    return host.strip('[]') or DEFAULT_HOST, int(port)
+
+
+def stats_delta(previous, current):
+    """Entries of ``current`` that differ from ``previous``
+
+    Nested dicts are diffed recursively; keys that disappeared map to None.
+    """
+    delta = {}
+    for key, value in current.items():
+        old = previous.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested = stats_delta(old, value)
+            if nested:
+                delta[key] = nested
+        elif value != old or key not in previous:
+            delta[key] = value
+    for key in previous:
+        if key not in current:
+            delta[key] = None
+    return delta
+
+
+def websocket_frame(payload, opcode=OP_TEXT):
+    """Build one unmasked, unfragmented server frame"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def encode_message(message):
+    return websocket_frame(json.dumps(message, separators=(',', ':')).encode())
+
+
+class Subscriber:
+    """One WebSocket client and its queue of encoded frames"""
+
+    __slots__ = ('writer', 'queue', 'address')
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.queue = asyncio.Queue(CLIENT_QUEUE)
+        self.address = writer.get_extra_info('peername')
+
+
+class LiveStatsServer:
+    """HTTP/WebSocket endpoint publishing one analyzer's live statistics"""
+
+    def __init__(self, analyzer, host=DEFAULT_HOST, port=DEFAULT_PORT, interval=DEFAULT_INTERVAL):
+        self.analyzer = analyzer
+        self.host = host
+        self.port = port
+        self.interval = interval
+
+        self.loop = None
+        self.thread = None
+        self.stopping = None
+        self.ready = threading.Event()
+        self.updated = threading.Condition()
+        self.error = None
+
+        self.connections = {}  # Handler task -> stream writer
+        self.subscribers = set()
+        self.sequence = 0
+        self.snapshot = {}
+        self.snapshot_frame = None
+        self.threats = deque(maxlen=THREAT_BACKLOG)
+        self.threat_cursor = None
+        self.metrics = {
+            'ticks': 0,
+            'tick_seconds': 0.0,
+            'http_requests': 0,
+            'websocket_connections': 0,
+            'messages_sent': 0,
+            'resyncs': 0,
+            'errors': 0
+        }
+
+    def start(self):
+        """Start serving on a background thread; raises OSError if the port is taken"""
+        self.thread = threading.Thread(target=self._run, name='stats-server', daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+        print(f"[+] Live statistics on http://{self.host}:{self.port}/stats "
+              f"and ws://{self.host}:{self.port}/live")
+
+    def stop(self):
+        """Close every connection and stop the event loop"""
+        if self.thread is None:
+            return
+        if self.loop is not None and self.stopping is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        self.thread.join()
+        self.thread = None
+
+    def wait_for_update(self, timeout=None):
+        """Block until the next publish; returns the latest statistics"""
+        with self.updated:
+            self.updated.wait(timeout)
+        return self.snapshot
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._serve())
+        finally:
+            self.loop.close()
+
+    async def _serve(self):
+        try:
+            server = await asyncio.start_server(self._handle, self.host, self.port)
+        except OSError as e:
+            self.error = e
+            self.ready.set()
+            return
+
+        self.port = server.sockets[0].getsockname()[1]
+        self.stopping = asyncio.Event()
+        self.ready.set()
+
+        publisher = asyncio.create_task(self._publish())
+        async with server:
+            await self.stopping.wait()
+        publisher.cancel()
+        # Closing the transports ends every handler through its own error path
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(publisher, *self.connections, return_exceptions=True)
+
+    async def _publish(self):
+        """Single producer: snapshot, diff and fan out once per interval"""
+        while True:
+            started = time.perf_counter()
+            try:
+                self._tick()
+            except Exception as e:
+                self.metrics['errors'] += 1
+                print(f"[-] Live statistics update failed: {e}")
+            self.metrics['ticks'] += 1
+            self.metrics['tick_seconds'] += time.perf_counter() - started
+            await asyncio.sleep(self.interval)
+
+    def _tick(self):
+        statistics = self.analyzer.get_statistics()
+        cursor, threats = self.analyzer.get_new_threats(self.threat_cursor, THREATS_PER_TICK)
+        self.threat_cursor = cursor
+        self.threats.extend(threats)
+
+        delta = stats_delta(self.snapshot, statistics)
+        self.sequence += 1
+        self.snapshot = statistics
+        self.snapshot_frame = None
+        with self.updated:
+            self.updated.notify_all()
+
+        if not self.subscribers:
+            return
+        frames = []
+        if delta:
+            frames.append(encode_message({'type': 'delta', 'seq': self.sequence, 'data': delta}))
+        if threats:
+            frames.append(encode_message({'type': 'threats', 'seq': self.sequence, 'events': threats}))
+        for subscriber in self.subscribers:
+            for frame in frames:
+                self._deliver(subscriber, frame)
+
+    def _snapshot_message(self):
+        # Encoded at most once per tick, however many clients (re)subscribe
+        if self.snapshot_frame is None:
+            self.snapshot_frame = encode_message({
+                'type': 'snapshot',
+                'seq': self.sequence,
+                'data': self.snapshot
+            })
+        return self.snapshot_frame
+
+    def _deliver(self, subscriber, frame):
+        try:
+            subscriber.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Deltas only make sense in order: replace the backlog with a snapshot
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+            subscriber.queue.put_nowait(self._snapshot_message())
+            self.metrics['resyncs'] += 1
+
+    async def _handle(self, reader, writer):
+        """Serve one connection: a plain HTTP request or a WebSocket upgrade"""
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            await self._serve_connection(reader, writer)
+        finally:
+            del self.connections[task]
+            writer.close()
+
+    async def _serve_connection(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            return
+        if len(request) > MAX_HEADER_BYTES:
+            return
+
+        lines = request.decode('latin-1').split('\r\n')
+        try:
+            method, target, _version = lines[0].split(' ', 2)
+        except ValueError:
+            await self._respond(writer, 400, {'error': 'Malformed request line'})
+            return
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if name:
+                headers[name.strip().lower()] = value.strip()
+
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.metrics['http_requests'] += 1
+
+        try:
+            if method != 'GET':
+                await self._respond(writer, 405, {'error': 'Only GET is supported'})
+            elif url.path == '/live':
+                if headers.get('upgrade', '').lower() != 'websocket' or 'sec-websocket-key' not in headers:
+                    await self._respond(writer, 400, {'error': 'WebSocket upgrade required'})
+                else:
+                    await self._websocket(reader, writer, headers['sec-websocket-key'])
+            else:
+                status, body = self._route(url.path, query)
+                await self._respond(writer, status, body)
+        except ConnectionError:
+            pass
+        except Exception as e:
+            self.metrics['errors'] += 1
+            print(f"[-] Stats server error: {e}")
+
+    def _route(self, path, query):
+        try:
+            count = min(int(query.get('count', 50)), MAX_COUNT)
+        except ValueError:
+            return 400, {'error': 'count must be an integer'}
+
+        if path == '/stats':
+            statistics = dict(self.snapshot or self.analyzer.get_statistics())
+            statistics['server'] = self.server_snapshot()
+            return 200, {'success': True, 'data': statistics}
+        if path == '/packets':
+            return 200, {'success': True, 'packets': self.analyzer.get_recent_packets(count)}
+        if path == '/flows':
+            return 200, {'success': True, 'flows': self.analyzer.get_top_flows(count)}
+        if path == '/threats':
+            threats = list(self.threats)[-count:]
+            return 200, {'success': True, 'threats': threats}
+        if path == '/metrics':
+            return 200, format_prometheus(self.snapshot or self.analyzer.get_statistics())
+        return 404, {'error': f'Unknown endpoint {path}'}
+
+    async def _respond(self, writer, status, body):
+        # Text bodies are metrics; everything else is JSON
+        if isinstance(body, str):
+            payload = body.encode()
+            content_type = PROMETHEUS_CONTENT_TYPE
+        else:
+            payload = json.dumps(body, separators=(',', ':')).encode()
+            content_type = 'application/json'
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Cache-Control: no-store\r\n"
+                f"Connection: close\r\n\r\n")
+        writer.write(head.encode() + payload)
+        await writer.drain()
+
+    async def _websocket(self, reader, writer, key):
+        """RFC 6455 handshake, then pump queued frames until the client leaves"""
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WEBSOCKET_GUID).digest()).decode()
+        writer.write((f"HTTP/1.1 101 Switching Protocols\r\n"
+                      f"Upgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+
+        subscriber = Subscriber(writer)
+        if not self.snapshot:
+            self.snapshot = self.analyzer.get_statistics()
+        subscriber.queue.put_nowait(self._snapshot_message())
+        self.subscribers.add(subscriber)
+        self.metrics['websocket_connections'] += 1
+
+        sender = asyncio.create_task(self._send_frames(subscriber))
+        try:
+            await self._read_frames(reader, subscriber)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # Client went away without a close frame
+        finally:
+            self.subscribers.discard(subscriber)
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+
+    async def _send_frames(self, subscriber):
+        writer = subscriber.writer
+        while True:
+            frame = await subscriber.queue.get()
+            writer.write(frame)
+            await writer.drain()
+            self.metrics['messages_sent'] += 1
+
+    async def _read_frames(self, reader, subscriber):
+        """Handle control frames; data frames from clients are ignored"""
+        while True:
+            header = await reader.readexactly(2)
+            opcode = header[0] & 0x0F
+            length = header[1] & 0x7F
+            if length == 126:
+                length = struct.unpack('!H', await reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', await reader.readexactly(8))[0]
+            if length > MAX_CLIENT_FRAME:
+                return
+            mask = await reader.readexactly(4) if header[1] & 0x80 else b'\0\0\0\0'
+            data = bytes(b ^ mask[i & 3] for i, b in enumerate(await reader.readexactly(length)))
+
+            if opcode == OP_CLOSE:
+                subscriber.writer.write(websocket_frame(data[:2], OP_CLOSE))
+                await subscriber.writer.drain()
+                return
+            if opcode == OP_PING:
+                self._deliver(subscriber, websocket_frame(data, OP_PONG))
+
+    def server_snapshot(self):
+        """Server-side counters"""
+        snapshot = dict(self.metrics)
+        snapshot['subscribers'] = len(self.subscribers)
+        snapshot['interval'] = self.interval
+        return snapshot
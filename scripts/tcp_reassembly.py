@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+TCP Reassembly - Per-direction in-order byte streams from TCP segments
+Out-of-order buffering under per-stream and global byte budgets
+
+Each direction of a TCP connection is one stream, keyed by the flow key
+plus a direction bit. Segments at the expected sequence number are passed
+straight through (zero-copy); later segments are buffered until the hole
+before them fills. Retransmitted bytes are dropped, partially overlapping
+segments are trimmed. When a stream's out-of-order buffer exceeds its
+budget, or the global budget is exhausted, the stream skips the hole and
+resynchronises, reporting a gap so matchers can discard their context.
+Streams are kept in LRU order and expire when idle or on RST; after a FIN
+they linger until idle so late retransmissions are still recognised.
+"""
+
+from collections import OrderedDict
+
+SEQ_MASK = 0xFFFFFFFF
+TCP_SYN = 2
+TCP_RST = 4
+# A SYN this far behind the stream is a retransmission, not port reuse
+SYN_RETRANSMIT_RANGE = 1 << 24
+
+DEFAULT_STREAM_BUDGET = 256 * 1024
+DEFAULT_GLOBAL_BUDGET = 64 * 1024 * 1024
+DEFAULT_MAX_STREAMS = 131072
+DEFAULT_IDLE_TIMEOUT = 60
+
+# Marker in the chunk list for bytes that will never arrive
+GAP = None
+
+
+def seq_diff(a, b):
+    """Signed distance from sequence number b to a, modulo 2**32"""
+    return ((a - b + 0x80000000) & SEQ_MASK) - 0x80000000
+
+
+class TcpStream:
+    """Reassembly state for one direction of a TCP connection"""
+
+    __slots__ = ('next_seq', 'segments', 'buffered', 'last_seen', 'match_state')
+
+    def __init__(self, next_seq, now):
+        self.next_seq = next_seq
+        self.segments = {}       # sequence number -> bytes, beyond next_seq
+        self.buffered = 0
+        self.last_seen = now
+        self.match_state = None  # Owned by the stream consumer
+
+
+class TcpReassembler:
+    """Bounded TCP stream reassembly for every tracked connection"""
+
+    def __init__(self, stream_budget=DEFAULT_STREAM_BUDGET, global_budget=DEFAULT_GLOBAL_BUDGET,
+                 max_streams=DEFAULT_MAX_STREAMS, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.stream_budget = stream_budget
+        self.global_budget = global_budget
+        self.max_streams = max_streams
+        self.idle_timeout = idle_timeout
+        self.streams = OrderedDict()
+        self.buffered = 0
+        self.next_sweep = 0
+        self.counters = {
+            'segments': 0,
+            'in_order': 0,
+            'out_of_order': 0,
+            'retransmitted': 0,
+            'trimmed': 0,
+            'gaps': 0,
+            'skipped': 0,
+            'streams_created': 0,
+            'streams_evicted': 0
+        }
+
+    def feed(self, key, packet):
+        """Add one TCP segment of stream ``key``
+
+        Returns ``(stream, chunks)``; ``chunks`` lists the newly contiguous
+        payload pieces in order, with ``GAP`` where bytes were skipped.
+        """
+        now = packet.timestamp
+        if now >= self.next_sweep:
+            self.expire(now)
+            self.next_sweep = now + 1
+
+        counters = self.counters
+        flags = packet.tcp_flags
+        seq = packet.tcp_seq
+        if flags & TCP_SYN:
+            seq = (seq + 1) & SEQ_MASK  # The SYN itself takes one sequence number
+        payload = packet.payload
+        streams = self.streams
+        stream = streams.get(key)
+
+        chunks = []
+        if stream is None:
+            if len(streams) >= self.max_streams:
+                self._drop(next(iter(streams)))
+                counters['streams_evicted'] += 1
+            # Mid-stream pickup starts at the first segment seen
+            stream = TcpStream(seq, now)
+            streams[key] = stream
+            counters['streams_created'] += 1
+        else:
+            streams.move_to_end(key)
+            stream.last_seen = now
+            if flags & TCP_SYN and not 0 <= seq_diff(stream.next_seq, seq) < SYN_RETRANSMIT_RANGE:
+                # Not a retransmitted SYN: a new connection reusing the ports
+                self._drop_segments(stream)
+                stream.next_seq = seq
+                chunks.append(GAP)
+
+        if payload:
+            counters['segments'] += 1
+            self._add_segment(stream, seq, payload, chunks)
+
+        if flags & TCP_RST:
+            self._drop(key)
+        return stream, chunks
+
+    def skip(self, key, packet):
+        """Pass over a segment of stream ``key`` without its payload
+
+        Used when inspection is shed: the stream resumes after the segment
+        instead of waiting for bytes that will never be fed. Returns the
+        stream when bytes were skipped, otherwise None.
+        """
+        stream = self.streams.get(key)
+        if stream is None:
+            return None
+        if packet.tcp_flags & TCP_RST:
+            self._drop(key)
+            return None
+        seq = packet.tcp_seq
+        if packet.tcp_flags & TCP_SYN:
+            seq = (seq + 1) & SEQ_MASK
+        end = (seq + len(packet.payload)) & SEQ_MASK
+        stream.last_seen = packet.timestamp
+        if seq_diff(end, stream.next_seq) <= 0:
+            return None
+        self._drop_segments(stream)
+        stream.next_seq = end
+        self.counters['skipped'] += 1
+        return stream
+
+    def _add_segment(self, stream, seq, payload, chunks):
+        counters = self.counters
+        distance = seq_diff(seq, stream.next_seq)
+
+        if distance + len(payload) <= 0:
+            counters['retransmitted'] += 1
+            return
+        if distance < 0:
+            # Overlaps bytes already delivered
+            payload = payload[-distance:]
+            seq = stream.next_seq
+            distance = 0
+            counters['trimmed'] += 1
+
+        if distance > 0:
+            counters['out_of_order'] += 1
+            size = len(payload)
+            while stream.buffered + size > self.stream_budget or self.buffered + size > self.global_budget:
+                # Out of budget: give up on the hole before the nearest data
+                counters['gaps'] += 1
+                chunks.append(GAP)
+                nearest = min(stream.segments, key=lambda s: seq_diff(s, stream.next_seq), default=seq)
+                if seq_diff(seq, nearest) <= 0:
+                    stream.next_seq = seq
+                    break
+                stream.next_seq = nearest
+                self._drain(stream, chunks)
+                distance = seq_diff(seq, stream.next_seq)
+                if distance + size <= 0:
+                    return
+                if distance < 0:
+                    payload = payload[-distance:]
+                    seq = stream.next_seq
+                    size = len(payload)
+                if distance <= 0:
+                    break
+            else:
+                self._buffer(stream, seq, payload)
+                return
+
+        counters['in_order'] += 1
+        chunks.append(payload)
+        stream.next_seq = (seq + len(payload)) & SEQ_MASK
+        if stream.segments:
+            self._drain(stream, chunks)
+
+    def _buffer(self, stream, seq, payload):
+        existing = stream.segments.get(seq)
+        if existing is not None:
+            if len(existing) >= len(payload):
+                return
+            self._release(stream, len(existing))
+        stream.segments[seq] = bytes(payload)
+        stream.buffered += len(payload)
+        self.buffered += len(payload)
+
+    def _drop_segments(self, stream):
+        self.buffered -= stream.buffered
+        stream.buffered = 0
+        stream.segments = {}
+
+    def _release(self, stream, size):
+        stream.buffered -= size
+        self.buffered -= size
+
+    def _drain(self, stream, chunks):
+        """Move buffered segments that are now contiguous onto ``chunks``"""
+        segments = stream.segments
+        progress = True
+        while segments and progress:
+            progress = False
+            for seq in list(segments):
+                distance = seq_diff(seq, stream.next_seq)
+                if distance > 0:
+                    continue
+                data = segments.pop(seq)
+                self._release(stream, len(data))
+                if distance + len(data) <= 0:
+                    continue  # Fully covered by what was delivered
+                if distance < 0:
+                    data = data[-distance:]
+                chunks.append(data)
+                stream.next_seq = (stream.next_seq + len(data)) & SEQ_MASK
+                progress = True
+
+    def expire(self, now):
+        """Drop streams idle for longer than the timeout"""
+        streams = self.streams
+        while streams:
+            key, stream = next(iter(streams.items()))
+            if now - stream.last_seen < self.idle_timeout:
+                break
+            self._drop(key)
+
+    def _drop(self, key):
+        stream = self.streams.pop(key)
+        self.buffered -= stream.buffered
+
+    def snapshot(self):
+        """Mergeable reassembly counters"""
+        snapshot = dict(self.counters)
+        snapshot['streams'] = len(self.streams)
+        snapshot['buffered_bytes'] = self.buffered
+        return snapshot
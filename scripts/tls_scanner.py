@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+TLS Scanner - Protocol, cipher suite and certificate assessment
+Parallel handshakes per endpoint with results cached per (host, port)
+
+An endpoint is first probed with one handshake offering every protocol
+version and cipher the local OpenSSL supports; a failure means the port
+does not speak TLS. The handshake yields the certificate chain, and its
+session is offered on a second handshake to test session resumption.
+
+Each version from TLS 1.0 to 1.2 is enumerated by elimination. The
+cipher list is split into groups, each group is offered, the cipher the
+server picks is removed and the group is offered again until the server
+refuses. Groups for all versions run at the same time, so an endpoint
+costs about one handshake per supported cipher plus one per group,
+spread over ``max_handshakes`` connections. The ssl module cannot
+restrict TLS 1.3 suites, so TLS 1.3 reports only the suite the server
+negotiates. SSLv3 is not compiled into current OpenSSL builds and is not
+tested.
+
+Handshakes run over memory BIOs on non-blocking sockets. This needs no
+stream transport and allows a session to be offered for resumption.
+Certificates are decoded with a small DER reader, so the module needs
+only the standard library.
+"""
+
+import asyncio
+import hashlib
+import ipaddress
+import socket
+import ssl
+from datetime import datetime, timezone
+
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_HANDSHAKES = 16
+CIPHER_GROUPS = 4  # Elimination chains per protocol version
+EXPIRY_WARNING_DAYS = 30
+
+PROTOCOL_VERSIONS = [
+    ('TLSv1.0', ssl.TLSVersion.TLSv1),
+    ('TLSv1.1', ssl.TLSVersion.TLSv1_1),
+    ('TLSv1.2', ssl.TLSVersion.TLSv1_2),
+    ('TLSv1.3', ssl.TLSVersion.TLSv1_3)
+]
+WEAK_PROTOCOLS = {'TLSv1.0', 'TLSv1.1'}
+WEAK_CIPHER_MARKERS = ('NULL', 'EXP', 'RC4', 'DES', 'MD5', 'ADH', 'AECDH')
+ALL_CIPHERS = 'ALL:COMPLEMENTOFALL:@SECLEVEL=0'
+
+NAME_ATTRIBUTES = {
+    '2.5.4.3': 'CN',
+    '2.5.4.6': 'C',
+    '2.5.4.7': 'L',
+    '2.5.4.8': 'ST',
+    '2.5.4.10': 'O',
+    '2.5.4.11': 'OU'
+}
+SIGNATURE_ALGORITHMS = {
+    '1.2.840.113549.1.1.4': 'md5WithRSAEncryption',
+    '1.2.840.113549.1.1.5': 'sha1WithRSAEncryption',
+    '1.2.840.113549.1.1.10': 'rsassaPss',
+    '1.2.840.113549.1.1.11': 'sha256WithRSAEncryption',
+    '1.2.840.113549.1.1.12': 'sha384WithRSAEncryption',
+    '1.2.840.113549.1.1.13': 'sha512WithRSAEncryption',
+    '1.2.840.10045.4.1': 'ecdsa-with-SHA1',
+    '1.2.840.10045.4.3.2': 'ecdsa-with-SHA256',
+    '1.2.840.10045.4.3.3': 'ecdsa-with-SHA384',
+    '1.2.840.10045.4.3.4': 'ecdsa-with-SHA512',
+    '1.3.101.112': 'Ed25519',
+    '1.3.101.113': 'Ed448'
+}
+
+
+def weak_cipher(name):
+    return any(marker in name for marker in WEAK_CIPHER_MARKERS)
+
+
+def der_element(data, offset):
+    """Tag, content start and content end of the DER element at ``offset``"""
+    tag = data[offset]
+    length = data[offset + 1]
+    start = offset + 2
+    if length & 0x80:
+        count = length & 0x7f
+        length = int.from_bytes(data[start:start + count], 'big')
+        start += count
+    return tag, start, start + length
+
+
+def der_children(data, start, end):
+    while start < end:
+        tag, content, next_offset = der_element(data, start)
+        yield tag, content, next_offset
+        start = next_offset
+
+
+def decode_oid(value):
+    first = value[0]
+    parts = [first // 40 if first < 80 else 2, first % 40 if first < 80 else first - 80]
+    number = 0
+    for byte in value[1:]:
+        number = (number << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            parts.append(number)
+            number = 0
+    return '.'.join(map(str, parts))
+
+
+def decode_name(data, start, end):
+    """RFC 4514-style string of an X.501 Name"""
+    attributes = []
+    for _tag, set_start, set_end in der_children(data, start, end):
+        for _tag, seq_start, seq_end in der_children(data, set_start, set_end):
+            (_, oid_start, oid_end), (tag, value_start, value_end) = list(der_children(data, seq_start, seq_end))[:2]
+            value = data[value_start:value_end]
+            text = value.decode('utf-16-be' if tag == 0x1e else 'utf-8', errors='replace')
+            oid = decode_oid(data[oid_start:oid_end])
+            attributes.append(f"{NAME_ATTRIBUTES.get(oid, oid)}={text}")
+    return ', '.join(attributes)
+
+
+def decode_time(tag, value):
+    text = value.decode('ascii').rstrip('Z')
+    if tag == 0x17:  # UTCTime has a two-digit year
+        year = int(text[:2])
+        text = str(1900 + year if year >= 50 else 2000 + year) + text[2:]
+    return datetime.strptime(text[:14], '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc)
+
+
+def parse_certificate(der, now=None):
+    """Subject, issuer, validity and signature algorithm of a DER certificate"""
+    now = now or datetime.now(timezone.utc)
+    _, cert_start, cert_end = der_element(der, 0)
+    (_, tbs_start, tbs_end), (_, alg_start, alg_end) = list(der_children(der, cert_start, cert_end))[:2]
+    fields = list(der_children(der, tbs_start, tbs_end))
+    if fields[0][0] == 0xa0:
+        fields = fields[1:]  # Explicit version
+    serial, _algorithm, issuer, validity, subject = fields[:5]
+
+    _, oid_start, oid_end = der_element(der, alg_start)
+    signature_oid = decode_oid(der[oid_start:oid_end])
+    (before_tag, before_start, before_end), (after_tag, after_start, after_end) = \
+        list(der_children(der, validity[1], validity[2]))[:2]
+    not_before = decode_time(before_tag, der[before_start:before_end])
+    not_after = decode_time(after_tag, der[after_start:after_end])
+
+    subject_name = decode_name(der, subject[1], subject[2])
+    issuer_name = decode_name(der, issuer[1], issuer[2])
+    return {
+        "subject": subject_name,
+        "issuer": issuer_name,
+        "serial": der[serial[1]:serial[2]].hex(),
+        "not_before": not_before.isoformat(),
+        "not_after": not_after.isoformat(),
+        "days_left": (not_after - now).days,
+        "expired": not_after < now,
+        "not_yet_valid": not_before > now,
+        "self_signed": subject_name == issuer_name,
+        "signature_algorithm": SIGNATURE_ALGORITHMS.get(signature_oid, signature_oid),
+        "sha256": hashlib.sha256(der).hexdigest()
+    }
+
+
+def refresh_validity(result, now=None):
+    """Recompute the expiry fields of a stored assessment's certificates"""
+    now = now or datetime.now(timezone.utc)
+    for cert in result.get("chain") or ():
+        if "not_after" not in cert:
+            continue
+        not_before = datetime.fromisoformat(cert["not_before"])
+        not_after = datetime.fromisoformat(cert["not_after"])
+        cert.update(days_left=(not_after - now).days, expired=not_after < now, not_yet_valid=not_before > now)
+    if result.get("chain"):
+        result["certificate"] = result["chain"][0]
+    return result
+
+
+def protocol_context(version=None, ciphers=None):
+    """Unverified client context pinned to ``version`` and offering ``ciphers``"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    context.set_ciphers(':'.join(ciphers) + ':@SECLEVEL=0' if ciphers else ALL_CIPHERS)
+    context.minimum_version = version or ssl.TLSVersion.TLSv1
+    context.maximum_version = version or ssl.TLSVersion.TLSv1_3
+    return context
+
+
+def cipher_suites():
+    """TLS 1.2 and older suites the local OpenSSL can offer, by protocol version"""
+    context = protocol_context()
+    suites = {name: [] for name, _version in PROTOCOL_VERSIONS[:3]}
+    for cipher in context.get_ciphers():
+        name = cipher['name']
+        if cipher['protocol'] == 'TLSv1.3' or 'PSK' in name or 'SRP' in name:
+            continue  # No PSK or SRP credentials to offer
+        for version in suites:
+            if version == 'TLSv1.2' or cipher['protocol'] in ('SSLv3', 'TLSv1.0'):
+                suites[version].append(name)
+    return suites
+
+
+def is_address(host):
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+class TLSScanner:
+    """TLS endpoint assessments, each run once per (host, port)"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_handshakes=DEFAULT_HANDSHAKES):
+        self.timeout = timeout
+        self.max_handshakes = max_handshakes
+        self.suites = cipher_suites()
+        self.results = {}
+        self.in_flight = {}     # (host, port) -> task of an assessment still running
+        self.counters = {
+            'handshakes': 0,
+            'failed': 0,
+            'cached': 0
+        }
+
+    async def handshake(self, address, host, context, session=None, read_tickets=False):
+        """Complete one handshake and return its SSLObject; raises OSError or ssl.SSLError"""
+        loop = asyncio.get_running_loop()
+        family, sockaddr = address
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        incoming, outgoing = ssl.MemoryBIO(), ssl.MemoryBIO()
+        tls = context.wrap_bio(incoming, outgoing, server_hostname=None if is_address(host) else host,
+                               session=session)
+        self.counters['handshakes'] += 1
+        try:
+            started = loop.time()
+            await loop.sock_connect(sock, sockaddr)
+            while True:
+                try:
+                    tls.do_handshake()
+                    break
+                except ssl.SSLWantReadError:
+                    pending = outgoing.read()
+                    if pending:
+                        await loop.sock_sendall(sock, pending)
+                    data = await loop.sock_recv(sock, 16384)
+                    if not data:
+                        raise ConnectionResetError("Connection closed during handshake")
+                    incoming.write(data)
+            pending = outgoing.read()
+            if pending:
+                await loop.sock_sendall(sock, pending)
+            if read_tickets and tls.version() == 'TLSv1.3':
+                # TLS 1.3 tickets follow the handshake; wait about one round trip
+                wait = max(2 * (loop.time() - started), 0.05)
+                try:
+                    data = await asyncio.wait_for(loop.sock_recv(sock, 16384), wait)
+                    incoming.write(data)
+                    tls.read()
+                except (asyncio.TimeoutError, ssl.SSLWantReadError, ssl.SSLZeroReturnError):
+                    pass
+            return tls
+        except BaseException:
+            self.counters['failed'] += 1
+            raise
+        finally:
+            sock.close()
+
+    async def try_handshake(self, address, host, context, slots, **kwargs):
+        """Handshake under the endpoint's concurrency limit; None if it fails"""
+        async with slots:
+            try:
+                return await asyncio.wait_for(self.handshake(address, host, context, **kwargs), self.timeout)
+            except (OSError, ssl.SSLError, ValueError, asyncio.TimeoutError):
+                return None
+
+    async def accepted_ciphers(self, address, host, version, ciphers, slots):
+        """Ciphers of one group the server accepts, found by elimination"""
+        accepted = []
+        remaining = list(ciphers)
+        while remaining:
+            tls = await self.try_handshake(address, host, protocol_context(version, remaining), slots)
+            if tls is None:
+                break
+            name = tls.cipher()[0]
+            if name not in remaining:
+                break
+            accepted.append(name)
+            remaining.remove(name)
+        return accepted
+
+    async def enumerate_version(self, address, host, name, version, slots):
+        """Accepted cipher suites of one protocol version (empty if unsupported)"""
+        if version == ssl.TLSVersion.TLSv1_3:
+            tls = await self.try_handshake(address, host, protocol_context(version), slots)
+            return [tls.cipher()[0]] if tls is not None else []
+        ciphers = self.suites[name]
+        groups = [ciphers[i::CIPHER_GROUPS] for i in range(CIPHER_GROUPS)]
+        accepted = await asyncio.gather(*(self.accepted_ciphers(address, host, version, group, slots)
+                                          for group in groups if group))
+        found = {cipher for group in accepted for cipher in group}
+        return [cipher for cipher in ciphers if cipher in found]
+
+    async def verify(self, address, host, slots):
+        """Whether the chain verifies against the system trust store, and why not"""
+        context = ssl.create_default_context()
+        context.check_hostname = not is_address(host)
+        async with slots:
+            try:
+                await asyncio.wait_for(self.handshake(address, host, context), self.timeout)
+            except ssl.SSLCertVerificationError as e:
+                return False, e.verify_message
+            except (OSError, ssl.SSLError, ValueError, asyncio.TimeoutError):
+                return None, None
+        return True, None
+
+    async def assess(self, host, port):
+        """Protocols, cipher suites, certificates and resumption of ``host:port``
+
+        Results are cached, and concurrent calls for the same endpoint wait
+        for the one assessment already running; the record has
+        ``"tls": False`` for ports that do not complete a handshake.
+        """
+        key = (host, port)
+        if key in self.results:
+            self.counters['cached'] += 1
+            return self.results[key]
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.run_assessment(host, port))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _task: self.in_flight.pop(key, None))
+        else:
+            self.counters['cached'] += 1
+        # Shielded so that one cancelled caller does not cancel the others
+        return await asyncio.shield(task)
+
+    async def run_assessment(self, host, port):
+        """Run the handshakes behind ``assess`` and cache the record"""
+        key = (host, port)
+        result = {"host": host, "port": port, "tls": False}
+        loop = asyncio.get_running_loop()
+        try:
+            family, _type, _proto, _name, sockaddr = (await loop.getaddrinfo(host, port,
+                                                                             type=socket.SOCK_STREAM))[0]
+        except OSError:
+            self.results[key] = result
+            return result
+        address = (family, sockaddr)
+        slots = asyncio.Semaphore(self.max_handshakes)
+
+        context = protocol_context()
+        tls = await self.try_handshake(address, host, context, slots, read_tickets=True)
+        if tls is None:
+            self.results[key] = result
+            return result
+
+        chain = getattr(tls, 'get_unverified_chain', None)  # Python 3.13+
+        chain = chain() if chain is not None else [tls.getpeercert(binary_form=True)]
+        certificates = []
+        for der in chain or ():
+            try:
+                certificates.append(parse_certificate(der))
+            except (IndexError, ValueError):
+                certificates.append({"sha256": hashlib.sha256(der).hexdigest(), "error": "Unparseable certificate"})
+
+        async def resumption():
+            session = tls.session
+            if session is None:
+                return False
+            resumed = await self.try_handshake(address, host, context, slots, session=session)
+            return resumed is not None and resumed.session_reused
+
+        versions, resumed, (trusted, verify_error) = await asyncio.gather(
+            asyncio.gather(*(self.enumerate_version(address, host, name, version, slots)
+                             for name, version in PROTOCOL_VERSIONS)),
+            resumption(),
+            self.verify(address, host, slots))
+
+        result.update({
+            "tls": True,
+            "negotiated": {"protocol": tls.version(), "cipher": tls.cipher()[0]},
+            "protocols": {name: bool(ciphers) for (name, _version), ciphers in zip(PROTOCOL_VERSIONS, versions)},
+            "ciphers": {name: ciphers for (name, _version), ciphers in zip(PROTOCOL_VERSIONS, versions) if ciphers},
+            "weak_protocols": [name for (name, _version), ciphers in zip(PROTOCOL_VERSIONS, versions)
+                               if ciphers and name in WEAK_PROTOCOLS],
+            "weak_ciphers": sorted({cipher for ciphers in versions for cipher in ciphers if weak_cipher(cipher)}),
+            "session_resumption": resumed,
+            "trusted": trusted,
+            "verify_error": verify_error,
+            "certificate": certificates[0] if certificates else None,
+            "chain": certificates
+        })
+        self.results[key] = result
+        return result
+
+    async def assess_ports(self, host, ports):
+        """Assess several ports of a host at once; returns the records in port order"""
+        return await asyncio.gather(*(self.assess(host, port) for port in ports))